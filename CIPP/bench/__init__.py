@@ -0,0 +1,25 @@
+"""Benchmarks for the CIPP tools.
+
+This package has a deterministic generator of synthetic PTFs (in
+``bench.synthetic``), and a set of timed benchmarks of the CIPP
+functions which can be run from the CIPP directory like so::
+
+    python -m bench --sizes 1000,10000 -o this_commit.json
+
+The JSON file that is written can be given to ``--compare`` on a later
+run to see how the timings have changed.
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""Runs timed benchmarks of the CIPP functions on synthetic PTFs.
+
+Each benchmark is run --repeat times for each of the --sizes, and the
+best and mean wall-clock times are reported, along with how much memory
+(measured with tracemalloc, in one more run) the result of each one
+holds on to.  If -o is given, the results are written to that file as
+JSON, and a file written by an earlier run can be given to --compare to
+show the ratio of the new best times to the old.
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import orbit_count as oc
+import prioritize_by_orbit as pbo
+import priority_rewrite as pr
+import ptf
+import tos_success as tos
+from bench import synthetic
+
+half_widths = ((17000, 40), (14600, 30), (13000, 20), (10000, 15), (0, 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m bench", description=__doc__
+    )
+    parser.add_argument(
+        "-s", "--sizes", default="1000,10000,100000",
+        help="Comma-separated numbers of records, default: %(default)s"
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3,
+        help="The number of times to run each benchmark, "
+             "default: %(default)s"
+    )
+    parser.add_argument(
+        "-b", "--bench", action="append", choices=benchmarks.keys(),
+        help="Only run this benchmark, may be given more than once."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o", "--output", help="Write the results as JSON to this file."
+    )
+    parser.add_argument(
+        "-c", "--compare",
+        help="A JSON file from an earlier run to compare the results to."
+    )
+
+    args = parser.parse_args()
+
+    # The tools log a lot at WARNING and INFO, which isn't being measured.
+    logging.disable(logging.CRITICAL)
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    names = args.bench if args.bench else list(benchmarks.keys())
+
+    results = run(names, sizes, args.repeat, args.seed)
+
+    previous = dict()
+    if args.compare is not None:
+        with open(args.compare) as f:
+            for r in json.load(f)["results"]:
+                previous[(r["name"], r["records"])] = r["best"]
+
+    print(format_results(results, previous))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"environment": environment(), "results": results},
+                f, indent=2
+            )
+            f.write("\n")
+
+
+def run(names: list, sizes: list, repeat=3, seed=0) -> list:
+    """Returns a list of dicts, one for each benchmark in *names* at each
+    of the *sizes*, with the best and mean times (in seconds) of *repeat*
+    runs, and the bytes still allocated by the result of one more,
+    untimed, run.
+    """
+    results = list()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in sizes:
+            path = os.path.join(tmpdir, f"synthetic_{n}.ptf")
+            synthetic.make_ptf(n, seed=seed).dump(path)
+            for name in names:
+                times = list()
+                for i in range(repeat):
+                    func = benchmarks[name](path)
+                    start = time.perf_counter()
+                    func()
+                    times.append(time.perf_counter() - start)
+
+                func = benchmarks[name](path)
+                tracemalloc.start()
+                result = func()
+                retained = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                del result
+
+                results.append({
+                    "name": name,
+                    "records": n,
+                    "best": min(times),
+                    "mean": statistics.mean(times),
+                    "retained": retained,
+                })
+    return results
+
+
+def format_results(results: list, previous=None) -> str:
+    """Returns a text table of *results*, with a column of the ratio to
+    the best times in *previous*, which is a dict keyed by (name, records),
+    if there are any.
+    """
+    lines = ["{:<20} {:>8} {:>10} {:>10} {:>10}".format(
+        "benchmark", "records", "best (s)", "mean (s)", "held (MB)"
+    )]
+    if previous:
+        lines[0] += " {:>8}".format("ratio")
+    for r in results:
+        line = "{name:<20} {records:>8} {best:>10.4f} {mean:>10.4f}".format(
+            **r
+        )
+        line += " {:>10.2f}".format(r.get("retained", 0) / 2**20)
+        old = previous.get((r["name"], r["records"])) if previous else None
+        if old:
+            line += " {:>8.2f}".format(r["best"] / old)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def environment() -> dict:
+    """Returns a dict describing where the benchmarks were run."""
+    env = {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        env["commit"] = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return env
+
+
+# Each of these is given the path to a synthetic PTF file, does any
+# set-up that shouldn't be timed, and returns the function to time.
+
+def bench_load(path):
+    return lambda: ptf.load(path)
+
+
+def bench_load_compact(path):
+    return lambda: ptf.load(path, compact=True)
+
+
+def bench_dumps(path):
+    p = ptf.load(path)
+    return p.dumps
+
+
+def bench_priority_rewrite(path):
+    p = ptf.load(path)
+    return lambda: pr.priority_rewrite(p)
+
+
+def bench_prioritize_by_orbit(path):
+    p = ptf.load(path)
+    return lambda: pbo.prioritize_by_orbit(p, list(half_widths))
+
+
+def bench_orbit_count(path):
+    p = ptf.load(path)
+    return lambda: oc.orbit_count(p)
+
+
+def bench_get_suggestions(path):
+    # Half of the suggestions are in the PTF.
+    wth = {str(100000 + i): "" for i in range(0, 2 * len(ptf.load(path)), 2)}
+    return lambda: tos.get_suggestions(path, wth)
+
+
+benchmarks = {
+    "load": bench_load,
+    "load_compact": bench_load_compact,
+    "dumps": bench_dumps,
+    "priority_rewrite": bench_priority_rewrite,
+    "prioritize_by_orbit": bench_prioritize_by_orbit,
+    "orbit_count": bench_orbit_count,
+    "get_suggestions": bench_get_suggestions,
+}
+
+
+if __name__ == "__main__":
+    sys.exit(main())
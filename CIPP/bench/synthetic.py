@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""Makes synthetic HiTList-like PTFs for testing and benchmarking.
+
+The same arguments (including the seed) always give the same PTF.
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import random
+
+import ptf
+
+# Two-tuples of a priority, and its relative weight.  These are loosely
+# based on a cycle's HiTList, with a lot of the 11000 special targets.
+priority_weights = ((16500, 1), (15000, 2), (14600, 2), (14005, 2),
+                    (13000, 3), (11000, 10), (10000, 5), (5000, 10),
+                    (799, 20), (2, 5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-r", "--records", type=int, default=1000,
+                        help="The number of records.")
+    parser.add_argument("--orbits", type=int, default=None,
+                        help="The number of orbits, default is a tenth of "
+                             "the number of records.")
+    parser.add_argument("--sporc", type=float, default=0.05,
+                        help="The fraction of records that are SPORC halves.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("output", help="The PTF file to write.")
+
+    args = parser.parse_args()
+
+    make_ptf(
+        args.records, orbits=args.orbits, sporc=args.sporc, seed=args.seed
+    ).dump(args.output)
+
+
+def make_records(
+    n: int,
+    orbits=None,
+    priorities=priority_weights,
+    sporc=0.05,
+    latitudes=(-85, 85),
+    first_orbit=59600,
+    seed=0,
+) -> list:
+    """Returns a list of *n* PTFDict records.
+
+    The records are spread at random over *orbits* consecutive orbits
+    (a tenth of *n* by default) starting at *first_orbit*, and their
+    Request Priority values are drawn from the *priorities* sequence of
+    (priority, weight) two-tuples.  Latitudes are uniformly distributed
+    between the two values of *latitudes*, and *sporc* is the fraction
+    of records which are made into SPORC pairs.
+    """
+    rnd = random.Random(seed)
+    if orbits is None:
+        orbits = max(1, n // 10)
+
+    pri_values = [p for p, w in priorities]
+    pri_weights = [w for p, w in priorities]
+
+    records = list()
+    for i in range(n):
+        orbit = first_orbit + rnd.randrange(orbits)
+        suffix = "a" if rnd.random() < 0.9 else "d"
+        alternatives = " ".join(
+            f"{orbit + 66 * k}{suffix}" for k in range(rnd.randrange(1, 6))
+        )
+        tdid = str(100000 + i)
+        lat = rnd.uniform(*latitudes)
+
+        r = ptf.PTFDict.fromkeys(ptf.fieldnames, "")
+        r.update({
+            "Instrument Set": "H",
+            "Predict Time": "2019-{:03}T{:02}:{:02}:{:02}.{:03}".format(
+                100 + (orbit - first_orbit) // 12, rnd.randrange(24),
+                rnd.randrange(60), rnd.randrange(60), rnd.randrange(1000)
+            ),
+            "Latitude": f"{lat:.3f}",
+            "Longitude": f"{rnd.uniform(0, 360):.3f}",
+            "Elevation": f"{rnd.uniform(-8, 8):.3f}",
+            "Observation Type": str(rnd.randrange(5)),
+            "Orbit Number": f"{orbit}{suffix}",
+            "Orbit Alternatives": alternatives,
+            "Observation Duration": "30.00",
+            "Setup Duration": "321.0",
+            "Sequence Filename": "N/A",
+            "Downlink Priority": "X",
+            "Comment": f"{tdid} Synthetic target at {lat:.1f}",
+            "Request Priority": str(
+                rnd.choices(pri_values, weights=pri_weights)[0]
+            ),
+            "Raw Data Volume": "0.000",
+            "Team Database ID": tdid,
+            "Request Category": "IO-REQ-CTX",
+            "Compression": "enable",
+            "Ancillary Data": "0",
+            "LsubS": "10.6",
+            "Roll Angle": f"{rnd.uniform(-25, 25):.3f}",
+        })
+        records.append(r)
+
+    # Pair up randomly chosen records into SPORCs.
+    chosen = rnd.sample(range(n), 2 * int(n * sporc / 2))
+    for k in range(0, len(chosen), 2):
+        a = records[chosen[k]]
+        b = records[chosen[k + 1]]
+        spnum = "SPORC{:03}".format(k // 2 % 1000)
+        a["Spare 4"] = f"{spnum}:{b['Team Database ID']} r=8 i=38"
+        b["Spare 4"] = f"{spnum}:{a['Team Database ID']} r=8 i=38"
+
+    return records
+
+
+def make_ptf(n: int, **kwargs) -> ptf.PTF:
+    """Returns a ptf.PTF with a plausible header and the records from
+    make_records(), to which *n* and any *kwargs* are passed.
+    """
+    header = dict.fromkeys(ptf.header_order, "")
+    header.update({
+        "FILE_TYPE": "HIRISE PTF",
+        "START_TIME": "2019-100T00:00:00.000",
+        "STOP_TIME": "2019-114T00:00:00.000",
+        "USERNAME": "synthetic",
+        "CREATION_DATE": "2019-099T00:00:00",
+        "SPK": list(),
+        "XZONE": None,
+    })
+    return ptf.PTF(
+        header,
+        "Synthetic PTF from bench.synthetic",
+        list(ptf.fieldnames),
+        make_records(n, **kwargs)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""This module has tests for the bench.synthetic functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import ptf
+from bench import synthetic
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_make_records(self):
+        records = synthetic.make_records(200, orbits=5, sporc=0.1)
+        self.assertEqual(200, len(records))
+        self.assertEqual(records, synthetic.make_records(200, orbits=5,
+                                                         sporc=0.1))
+        self.assertNotEqual(records, synthetic.make_records(200, orbits=5,
+                                                            sporc=0.1,
+                                                            seed=1))
+        self.assertEqual(5, len(set(r["Orbit Number"][:-1]
+                                    for r in records)))
+        self.assertEqual(20, sum(r["Spare 4"].startswith("SPORC")
+                                 for r in records))
+        for r in records:
+            self.assertLessEqual(-85, float(r["latitude"]))
+            self.assertGreaterEqual(85, float(r["latitude"]))
+
+        fixed = synthetic.make_records(10, priorities=((800, 1),),
+                                       latitudes=(10, 20))
+        self.assertEqual({"800"}, set(r["Request Priority"] for r in fixed))
+        for r in fixed:
+            self.assertTrue(10 <= float(r["Latitude"]) <= 20)
+
+    def test_make_ptf(self):
+        p = synthetic.make_ptf(50)
+        self.assertEqual(50, len(p))
+        self.assertEqual(list(p), list(ptf.loads(p.dumps())))
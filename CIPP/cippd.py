@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+"""Runs a CIPP session server, which keeps PTFs in memory, or sends it
+commands.
+
+Each of the CIPP programs starts Python, reads and parses the whole PTF
+it is given, changes a few priorities, and writes the whole thing out
+again.  A server started with:
+
+    cippd.py serve &
+
+keeps a workspace of named PTFs in memory, which can be worked on one
+step after another without any files being written in between:
+
+    cippd.py load hit HiTList.ptf
+    cippd.py special hit wth.txt hikers.txt
+    cippd.py prioritize hit -a -r
+    cippd.py rewrite hit
+    cippd.py count hit
+    cippd.py write hit -o HiTList_new.ptf
+
+These steps do the same things, in the same way, as the programs of
+the same names.  Also, if the CIPP_DAEMON environment variable is set
+to 1 (or to the path given to --socket), the special_priorities,
+prioritize_by_orbit, priority_rewrite, orbit_count, and ptf2csv
+programs just send their arguments to the server, which runs them, but
+only parses each file that they read once, for as long as it is the
+same file.
+
+The server only accepts connections from the user that started it, and
+stops with: cippd.py stop
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import traceback
+
+import cippd_client
+import orbit_count as oc
+import prioritize_by_orbit as pbo
+import priority_rewrite as pr
+import profiling
+import ptf
+import ptf2csv
+import ptf_cache
+import special_priorities as sp
+
+# The programs that the run command will run.
+programs = (
+    "special_priorities", "prioritize_by_orbit", "priority_rewrite",
+    "orbit_count", "ptf2csv",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-s", "--socket",
+        help="The path of the server's socket, the default is given by "
+             "CIPP_DAEMON, or else is in $XDG_RUNTIME_DIR or the temporary "
+             "directory."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("serve", help="Run the server.")
+    sub.add_parser("stop", help="Stop the server.")
+    sub.add_parser("list", help="List the PTFs in the workspace.")
+
+    p = sub.add_parser("load", help="Read a .ptf or .csv file into the "
+                                    "workspace.")
+    p.add_argument("name")
+    p.add_argument("path")
+
+    p = sub.add_parser("drop", help="Remove a PTF from the workspace.")
+    p.add_argument("name")
+
+    add_commands(sub)
+
+    args = parser.parse_args()
+
+    path = cippd_client.socket_path(args.socket)
+    if path is None:
+        path = cippd_client.default_socket()
+
+    if args.command == "serve":
+        return serve(path)
+
+    kwargs = vars(args)
+    del kwargs["socket"]
+    command = kwargs.pop("command")
+    try:
+        response = cippd_client.request(
+            command, path, cwd=os.getcwd(), **kwargs
+        )
+    except OSError as err:
+        print(f"Could not reach the server at {path}: {err}", file=sys.stderr)
+        return 1
+    return cippd_client.show(response)
+
+
+def add_commands(sub, name=True):
+    """Adds a parser for each of the commands that work on a PTF in the
+    workspace to the *sub* subparsers.  If *name* is False, they don't
+    take the name of the PTF as their first argument.
+    """
+    p = sub.add_parser("special", help="Like special_priorities.py")
+    if name:
+        p.add_argument("name")
+    p.add_argument("wth", nargs="+",
+                   help="File(s) with text copied from WTH list.")
+    p.add_argument("-v", "--verbose", action="store_true")
+
+    p = sub.add_parser("prioritize", help="Like prioritize_by_orbit.py")
+    if name:
+        p.add_argument("name")
+    p.add_argument("-a", "--high_alt", nargs="?", default=None, const=-1,
+                   type=int)
+    p.add_argument("-r", "--high_roll", nargs="?", default=None, const=8.8,
+                   type=float)
+    p.add_argument("--per_orbit", default=4, type=int)
+    p.add_argument("-w", "--half_widths", "--half-widths")
+    p.add_argument("--optimize", action="store_true")
+    p.add_argument("-j", "--jobs", default=1, type=int)
+    p.add_argument("-v", "--verbose", action="store_true")
+
+    p = sub.add_parser("rewrite", help="Like priority_rewrite.py")
+    if name:
+        p.add_argument("name")
+    p.add_argument("-r", "--reset")
+    p.add_argument("-k", "--keepzero", action="store_true")
+
+    p = sub.add_parser("count", help="Like orbit_count.py")
+    if name:
+        p.add_argument("name")
+    p.add_argument("-f", "--format", choices=("text", "json", "csv"),
+                   default="text")
+
+    p = sub.add_parser("csv", help="Like ptf2csv.py, but writes to "
+                                   "standard output if -o isn't given.")
+    if name:
+        p.add_argument("name")
+    p.add_argument("-l", "--links", action="store_true")
+    p.add_argument("-o", "--output")
+
+    p = sub.add_parser("write", help="Write out a PTF, to standard output "
+                                     "if -o isn't given.")
+    if name:
+        p.add_argument("name")
+    p.add_argument("-o", "--output")
+
+
+def serve(path: os.PathLike):
+    """Runs a Server at the socket *path* until it is stopped."""
+    if os.path.exists(path):
+        try:
+            with cippd_client.Connection(path, timeout=5):
+                pass
+        except OSError:
+            # Left behind by a server that didn't stop cleanly.
+            os.remove(path)
+        else:
+            print(f"A server is already running at {path}", file=sys.stderr)
+            return 1
+
+    # Each file that the programs read should only be parsed once.
+    if ptf_cache.memory is None:
+        ptf_cache.memory = dict()
+
+    with Server(path) as server:
+        print(f"Listening on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+    return 0
+
+
+class Workspace(object):
+    """Holds PTFs (or lists of records from CSV files) by name, and
+    has a method for each of the commands that work on them.
+
+    Each method prints what the program of the same name would, and
+    logs the same messages.
+    """
+
+    def __init__(self):
+        self.ptfs = dict()
+        self.paths = dict()
+
+    def __getitem__(self, name):
+        try:
+            return self.ptfs[name]
+        except KeyError:
+            raise ValueError(
+                f"There is nothing named {name!r} in the workspace."
+            ) from None
+
+    def _replace(self, name, records):
+        # A PTF's (or a list's) records are replaced in place.
+        self[name][:] = records
+
+    def list(self):
+        for name, seq in self.ptfs.items():
+            print(f"{name}: {len(seq)} records from {self.paths[name]}")
+
+    def load(self, name, path):
+        self.ptfs[name] = pr.get_input(path)
+        self.paths[name] = os.path.abspath(path)
+
+    def drop(self, name):
+        self[name]
+        del self.ptfs[name]
+        del self.paths[name]
+
+    def special(self, name, wth, verbose=False):
+        specials = dict()
+        for f in wth:
+            specials.update(sp.get_special_priorities(f))
+        self._replace(name, sp.apply_priorities(self[name], 11000, specials))
+
+    def prioritize(
+        self, name, high_alt=None, high_roll=None, per_orbit=4,
+        half_widths=None, optimize=False, jobs=1, verbose=False
+    ):
+        if half_widths is None:
+            table = ((17000, 40), (14600, 30), (13000, 20), (10000, 15),
+                     (0, 0))
+        else:
+            tables = pbo.parse_half_widths(half_widths)
+            if len(tables) != 1:
+                raise ValueError(f"{half_widths} has more than one table.")
+            table = next(iter(tables.values()))
+
+        records = pbo.prioritize_by_orbit(
+            self[name], table, per_orbit, high_alt=high_alt,
+            high_roll=high_roll, jobs=jobs, optimize=optimize
+        )
+        # This sorting ignores the 'a' or 'd' markers on Orbits.
+        records.sort(key=lambda x: int(x["Orbit Number"][:-1]))
+        self._replace(name, records)
+
+    def rewrite(self, name, reset=None, keepzero=False):
+        records = pr.priority_rewrite(self[name], reset, keepzero)
+        records.sort(key=lambda x: int(x["Request Priority"]), reverse=True)
+        self._replace(name, records)
+
+    def count(self, name, format="text"):
+        reports = oc.orbit_count(self[name])
+        if format == "json":
+            print(oc.format_json(reports))
+        elif format == "csv":
+            print(oc.format_csv(reports), end="")
+        else:
+            print("\n".join(oc.format_report(reports)))
+
+    def csv(self, name, links=False, output=None):
+        seq = self[name]
+        fieldnames = getattr(seq, "fieldnames", None)
+        if fieldnames is None:
+            fieldnames = seq[0].keys() if seq else list()
+        if output is None:
+            ptf2csv.write_csv(sys.stdout, fieldnames, seq, links)
+        else:
+            with open(output, "w") as csvfile:
+                ptf2csv.write_csv(csvfile, fieldnames, seq, links)
+
+    def write(self, name, output=None):
+        seq = self[name]
+        out_str = pr.write_output(seq, list(seq), output)
+        if out_str:
+            print(out_str)
+
+    def run(self, program, argv, profile=None):
+        """Runs the main() of the CIPP *program* with the *argv* command
+        line arguments, and returns its exit status.
+
+        If *profile* is given, it is the client's CIPP_PROFILE, which
+        the program sees instead of the server's.  If the program turns
+        profiling on, it is turned off again when the program is done,
+        and its report is printed to standard error, so that it goes
+        back to the client along with the program's own output.
+        """
+        if program not in programs:
+            raise ValueError(f"{program} is not one of: {', '.join(programs)}")
+        module = importlib.import_module(program)
+        sys.argv = [program + ".py"] + list(argv)
+        profiled = profiling.enabled
+        environ = os.environ.get("CIPP_PROFILE")
+        if profile is not None:
+            os.environ["CIPP_PROFILE"] = profile
+        # So that the program doesn't send its arguments back here.
+        cippd_client.in_server = True
+        try:
+            module.main()
+        except SystemExit as err:
+            if err.code is None or isinstance(err.code, int):
+                return err.code or 0
+            print(err.code, file=sys.stderr)
+            return 1
+        finally:
+            cippd_client.in_server = False
+            if not profiled:
+                profiling.stop()
+            if environ is None:
+                os.environ.pop("CIPP_PROFILE", None)
+            else:
+                os.environ["CIPP_PROFILE"] = environ
+        return 0
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Listens on the Unix socket *path* for requests, and carries them
+    out on its *workspace*, one at a time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: os.PathLike, workspace=None):
+        self.workspace = Workspace() if workspace is None else workspace
+        self.lock = threading.Lock()
+        # Only the user running the server can connect to it.
+        umask = os.umask(0o077)
+        try:
+            super().__init__(os.fspath(path), _Handler)
+        finally:
+            os.umask(umask)
+
+    def execute(self, request: dict) -> dict:
+        """Carries out the *request*, and returns the response."""
+        args = dict(request)
+        command = args.pop("command", None)
+        cwd = args.pop("cwd", None)
+        if command == "stop":
+            # Can't be called from the thread that serve_forever() is in.
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True, "stdout": "", "stderr": "", "status": 0}
+        method = getattr(self.workspace, str(command), None)
+        if command not in _commands or method is None:
+            return {"ok": False, "error": f"Unknown command: {command}"}
+        if command == "run" and args.get("program") not in programs:
+            return {
+                "ok": False,
+                "error": f"The program must be one of: {', '.join(programs)}"
+            }
+
+        with self.lock:
+            with _captured(
+                handler=(command != "run"), verbose=args.get("verbose")
+            ) as (out, err):
+                status = 0
+                error = None
+                old_cwd = os.getcwd()
+                try:
+                    if cwd is not None:
+                        os.chdir(cwd)
+                    status = method(**args) or 0
+                except Exception as exc:
+                    if command == "run":
+                        traceback.print_exc()
+                        status = 1
+                    else:
+                        error = str(exc) or type(exc).__name__
+                finally:
+                    os.chdir(old_cwd)
+
+        response = {
+            "ok": error is None,
+            "stdout": out.getvalue(),
+            "stderr": err.getvalue(),
+            "status": status if error is None else 1,
+        }
+        if error is not None:
+            response["error"] = error
+        return response
+
+
+_commands = (
+    "list", "load", "drop", "special", "prioritize", "rewrite", "count",
+    "csv", "write", "run",
+)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("not an object")
+            except ValueError as err:
+                response = {
+                    "ok": False, "error": f"The request isn't a JSON object: "
+                                          f"{err}"
+                }
+            else:
+                response = self.server.execute(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+@contextlib.contextmanager
+def _captured(handler=True, verbose=False):
+    # Sends standard output and error to two io.StringIO objects, and
+    # puts the logging configuration back the way it was afterwards,
+    # since the programs add their own handlers every time they run.
+    # If *handler* is True, log messages are formatted like the programs
+    # do, at the WARNING level (or INFO, if *verbose*).
+    loggers = [logging.getLogger()] + [
+        x for x in logging.Logger.manager.loggerDict.values()
+        if isinstance(x, logging.Logger)
+    ]
+    saved = [(x, list(x.handlers), x.level, x.disabled) for x in loggers]
+    saved_argv = sys.argv
+    out = io.StringIO()
+    err = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            if handler:
+                h = logging.StreamHandler(err)
+                h.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+                root = logging.getLogger()
+                root.addHandler(h)
+                root.setLevel(logging.INFO if verbose else logging.WARNING)
+            yield out, err
+    finally:
+        sys.argv = saved_argv
+        for x, handlers, level, disabled in saved:
+            x.handlers[:] = handlers
+            x.setLevel(level)
+            x.disabled = disabled
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""The client side of the cippd server.
+
+If the CIPP_DAEMON environment variable is set, the CIPP programs call
+forward() first thing, which sends their command line arguments to a
+running cippd server, prints what it sends back, and exits, rather than
+doing the work themselves.  CIPP_DAEMON may be set to 1 to use the
+default socket, or to the path of the socket that the server was
+started with.
+
+Messages are single lines of JSON, each request is a JSON object with
+a "command" and its arguments, and each response is a JSON object with
+"ok" (whether the command worked), "stdout" and "stderr" (the text the
+command printed), "status" (its exit status), and "error" (why it
+failed, if it did).
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# The server sets this, so that the programs it runs don't try to
+# forward their arguments back to it.
+in_server = False
+
+
+def default_socket() -> str:
+    """Returns the path of the socket that the server uses if no other
+    is given.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(base, f"cippd-{os.getuid()}.sock")
+
+
+def socket_path(value=None):
+    """Returns the path of the socket given by *value*, or by the
+    CIPP_DAEMON environment variable if *value* is None, or None if
+    that is not set.
+    """
+    if value is None:
+        value = os.environ.get("CIPP_DAEMON", "").strip()
+        if value.casefold() in ("", "0", "no", "off", "false"):
+            return None
+    if value.casefold() in ("1", "yes", "on", "true"):
+        return default_socket()
+    return os.path.expanduser(value)
+
+
+class Connection(object):
+    """A connection to a cippd server at the socket *path*, which sends
+    requests one at a time, and can be used as a context manager.
+    """
+
+    def __init__(self, path: os.PathLike, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.connect(os.fspath(path))
+        except OSError:
+            self.sock.close()
+            raise
+        self._file = self.sock.makefile("rwb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def request(self, command: str, /, **kwargs) -> dict:
+        """Sends the *command*, with *kwargs* as its arguments, and
+        returns the response.
+        """
+        kwargs["command"] = command
+        self._file.write(json.dumps(kwargs).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection.")
+        return json.loads(line)
+
+
+def request(command: str, path=None, /, **kwargs) -> dict:
+    """Sends a single *command* to the server at the socket *path* (or
+    the one from CIPP_DAEMON, or the default), and returns the response.
+    """
+    path = socket_path(path) or default_socket()
+    with Connection(path) as conn:
+        return conn.request(command, **kwargs)
+
+
+def show(response: dict) -> int:
+    """Prints the stdout and stderr of the *response*, and returns its
+    exit status.
+    """
+    sys.stdout.write(response.get("stdout", ""))
+    sys.stderr.write(response.get("stderr", ""))
+    if not response.get("ok", False):
+        print(f"cippd: {response.get('error')}", file=sys.stderr)
+        return response.get("status") or 1
+    return response.get("status", 0)
+
+
+def forward(program: str, argv=None):
+    """If the CIPP_DAEMON environment variable is set, runs *program*
+    (the name of a CIPP module) with *argv* (sys.argv[1:] by default)
+    in the cippd server, prints its output, and exits with its status.
+
+    Otherwise, or if the server can't be reached (in which case a
+    warning is printed), this just returns, and the program should carry
+    on as usual.
+
+    The CIPP_PROFILE environment variable is sent along, so that the
+    program is profiled (or not) in the server just as it would be
+    here, and the profiling report comes back with its output.
+    """
+    if in_server:
+        return
+    path = socket_path()
+    if path is None:
+        return
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        response = request(
+            "run", path, program=program, argv=list(argv), cwd=os.getcwd(),
+            profile=os.environ.get("CIPP_PROFILE", "")
+        )
+    except (OSError, ValueError) as err:
+        print(
+            f"WARNING: Could not use the cippd server at {path} ({err}), "
+            f"running {program} here.",
+            file=sys.stderr
+        )
+        return
+    sys.exit(show(response))
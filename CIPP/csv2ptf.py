@@ -22,6 +22,7 @@ import getpass
 from datetime import datetime
 from pathlib import Path
 
+import profiling
 import ptf
 
 
@@ -31,8 +32,10 @@ def main():
     parser.add_argument('-p', '--ptf', required=True)
     parser.add_argument('-t', '--truncate', required=False, type=int)
     parser.add_argument('csv', metavar="some.csv-file")
+    profiling.add_arguments(parser)
 
     args = parser.parse_args()
+    profiling.start(args)
 
     ptf_template = ptf.load(args.ptf)
 
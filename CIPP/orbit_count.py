@@ -17,48 +17,134 @@
 
 
 import argparse
+import collections.abc
+import csv
+import io
+import json
 import logging
 from collections import Counter
-from itertools import groupby
 
+import cippd_client
 import priority_rewrite as pr
+import profiling
+import ptf
 
 
 def main():
+    cippd_client.forward('orbit_count')
+
     parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-f', '--format',
+        choices=('text', 'json', 'csv'),
+        default='text',
+        help="The text report is for people, the JSON has the counts for "
+             "each orbit, the totals, histogram and empty orbit ranges, "
+             "and the CSV just has the counts for each orbit. "
+             "Default: %(default)s"
+    )
     parser.add_argument('in_file', help="a .ptf or .csv file")
+    profiling.add_arguments(parser)
 
     args = parser.parse_args()
+    profiling.start(args)
 
     logging.basicConfig(format='%(levelname)s: %(message)s')
 
-    ptf_in = pr.get_input(args.in_file)
+    ptf_in = pr.iter_input(args.in_file)
+
+    reports = orbit_count(ptf_in)
+    if args.format == 'json':
+        print(format_json(reports))
+    elif args.format == 'csv':
+        print(format_csv(reports), end='')
+    else:
+        print('\n'.join(format_report(reports)))
+
+
+@profiling.timed('count')
+def orbit_count(records: collections.abc.Iterable) -> list:
+    if isinstance(records, (ptf.PTF, ptf.ColumnarPTF)):
+        # The shared (and possibly already built) ptf.OrbitIndex
+        # has the rows of each orbit.
+        cols = ptf.columns(records)
+        if ptf.MISSING in cols.orbit:
+            raise ValueError('A record is missing its Orbit Number.')
+        priority = cols.priority
+        reports = list()
+        for orbit, rows in cols.orbit_index.items():
+            pos = neg = 0
+            for i in rows:
+                p = priority[i]
+                if p > 0:
+                    pos += 1
+                elif p != ptf.MISSING:
+                    # MISSING probably has nothing in Request Priority.
+                    neg += 1
+            reports.append({'orbit': orbit, 'pos': pos, 'neg': neg})
+        return reports
 
-    print('\n'.join(format_report(orbit_count(ptf_in))))
+    # Otherwise, the records are consumed in a single pass, and only the
+    # per-orbit counts are kept, so *records* can be a lazy PTFReader.
+    reports = dict()
 
+    for orbit, priority in orbits_and_priorities(records):
+        try:
+            report_dict = reports[orbit]
+        except KeyError:
+            report_dict = {'orbit': orbit, 'pos': 0, 'neg': 0}
+            reports[orbit] = report_dict
 
-def orbit_count(records: list) -> str:
-    reports = list()
+        if priority is None:
+            # Probably has nothing in Request Priority.
+            pass
+        elif priority > 0:
+            report_dict['pos'] += 1
+        else:
+            report_dict['neg'] += 1
 
-    sorted_by_o = sorted(records,
-                         key=lambda x: int(x['Orbit Number'][:-1]))
-    for orbit, g in groupby(sorted_by_o,
-                            key=lambda x: int(x['Orbit Number'][:-1])):
-        report_dict = {'orbit': orbit, 'pos': 0, 'neg': 0}
+    return [reports[o] for o in sorted(reports)]
 
-        for rec in g:
+
+def orbits_and_priorities(records: collections.abc.Iterable):
+    """Yields an (orbit, priority) two-tuple of integers for each of the
+    *records*, priority will be None if it isn't an integer.
+
+    If *records* is a PTF or ColumnarPTF, the typed columns are used.
+    """
+    if isinstance(records, (ptf.PTF, ptf.ColumnarPTF)):
+        cols = ptf.columns(records)
+        if ptf.MISSING in cols.orbit:
+            raise ValueError('A record is missing its Orbit Number.')
+        for orbit, priority in zip(cols.orbit, cols.priority):
+            yield orbit, (None if priority == ptf.MISSING else priority)
+    else:
+        for rec in records:
+            orbit = int(rec['Orbit Number'][:-1])
             try:
-                if int(rec['Request Priority']) > 0:
-                    report_dict['pos'] += 1
-                else:
-                    report_dict['neg'] += 1
+                yield orbit, int(rec['Request Priority'])
             except ValueError:
-                # Probably has nothing in Request Priority.
-                pass
+                yield orbit, None
 
-        reports.append(report_dict)
 
-    return reports
+def summarize(records: list) -> dict:
+    """Returns a dict of the totals of the 'pos' and 'neg' counts in the
+    orbit_count() *records*, the 'histogram' (a Counter of how many
+    orbits have each number of positive observations), and the ranges
+    of 'empty' orbits, from find_gaps().
+    """
+    pos_counts = Counter()
+    neg_count = 0
+    for r in records:
+        pos_counts[r['pos']] += 1
+        neg_count += r['neg']
+
+    return {
+        'pos': sum(k * v for k, v in pos_counts.items()),
+        'neg': neg_count,
+        'histogram': pos_counts,
+        'empty': find_gaps([r['orbit'] for r in records]),
+    }
 
 
 def format_report(records: list) -> list:
@@ -74,34 +160,32 @@ def format_report(records: list) -> list:
              'pos': '-' * p_width,
              'neg': '-' * n_width}
 
-    # Accumulate counts and fuss with removing zeros from output.
-    pos_counts = Counter()
-    neg_count = 0
-    str_reports = list()
+    def format_line(orbit, pos, neg):
+        o_str = '{orb:<{width}}'.format(orb=orbit, width=o_width)
+        p_str = '{pos:^{width}}'.format(pos=pos, width=p_width)
+        n_str = '{neg:<{width}}'.format(neg=neg, width=n_width)
+        return f'{o_str} {p_str} {n_str}'
+
+    # The meat of formatting each line of the report, removing zeros
+    # from the output:
+    for d in (header, rules):
+        formatted_lines.append(format_line(d['orbit'], d['pos'], d['neg']))
     for r in records:
-        str_d = {'orbit': str(r['orbit']), 'pos': '', 'neg': ''}
-        pos_counts.update((r['pos'],))
-        neg_count += r['neg']
-        for pn in ('pos', 'neg'):
-            if r[pn] == 0:
-                str_d[pn] = ''
-            else:
-                str_d[pn] = str(r[pn])
-        str_reports.append(str_d)
-
-    # The meat of formatting each line of the report:
-    lines_to_format = [header, rules] + str_reports
-    for d in lines_to_format:
-        o_str = '{orb:<{width}}'.format(orb=d['orbit'], width=o_width)
-        p_str = '{pos:^{width}}'.format(pos=d['pos'], width=p_width)
-        n_str = '{neg:<{width}}'.format(neg=d['neg'], width=n_width)
-        formatted_lines.append(f'{o_str} {p_str} {n_str}')
+        formatted_lines.append(format_line(
+            str(r['orbit']),
+            str(r['pos']) if r['pos'] else '',
+            str(r['neg']) if r['neg'] else ''
+        ))
+
+    summary = summarize(records)
+    pos_counts = summary['histogram']
 
     # Summary line at the bottom:
     count_summ = '{label:-^{width}}'.format(label='Counts', width=o_width)
     count_summ += ' {} {}'.format(rules['pos'], rules['neg'])
     formatted_lines.append(count_summ)
-    pos_count = sum(k * v for k, v in pos_counts.items())
+    pos_count = summary['pos']
+    neg_count = summary['neg']
     t_sum = '{sum:^#{o_width}}'.format(sum=pos_count + neg_count,
                                        o_width=o_width)
     t_pos = f'{pos_count:^#{p_width}}'
@@ -124,16 +208,73 @@ def format_report(records: list) -> list:
     formatted_lines.append('')
 
     # Set up the empty orbit report
-    empty_orbits = find_empty_orbits(records)
     formatted_lines.append('Empty Orbits')
     formatted_lines.append('------------')
 
-    return formatted_lines + list(map(str, empty_orbits))
+    return formatted_lines + format_ranges(summary['empty'])
+
+
+def format_json(records: list) -> str:
+    """Returns the orbit_count() *records* and their summarize() as a
+    JSON string.
+    """
+    summary = summarize(records)
+    return json.dumps({
+        'orbits': records,
+        'pos': summary['pos'],
+        'neg': summary['neg'],
+        'histogram': {
+            str(k): v for k, v in sorted(summary['histogram'].items())
+        },
+        'empty': [list(x) for x in summary['empty']],
+    }, indent=2)
+
+
+def format_csv(records: list) -> str:
+    """Returns the orbit_count() *records* as CSV text."""
+    s = io.StringIO()
+    writer = csv.DictWriter(s, fieldnames=('orbit', 'pos', 'neg'))
+    writer.writeheader()
+    writer.writerows(records)
+    return s.getvalue()
+
+
+def find_gaps(orbits: collections.abc.Sequence) -> list:
+    """Returns a list of (first, last) two-tuples of the inclusive ranges
+    of orbit numbers that are missing between the lowest and highest of
+    the *orbits* integers.
+
+    This is a single pass over *orbits* if they are in ascending order
+    (as from orbit_count()), otherwise they are sorted first.
+    """
+    gaps = list()
+    previous = None
+    for o in orbits:
+        if previous is not None:
+            if o > previous + 1:
+                gaps.append((previous + 1, o - 1))
+            elif o < previous:
+                return find_gaps(sorted(orbits))
+        previous = o
+    return gaps
+
+
+def format_ranges(ranges: list) -> list:
+    """Returns strings like '59660-59672' for each of the (first, last)
+    two-tuples in *ranges*, or just '59660' if first and last are the
+    same.
+    """
+    return [str(a) if a == b else f'{a}-{b}' for a, b in ranges]
 
 
 def find_empty_orbits(records: list) -> list:
-    orbs = list(map(lambda x: x['orbit'], records))
-    return sorted(set(range(orbs[0], orbs[-1])) - set(orbs))
+    """Returns a list of the orbit numbers that are missing between the
+    first and last of the orbit_count() *records*.
+    """
+    empty = list()
+    for a, b in find_gaps([r['orbit'] for r in records]):
+        empty.extend(range(a, b + 1))
+    return empty
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""Runs several of the CIPP steps, one after another, on a PTF.
+
+The usual CIPP session is to run special_priorities.py on the HiTList,
+then prioritize_by_orbit.py on what that writes, then
+priority_rewrite.py on what that writes, and so on, with each program
+reading and parsing the whole file that the one before it wrote.  This
+program reads the PTF once, runs each of the steps on the records in
+memory, and only writes out the result at the end:
+
+    pipeline.py -o HiTList_new.ptf HiTList.ptf \\
+        special wth.txt hikers.txt then prioritize -a -r then rewrite
+
+The steps are separated by "then", and each is one of special,
+prioritize, rewrite, count, csv, or write, which take the same options
+as the programs of the same names (see cippd.py -h for the details).
+A write or csv step writes out the records as they are at that point,
+and --snapshots writes them after every step.  The result is the same
+as running the programs one after another.
+
+The steps can also be given in a TOML or JSON recipe file, whose
+"input" and "output" are the files to read and write, and whose
+"stages" are a list of steps, each either a string, like those above,
+or a table with a "command" and the arguments for it:
+
+    input = "HiTList.ptf"
+    output = "HiTList_new.ptf"
+    stages = [
+        "special wth.txt",
+        {command = "prioritize", high_alt = -1, high_roll = 8.8},
+        "rewrite -r 800:700",
+    ]
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import inspect
+import json
+import logging
+import os
+import shlex
+import sys
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+import cippd
+import profiling
+import ptf
+
+# The word that separates the steps on the command line.
+separator = "then"
+
+_name = "pipeline"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="The file to write the result to, the default is to write it "
+             "to standard output."
+    )
+    parser.add_argument(
+        "-n", "--dry_run", action="store_true",
+        help="Run the steps, but do not write out the result."
+    )
+    parser.add_argument(
+        "--recipe", help="A TOML or JSON file with the input, output and "
+                         "steps."
+    )
+    parser.add_argument(
+        "--snapshots", metavar="DIR",
+        help="Write the records after each step to a file in this "
+             "directory, named for the number and name of the step."
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true",
+        help="Will report information from every step."
+    )
+    parser.add_argument("in_file", nargs="?", help="a .ptf or .csv file")
+    parser.add_argument(
+        "stages", nargs=argparse.REMAINDER,
+        help=f"The steps to run, separated by '{separator}'."
+    )
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args()
+    profiling.start(args)
+
+    recipe = dict()
+    if args.recipe is not None:
+        try:
+            recipe = read_recipe(args.recipe)
+        except (OSError, ValueError) as err:
+            parser.error(str(err))
+        if args.stages:
+            parser.error(
+                "The steps can be given on the command line or in a recipe, "
+                "but not both."
+            )
+
+    in_file = args.in_file or recipe.get("input")
+    output = args.output or recipe.get("output")
+    if in_file is None:
+        parser.error("There is no input file.")
+
+    try:
+        if args.recipe is None:
+            stages = parse_stages(split_stages(args.stages))
+        else:
+            stages = parse_stages(recipe.get("stages", list()))
+    except ValueError as err:
+        parser.error(str(err))
+    if not stages:
+        parser.error("There are no steps to run.")
+
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+
+    workspace = run(in_file, stages, args.snapshots, args.verbose)
+
+    if not args.dry_run:
+        workspace.write(_name, output)
+
+
+def split_stages(argv: list) -> list:
+    """Returns a list of the lists of arguments in *argv* that are
+    separated by the separator word.
+    """
+    stages = [list()]
+    for arg in argv:
+        if arg == separator:
+            stages.append(list())
+        else:
+            stages[-1].append(arg)
+    return [s for s in stages if s]
+
+
+def parse_stages(stages: list) -> list:
+    """Returns a list of (command, arguments) two-tuples from the
+    *stages*, each of which may be a list of command line arguments, a
+    string of them, or a dict with a "command" and its arguments.
+
+    Raises ValueError if any of them aren't right.
+    """
+    parser = _StageParser(prog="pipeline.py", add_help=False)
+    sub = parser.add_subparsers(dest="command", required=True)
+    cippd.add_commands(sub, name=False)
+    commands = tuple(sub.choices.keys())
+
+    parsed = list()
+    for i, stage in enumerate(stages, start=1):
+        if isinstance(stage, dict):
+            kwargs = dict(stage)
+            command = kwargs.pop("command", None)
+            if command not in commands:
+                raise ValueError(
+                    f"Step {i} has a command of {command!r}, which should be "
+                    f"one of: {', '.join(commands)}"
+                )
+            method = getattr(cippd.Workspace, command)
+            try:
+                inspect.signature(method).bind(None, _name, **kwargs)
+            except TypeError as err:
+                raise ValueError(f"Step {i} ({command}): {err}") from None
+        else:
+            if isinstance(stage, str):
+                stage = shlex.split(stage)
+            try:
+                kwargs = vars(parser.parse_args(list(stage)))
+            except ValueError as err:
+                raise ValueError(f"Step {i} ({' '.join(stage)}): {err}")
+            command = kwargs.pop("command")
+        parsed.append((command, kwargs))
+    return parsed
+
+
+def read_recipe(path: os.PathLike) -> dict:
+    """Returns the dict from the TOML (if *path* ends in .toml) or JSON
+    recipe file at *path*.
+    """
+    if os.fspath(path).endswith(".toml"):
+        if tomllib is None:
+            raise ValueError(
+                f"Reading {path} needs the tomllib module (Python 3.11 "
+                f"or later), use a JSON file instead."
+            )
+        with open(path, "rb") as f:
+            try:
+                recipe = tomllib.load(f)
+            except tomllib.TOMLDecodeError as err:
+                raise ValueError(f"{path}: {err}") from None
+    else:
+        with open(path) as f:
+            try:
+                recipe = json.load(f)
+            except json.JSONDecodeError as err:
+                raise ValueError(f"{path}: {err}") from None
+
+    if not isinstance(recipe, dict) or not isinstance(
+        recipe.get("stages", list()), list
+    ):
+        raise ValueError(
+            f"{path} should have a list of stages, and optionally an input "
+            f"and output."
+        )
+    return recipe
+
+
+def run(in_file: os.PathLike, stages: list, snapshots=None, verbose=False):
+    """Returns a cippd.Workspace that holds the records read from
+    *in_file*, after each of the (command, arguments) *stages* were
+    run on them.
+
+    If *snapshots* is given, the records are written after each step to
+    a file in that directory.
+    """
+    workspace = cippd.Workspace()
+    workspace.load(_name, in_file)
+    if snapshots is not None:
+        os.makedirs(snapshots, exist_ok=True)
+
+    root = logging.getLogger()
+    level = root.level
+    try:
+        for i, (command, kwargs) in enumerate(stages, start=1):
+            # The steps that have a --verbose option report more.
+            if verbose or kwargs.get("verbose"):
+                root.setLevel(logging.INFO)
+            else:
+                root.setLevel(logging.WARNING)
+
+            getattr(workspace, command)(_name, **kwargs)
+
+            if snapshots is not None:
+                if isinstance(workspace[_name], ptf.PTF):
+                    ext = ".ptf"
+                else:
+                    ext = ".csv"
+                workspace.write(
+                    _name,
+                    os.path.join(snapshots, f"{i:02}_{command}{ext}")
+                )
+    finally:
+        root.setLevel(level)
+
+    return workspace
+
+
+class _StageParser(argparse.ArgumentParser):
+    # Raises ValueError rather than exiting, so that the error can say
+    # which step it was in.
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,6 +22,20 @@ SPORC stereo-2s and above (14600), then 30 degrees for priorities
 from there through the 2nd half stereos (13000), then 20 degrees
 through the easier-to-get WTHs, stereo 1s, HiKERs, and high priority
 non-WTH targets (10000), and then 15 degrees for priorities below that.
+A different table of half-widths can be given with --half_widths, and
+with --sweep, the number of observations kept with each of several
+tables is reported, so that they can be compared.
+
+Giving the highest priority plus the lowest latitude the top spot may
+'exclude' two other observations, and if one had the same priority, but
+didn't 'exclude' the other, you might be able to fit more observations
+on an orbit.  With --optimize, the set of observations kept in each orbit
+is the one with the most of the highest priority observations, then the
+most of the next highest, and so on, which will find those.  That is
+only the best set for each orbit on its own, though: a SPORC half that
+it leaves out takes its partner out of another orbit, and more of a
+higher priority can mean fewer observations in all, so the whole PTF
+may end up with fewer observations kept than without --optimize.
 """
 
 # Copyright 2020, Ross A. Beyer (rbeyer@seti.org)
@@ -38,27 +52,34 @@ non-WTH targets (10000), and then 15 degrees for priorities below that.
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-# TODO: write in a mechanism that allows the user to optimize for more
-#   observations per orbit, rather than strictly giving the highest priority
-#   plus the lowest latitude the top spot.  Doing so may 'exclude' two other
-#   observations, and if one had the same priority, but didn't 'exclude' the
-#   other, you might be able to fit more observations on an orbit.
-#
 # TODO: may also want something other than abs(latitude) to be a driver,
 #   possibly time since coming out of eclipse or something.  Lots of
 #   possibilities.
-#
-# TODO: If we really want to get fancy, implement a way to have a
-#   user-specified half_widths list.
 
 import argparse
+import contextlib
 import copy
+import heapq
+import json
 import logging
+import math
+import operator
+import os
 import sys
 
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from itertools import groupby
 
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+import cippd_client
 import priority_rewrite as pr
+import profiling
+import ptf
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +92,8 @@ class SPORCError(Exception):
 
 
 def main():
+    cippd_client.forward("prioritize_by_orbit")
+
     parser = argparse.ArgumentParser(
         description=__doc__,
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -104,6 +127,13 @@ def main():
         help="The log file to write log messages to in addition "
              "to the terminal.",
     )
+    parser.add_argument(
+        "--trace",
+        required=False,
+        help="A JSON Lines file to write a line to for each decision made "
+             "about a record, with its Team Database ID, orbit, new "
+             "priority, the reason for it, and the exclusion intervals.",
+    )
     parser.add_argument(
         "--per_orbit",
         required=False,
@@ -111,6 +141,33 @@ def main():
         type=int,
         help="The max number of observations to keep in an orbit.",
     )
+    parser.add_argument(
+        "-w", "--half_widths", "--half-widths",
+        action="append",
+        help="The latitude exclusion half-widths, as comma-separated "
+             "priority:half-width pairs in descending order of priority "
+             "(the default is 17000:40,14600:30,13000:20,10000:15), or a "
+             "JSON or TOML file of them.  With --sweep, this may be given "
+             "more than once, and a file may have several tables by name.",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Rather than writing out results, report the number of "
+             "observations that are kept with each of the --half_widths "
+             "tables.",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Rather than keeping the highest priority, then lowest "
+             "latitude, observation that isn't excluded, one after another, "
+             "find the set of observations in each orbit that keeps the "
+             "most of the highest priorities, which is usually more "
+             "observations.  The number kept, compared to without this "
+             "option, is reported, since SPORCs linking orbits can make "
+             "it fewer.",
+    )
     parser.add_argument(
         "-n",
         "--dry_run",
@@ -118,12 +175,43 @@ def main():
         action="store_true",
         help="Perform the rearranging but do not write out results.",
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        default=1,
+        type=int,
+        help="The number of processes to spread the orbits over.  The "
+             "results are the same as with one, and log messages are "
+             "reported in orbit order.",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Will report information."
     )
     parser.add_argument("in_file", help="a .ptf or .csv file")
+    profiling.add_arguments(parser)
 
     args = parser.parse_args()
+    profiling.start(args)
+
+    # half-widths are a list of two-tuples, the first position is a
+    # priority value, and the second is a latitude half-width.
+    # the final two-tuple should be (0, 0).
+    half_widths = ((17000, 40), (14600, 30), (13000, 20), (10000, 15), (0, 0))
+
+    tables = dict()
+    for value in args.half_widths or ():
+        try:
+            tables.update(parse_half_widths(value))
+        except ValueError as err:
+            parser.error(str(err))
+    if args.sweep:
+        if not tables:
+            parser.error("--sweep needs at least one --half_widths table.")
+    elif len(tables) > 1:
+        parser.error(
+            "Only one --half_widths table may be given without --sweep."
+        )
+    elif tables:
+        half_widths = next(iter(tables.values()))
 
     log_level = logging.WARNING
     if args.verbose:
@@ -145,18 +233,68 @@ def main():
 
     ptf_in = pr.get_input(args.in_file)
 
-    # half-widths are a list of two-tuples, the first position is a
-    # priority value, and the second is a latitude half-width.
-    # the final two-tuple should be (0, 0).
-    half_widths = ((17000, 40), (14600, 30), (13000, 20), (10000, 15), (0, 0))
+    if args.sweep:
+        # The decisions for each table aren't what is being asked for.
+        logger.disabled = True
+        kept = sweep(
+            ptf_in,
+            tables,
+            args.per_orbit,
+            high_alt=args.high_alt,
+            high_roll=args.high_roll,
+            jobs=args.jobs,
+            optimize=args.optimize
+        )
+        print("    Kept  Half-widths")
+        for name, count in kept.items():
+            table = str(tables[name])
+            if name == table:
+                print(f"{count:>8}  {table}")
+            else:
+                print(f"{count:>8}  {name}: {table}")
+        return
 
-    new_ptf_records = prioritize_by_orbit(
-        ptf_in,
-        half_widths,
-        args.per_orbit,
-        high_alt=args.high_alt,
-        high_roll=args.high_roll
-    )
+    with contextlib.ExitStack() as stack:
+        trace = None
+        if args.trace is not None:
+            trace_file = stack.enter_context(open(args.trace, "w"))
+
+            def trace(event):
+                trace_file.write(json.dumps(event) + "\n")
+
+        if args.optimize:
+            # The greedy result to compare with is made from copies of the
+            # records, since knocking out SPORCs changes them, and quietly.
+            logger.disabled = True
+            try:
+                greedy_records = prioritize_by_orbit(
+                    [copy.copy(r) for r in ptf_in],
+                    half_widths,
+                    args.per_orbit,
+                    high_alt=args.high_alt,
+                    high_roll=args.high_roll,
+                    jobs=args.jobs
+                )
+            finally:
+                logger.disabled = False
+
+        new_ptf_records = prioritize_by_orbit(
+            ptf_in,
+            half_widths,
+            args.per_orbit,
+            high_alt=args.high_alt,
+            high_roll=args.high_roll,
+            jobs=args.jobs,
+            trace=trace,
+            optimize=args.optimize
+        )
+
+    if args.optimize:
+        print(
+            format_kept(count_kept(new_ptf_records),
+                        count_kept(greedy_records)),
+            file=sys.stderr
+        )
 
     # This sorting ignores the 'a' or 'd' markers on Orbits.
     new_ptf_records.sort(key=lambda x: int(x["Orbit Number"][:-1]))
@@ -169,19 +307,209 @@ def main():
             print(out_str)
 
 
+def count_kept(records) -> int:
+    """Returns the number of *records* with a positive priority."""
+    return sum(1 for r in records if int(r["Request Priority"]) > 0)
+
+
+def format_kept(kept: int, greedy_kept: int) -> str:
+    """Returns a sentence comparing the number of observations *kept*
+    with --optimize to the number *greedy_kept* without it.
+    """
+    difference = kept - greedy_kept
+    more = "fewer" if difference < 0 else "more"
+    return (
+        f"Kept {kept} observations, {abs(difference)} {more} than the "
+        f"{greedy_kept} kept without --optimize."
+    )
+
+
+class HalfWidths(tuple):
+    """A table of latitude exclusion half-widths by priority.
+
+    It is a tuple of (priority, half-width) two-tuples in descending
+    order of priority, which ends with a priority of zero (a (0, 0) is
+    added if the given table doesn't).  The priorities below the first
+    value of a two-tuple, down to and including the first value of the
+    next, get the half-width of the first.  So with the default table,
+    a priority of 14600 has a half-width of 40.  A half-width may not
+    be wider than the one for the priorities above it, since a lower
+    priority observation shouldn't exclude more than a higher one.
+
+    The table is checked once, when it is made, and get() finds the
+    half-width for a priority with a binary search.
+    """
+
+    def __new__(cls, half_widths):
+        table = list()
+        for pair in half_widths:
+            try:
+                priority, width = (float(x) for x in pair)
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"The half-width entry {pair!r} is not a (priority, "
+                    f"half-width) pair of numbers."
+                ) from None
+            if not priority.is_integer():
+                raise ValueError(f"The priority {priority} is not an integer.")
+            if not width >= 0:
+                raise ValueError(
+                    f"The half-width for {int(priority)} ({width}) must "
+                    f"be zero or more."
+                )
+            table.append(
+                (int(priority), int(width) if width.is_integer() else width)
+            )
+
+        if not table or table[-1][0] != 0:
+            table.append((0, 0))
+        for (higher, _), (lower, _) in zip(table, table[1:]):
+            if higher <= lower:
+                raise ValueError(
+                    f"The half-width priorities must be in descending order, "
+                    f"and {higher} is not greater than {lower}."
+                )
+        if len(table) < 2:
+            raise ValueError("The half-widths must have a non-zero priority.")
+        # The last half-width is for priorities at or below zero, which
+        # get() doesn't give.
+        for (higher, wider), (lower, width) in zip(table, table[1:-1]):
+            if width > wider:
+                raise ValueError(
+                    f"The half-width for {lower} ({width}) is wider than "
+                    f"the one for {higher} ({wider})."
+                )
+
+        self = super().__new__(cls, table)
+        # The priorities in ascending order, and the half-width for
+        # each position that bisect_right() can find in them.
+        self._priorities = [p for p, _ in reversed(self)]
+        self._widths = [w for _, w in reversed(self)]
+        return self
+
+    def __str__(self):
+        return ",".join(f"{p}:{w}" for p, w in self)
+
+    def get(self, priority=None):
+        """Returns the half-width for the *priority* value.
+
+        If *priority* is not given, the first half-width is returned.
+        """
+        if priority is None:
+            return self[0][1]
+
+        i = bisect_right(self._priorities, priority)
+        if 0 < i < len(self._priorities):
+            return self._widths[i]
+
+        raise ValueError(
+            f"The priority ({priority}) is not in the range "
+            f"({self[-1][0]}, {self[0][0]})."
+        )
+
+
+def parse_half_widths(value: str) -> dict:
+    """Returns a dict of HalfWidths, keyed by name, from *value*.
+
+    If *value* is the path to a file, it is read as TOML if its name
+    ends in .toml, and as JSON otherwise.  It may hold a single table,
+    as a list of [priority, half-width] pairs (which is named after the
+    file), or a mapping of names to such lists.
+
+    Otherwise, *value* is a single table written as comma-separated
+    priority:half-width pairs, like "17000:40,14600:30,13000:20", which
+    is named by the str() of its HalfWidths.
+
+    Raises ValueError if any table is not valid.
+    """
+    if os.path.isfile(value):
+        if value.endswith(".toml"):
+            if tomllib is None:
+                raise ValueError(
+                    f"Reading {value} needs the tomllib module (Python 3.11 "
+                    f"or later), use a JSON file instead."
+                )
+            with open(value, "rb") as f:
+                try:
+                    data = tomllib.load(f)
+                except tomllib.TOMLDecodeError as err:
+                    raise ValueError(f"{value}: {err}") from None
+        else:
+            with open(value) as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError as err:
+                    raise ValueError(f"{value}: {err}") from None
+
+        if isinstance(data, list):
+            data = {os.path.splitext(os.path.basename(value))[0]: data}
+        elif not isinstance(data, dict) or not data:
+            raise ValueError(
+                f"{value} does not have a list of half-widths, or a mapping "
+                f"of names to them."
+            )
+        tables = dict()
+        for name, table in data.items():
+            if not isinstance(table, list):
+                raise ValueError(
+                    f"The half-widths for {name} in {value} are not a list."
+                )
+            try:
+                tables[name] = HalfWidths(table)
+            except ValueError as err:
+                raise ValueError(f"{name} in {value}: {err}") from None
+        return tables
+
+    pairs = list()
+    for item in value.split(","):
+        priority, sep, width = item.partition(":")
+        if not sep:
+            raise ValueError(
+                f"The half-width entry {item.strip()!r} is not of the "
+                f"form priority:half-width."
+            )
+        pairs.append((priority.strip(), width.strip()))
+    table = HalfWidths(pairs)
+    return {str(table): table}
+
+
 class Intervals(object):
     """Manages the intervals described by the latitude exclusion zones.
+
+    The intervals are kept sorted and disjoint (overlapping or touching
+    intervals are merged), as two parallel lists of lower and upper
+    bounds, so that both adding an interval and testing a point are
+    binary searches.
     """
 
     def __init__(self, half_widths=None):
-        self.intervals = list()  # a list of two-tuples
+        self._lows = list()
+        self._highs = list()
         if half_widths is None:
-            self.half_widths = ((sys.maxsize, 40), (0, 0))
+            self.half_widths = HalfWidths(((sys.maxsize, 40), (0, 0)))
+        elif isinstance(half_widths, HalfWidths):
+            self.half_widths = half_widths
         else:
-            if half_widths[-1][0] != 0:
-                half_widths.append((0, 0))
+            self.half_widths = HalfWidths(half_widths)
 
-            self.half_widths = half_widths
+    @classmethod
+    def from_intervals(cls, intervals, half_widths=None):
+        """Returns a new Intervals object made from the (lower, upper)
+        two-tuples in *intervals*, which will be merged.
+        """
+        new = cls(half_widths)
+        for low, high in sorted(intervals):
+            if new._highs and low <= new._highs[-1]:
+                new._highs[-1] = max(high, new._highs[-1])
+            else:
+                new._lows.append(low)
+                new._highs.append(high)
+        return new
+
+    @property
+    def intervals(self):
+        """A list of (lower, upper) two-tuples in ascending order."""
+        return list(zip(self._lows, self._highs))
 
     def __str__(self):
         return str(self.intervals)
@@ -195,29 +523,22 @@ class Intervals(object):
         """
         p = float(point)
         hw = self.get_half_width(priority)
-        new_interval = ((p - hw), (p + hw))
-        intervals = self.intervals + [new_interval]
-
-        # This interval merging logic is from
-        # https://codereview.stackexchange.com/questions/69242/merging-overlapping-intervals
-        sorted_by_lower_bound = sorted(intervals, key=lambda x: x[0])
-        merged = list()
+        self.add_interval(p - hw, p + hw)
+        return
 
-        for higher in sorted_by_lower_bound:
-            if not merged:
-                merged.append(higher)
-            else:
-                lower = merged[-1]
-                # test for intersection between lower and higher:
-                # we know via sorting that lower[0] <= higher[0]
-                if higher[0] <= lower[1]:
-                    upper_bound = max(lower[1], higher[1])
-                    # replace by merged interval:
-                    merged[-1] = (lower[0], upper_bound)
-                else:
-                    merged.append(higher)
-
-        self.intervals = merged
+    def add_interval(self, low: float, high: float):
+        """Adds the interval from *low* to *high*, merging it with any
+        existing intervals that it overlaps or touches.
+        """
+        # The existing intervals from i up to (but not including) j
+        # are the ones that intersect [low, high].
+        i = bisect_left(self._highs, low)
+        j = bisect_right(self._lows, high, lo=i)
+        if i < j:
+            low = min(low, self._lows[i])
+            high = max(high, self._highs[j - 1])
+        self._lows[i:j] = [low]
+        self._highs[i:j] = [high]
         return
 
     def get_half_width(self, priority=None):
@@ -226,186 +547,744 @@ class Intervals(object):
         If *priority* is not given, the first half-width in this
         object's half_widths will be used.
         """
-        if priority is None:
-            return self.half_widths[0][1]
-        else:
-            for i in range(len(self.half_widths) - 1):
-                if (
-                    self.half_widths[i][0]
-                    > priority
-                    >= self.half_widths[i + 1][0]
-                ):
-                    return self.half_widths[i][1]
-
-            raise ValueError(
-                f"The priority ({priority}) is not in the range "
-                f"({self.half_widths[-1][0]}, {self.half_widths[0][0]})."
-            )
+        return self.half_widths.get(priority)
 
     def is_in(self, point: float):
         """Returns True if the given value is within (inclusive) the
         boundaries of one of this object's intervals.  False otherwise.
         """
         p = float(point)
-        for i in self.intervals:
-            if i[0] <= p <= i[1]:
-                return True
-        else:
-            return False
+        i = bisect_right(self._lows, p)
+        return i > 0 and p <= self._highs[i - 1]
 
 
+@profiling.timed("prioritize")
 def prioritize_by_orbit(
     records: list, half_widths, observations=4, high_alt=None, high_roll=None,
+    jobs=1, trace=None, optimize=False,
 ) -> list:
-    """Rewrites priorities by orbit."""
+    """Rewrites priorities by orbit.
+
+    *records* may be any sequence of records, a PTF, or a ptf.ColumnarPTF.
+    The returned records are ptf.COWRecord copies (they share unchanged
+    fields with *records*), but when one half of a SPORC is
+    deprioritized, both halves will also be given negative priorities
+    in *records*, and the orbits they are in will be re-examined.
+
+    If *jobs* is more than one, the orbits are divided into that many
+    shards, which are prioritized in separate processes.  Orbits linked
+    by a SPORC are always in the same shard, so the results are the
+    same as with one job, and any log messages are emitted afterwards,
+    in orbit order.
+
+    If *trace* is given, it is called with a dict describing each
+    decision that is made about a record, see prioritize_orbit().
+
+    If *optimize* is True, each orbit keeps the best set of observations
+    found by optimize_orbit(), rather than the greedy one.  That set is
+    only the best for its orbit, and since SPORCs link orbits, fewer
+    observations may be kept in all than with the greedy approach.
+    """
+    cols = ptf.columns(records)
+    if ptf.MISSING in cols.orbit:
+        raise ValueError("A record is missing its Orbit Number.")
+    if ptf.MISSING in cols.priority:
+        raise ValueError("A record does not have an integer Request Priority.")
+
+    # The keyword arguments for prioritize_orbit().
+    options = dict(
+        half_widths=(
+            half_widths if isinstance(half_widths, HalfWidths)
+            else HalfWidths(half_widths)
+        ),
+        observations=observations,
+        high_alt=high_alt,
+        high_roll=high_roll,
+        optimize=optimize,
+    )
+
+    shards = shard_orbits(cols, jobs) if jobs > 1 else None
+    if shards is not None and len(shards) > 1:
+        results = _prioritize_shards(cols, shards, options, trace)
+    else:
+        results = _prioritize_orbits(cols, options, trace)
+
+    out_records = list()
+    for orbit in sorted(results):
+        out_records += results[orbit]
+
+    return out_records
+
+
+@profiling.timed("sweep")
+def sweep(
+    records, tables: dict, observations=4, high_alt=None, high_roll=None,
+    jobs=1, optimize=False,
+) -> dict:
+    """Returns a dict of the number of observations that
+    prioritize_by_orbit() keeps with each of the half-width *tables*,
+    which is a dict of HalfWidths (or lists of two-tuples) by name.
+
+    The records are only converted to columns once, and each table is
+    run on a copy of them, so *records* are not changed.
+    """
+    cols = ptf.columns(records)
+    # Build the columns that prioritize_orbit() uses, so that each copy
+    # gets them, rather than building its own.
+    cols.orbit_index
+    cols.latitude
+    cols.roll
+
+    kept = dict()
+    for name, half_widths in tables.items():
+        kept[name] = count_kept(prioritize_by_orbit(
+            cols.copy(), half_widths, observations, high_alt=high_alt,
+            high_roll=high_roll, jobs=jobs, optimize=optimize
+        ))
+    return kept
 
-    while True:
-        records_new = copy.deepcopy(records)
-        out_records = list()
+
+def _prioritize_orbits(cols, options: dict, trace=None, capture=None) -> dict:
+    """Returns a dict of the prioritized records for each orbit in the
+    ptf.ColumnarPTF *cols*, where *options* are the keyword arguments
+    for prioritize_orbit().
+
+    If a _LogCapture is given as *capture*, its orbit is set to the
+    orbit being worked on.
+    """
+    # The rows of each orbit, in priority order, which is kept up to date
+    # as SPORCs are knocked out.
+    index = cols.orbit_index
+    orbits = list(index)
+    position = {orbit: k for k, orbit in enumerate(orbits)}
+
+    # The rows for each Team Database ID, so that the orbits holding
+    # both halves of a SPORC can be found without scanning every record.
+    rows_by_id = dict()
+    for i, r in enumerate(cols):
+        rows_by_id.setdefault(r["Team Database ID"], list()).append(i)
+
+    # Orbits are processed in order, but when a SPORC is knocked out,
+    # only the orbits holding its halves are re-processed, rather than
+    # starting over from the top.  Since the orbits before the earliest
+    # of those are unaffected, this gives the same result that restarting
+    # would, and stops when no orbit has to give up a SPORC.
+    # The Team Database IDs of the zero-priority SPORC halves whose
+    # partners have been knocked out, which can't be lowered themselves.
+    zero_sporcs = set()
+
+    results = dict()
+    pending = list(range(len(orbits)))  # a sorted list is a valid heap
+    queued = set(pending)
+    while pending:
+        k = heapq.heappop(pending)
+        queued.discard(k)
+        orbit = orbits[k]
+        if capture is not None:
+            capture.orbit = orbit
         try:
-            out_records = list()
-            sorted_by_o = sorted(records_new, key=lambda x: int(x["Orbit Number"][:-1]))
-            for orbit, g in groupby(
-                sorted_by_o, key=lambda x: int(x["Orbit Number"][:-1])
-            ):
-                # We create new_records, so that we can later examine which
-                # observations have already been prioritized for *this* orbit.
-                new_records = list()
-                exclude = Intervals(half_widths)
-                high_roll_exclude = Intervals(half_widths)
-                obs_count = 0
-                by_orbit = list(g)
-                by_orbit.sort(key=lambda x: int(x["Request Priority"]), reverse=True)
-                for pri, pri_g in groupby(
-                    by_orbit, key=lambda x: int(x["Request Priority"])
+            results[orbit] = prioritize_orbit(
+                cols, orbit, index[orbit], trace=trace,
+                zero_sporcs=zero_sporcs, **options
+            )
+        except SPORCError as err:
+            touched = knock_out_sporc(cols, err.record, rows_by_id, trace)
+            if err.record["Request Priority"] == 0:
+                zero_sporcs.add(err.record["Team Database ID"])
+            touched.add(orbit)
+            profiling.count("SPORC restarts")
+            profiling.count("orbits re-prioritized", len(touched))
+            for o in touched:
+                results.pop(o, None)
+                if position[o] not in queued:
+                    heapq.heappush(pending, position[o])
+                    queued.add(position[o])
+
+            logger.info(
+                "Re-prioritizing the affected orbits with this now-missing "
+                "SPORC."
+            )
+
+    return results
+
+
+# The fields that prioritize_orbit() and knock_out_sporc() read, which
+# are the only ones sent to the processes that work on a shard.
+_shard_fields = (
+    "Latitude", "Orbit Number", "Orbit Alternatives", "Spare 4",
+    "Request Priority", "Team Database ID", "Roll Angle",
+)
+_get_shard_fields = operator.itemgetter(*_shard_fields)
+
+
+def shard_orbits(cols, n: int) -> list:
+    """Returns a list of at most *n* shards, each of which is a sorted
+    list of row indices of the ptf.ColumnarPTF *cols*.
+
+    All of the rows in an orbit are in the same shard, and so are the
+    orbits of the rows of both halves of a SPORC, since knocking one
+    out may change the others.  The shards are balanced by their
+    number of rows, and are the same for the same *cols*.
+    """
+    sporcs = list()
+    for i, r in enumerate(cols):
+        spare = r.get("Spare 4")
+        if isinstance(spare, str) and spare.startswith("SPORC"):
+            try:
+                other_half = spare.split()[0].split(":")[1]
+            except IndexError:
+                other_half = None
+            sporcs.append((r.get("Team Database ID"), other_half))
+
+    orbits_by_id = dict()
+    if sporcs:
+        ids = set(x for pair in sporcs for x in pair)
+        for orbit, r in zip(cols.orbit, cols):
+            tdid = r.get("Team Database ID")
+            if tdid in ids:
+                orbits_by_id.setdefault(tdid, set()).add(orbit)
+
+    # Union-find over orbits.
+    parent = {orbit: orbit for orbit in cols.orbit}
+
+    def find(o):
+        while parent[o] != o:
+            parent[o] = parent[parent[o]]
+            o = parent[o]
+        return o
+
+    for pair in sporcs:
+        linked = set()
+        for tdid in pair:
+            linked.update(orbits_by_id.get(tdid, ()))
+        root = None
+        for o in sorted(linked):
+            if root is None:
+                root = find(o)
+            else:
+                parent[find(o)] = root
+
+    rows_by_group = dict()
+    for i, orbit in enumerate(cols.orbit):
+        rows_by_group.setdefault(find(orbit), list()).append(i)
+
+    # Largest groups first, each to the shard with the fewest rows.
+    shards = [list() for _ in range(min(n, len(rows_by_group)))]
+    loads = [(0, k) for k in range(len(shards))]
+    for group in sorted(
+        rows_by_group.values(), key=lambda x: (-len(x), x[0])
+    ):
+        size, k = heapq.heappop(loads)
+        shards[k] += group
+        heapq.heappush(loads, (size + len(group), k))
+
+    for shard in shards:
+        shard.sort()
+    return shards
+
+
+def _shard_record(record) -> dict:
+    """Returns a plain dict of the _shard_fields of *record*, leaving out
+    any that it doesn't have.
+    """
+    try:
+        # Straight from a PTFDict's own dict, when the keys match exactly.
+        return dict(zip(
+            _shard_fields,
+            _get_shard_fields(getattr(record, "data", record))
+        ))
+    except KeyError:
+        d = dict()
+        for k in _shard_fields:
+            try:
+                d[k] = record[k]
+            except KeyError:
+                pass
+        return d
+
+
+def _prioritize_shards(cols, shards, options: dict, trace=None) -> dict:
+    """Prioritizes each of the *shards* of the ptf.ColumnarPTF *cols* in
+    its own process, and returns the same dict that _prioritize_orbits()
+    would have.
+
+    Any SPORCs knocked out in a shard are applied to *cols*, and the log
+    messages and *trace* events from all of the shards are handled here,
+    in orbit order.
+    """
+    level = logger.getEffectiveLevel()
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        futures = [
+            executor.submit(
+                _prioritize_shard, [_shard_record(cols[i]) for i in shard],
+                options, level, trace is not None
+            ) for shard in shards
+        ]
+
+        results = dict()
+        logged = list()
+        for shard, future in zip(shards, futures):
+            shard_results, knocked_out, log_records = future.result()
+            for k, priority in knocked_out:
+                cols.set_priority(shard[k], priority)
+            for orbit, rows in shard_results.items():
+                out = list()
+                for k, priority in rows:
+                    r = ptf.COWRecord(cols[shard[k]])
+                    if priority is not None:
+                        r["Request Priority"] = priority
+                    out.append(r)
+                results[orbit] = out
+            logged += log_records
+
+    for orbit, record in sorted(logged, key=lambda x: x[0]):
+        if isinstance(record, logging.LogRecord):
+            logger.handle(record)
+        else:
+            trace(record)
+
+    return results
+
+
+def _prioritize_shard(records, options: dict, level, tracing=False) -> tuple:
+    """Prioritizes the *records* of a shard, which is run in a separate
+    process by _prioritize_shards().
+
+    Returns a three-tuple.  The first is a dict of the orbits in
+    *records*, whose values are lists of (index into *records*, Request
+    Priority) two-tuples for the prioritized records, where the priority
+    is None if it was not changed.  The second is a list of (index,
+    priority) two-tuples of the records that were given negative
+    priorities because they are in a knocked-out SPORC, and the third is
+    a list of (orbit, logging.LogRecord or trace event) two-tuples, where
+    there are only trace events if *tracing* is True.
+    """
+    capture = _LogCapture()
+    handlers = logger.handlers
+    propagate = logger.propagate
+    old_level = logger.level
+    logger.handlers = [capture]
+    logger.propagate = False
+    logger.setLevel(level)
+    try:
+        cols = ptf.columns(records)
+        before = cols.priority.tolist()
+        results = _prioritize_orbits(
+            cols, options, capture.trace if tracing else None, capture
+        )
+    finally:
+        logger.handlers = handlers
+        logger.propagate = propagate
+        logger.setLevel(old_level)
+
+    index = {id(r): k for k, r in enumerate(records)}
+    shard_results = dict()
+    for orbit, out in results.items():
+        rows = list()
+        for r in out:
+            p = r["Request Priority"]
+            rows.append((
+                index[id(r.record)],
+                None if p is r.record["Request Priority"] else p
+            ))
+        shard_results[orbit] = rows
+
+    knocked_out = [
+        (k, p) for k, (p, b) in enumerate(zip(cols.priority, before))
+        if p != b
+    ]
+
+    return shard_results, knocked_out, capture.records
+
+
+class _LogCapture(logging.Handler):
+    """Holds on to log records and trace events, along with the orbit
+    that was being worked on when they were emitted, so that they can be
+    sent back from another process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.orbit = None
+        self.records = list()
+
+    def emit(self, record):
+        # Like logging.handlers.QueueHandler.prepare(), so the record
+        # can be pickled.
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        self.records.append((self.orbit, record))
+
+    def trace(self, event: dict):
+        self.records.append((self.orbit, event))
+
+
+def knock_out_sporc(cols, record, rows_by_id: dict, trace=None) -> set:
+    """Gives negative priorities to the rows in the ptf.ColumnarPTF *cols*
+    that are either half of the SPORC that *record* is part of.
+
+    The rows for each Team Database ID are looked up in *rows_by_id*,
+    and the set of orbits of the changed rows is returned.  If *trace*
+    is given, it is called with a "sporc" event for each changed row.
+    """
+    spnum, other_half = (record["Spare 4"].split()[0]).split(":")
+    logger.info("%s is part of %s", record["Team Database ID"], spnum)
+
+    rows = set(rows_by_id.get(record["Team Database ID"], ()))
+    rows.update(rows_by_id.get(other_half, ()))
+
+    touched = set()
+    for i in sorted(rows):
+        if cols.priority[i] > 0:
+            cols.set_priority(i, -1 * cols.priority[i])
+            touched.add(cols.orbit[i])
+            logger.info(
+                "%s is %s and was given priority %s.",
+                cols[i]["Team Database ID"], spnum,
+                cols[i]["Request Priority"]
+            )
+            if trace is not None:
+                trace({
+                    "id": cols[i]["Team Database ID"],
+                    "orbit": cols.orbit[i],
+                    "reason": "sporc",
+                    "priority": cols.priority[i],
+                    "sporc": spnum,
+                })
+
+    return touched
+
+
+def prioritize_orbit(
+    cols, orbit, rows, half_widths, observations=4, high_alt=None,
+    high_roll=None, trace=None, optimize=False, zero_sporcs=(),
+) -> list:
+    """Returns copies of the records at the *rows* indices of the
+    ptf.ColumnarPTF *cols*, all of which are in *orbit*, with their
+    priorities rewritten.  The *rows* are processed from the highest
+    priority to the lowest, and in the order they are given for equal
+    priorities, which cols.orbit_index gives by row.
+
+    Normally, each observation is kept if it isn't excluded by the ones
+    kept before it.  If *optimize* is True, the observations that are
+    kept are instead the ones that optimize_orbit() chooses.  Either
+    way, the high_alt and high_roll exceptions, and SPORCs, are dealt
+    with in the same way.
+
+    If *trace* is given, it is called with a dict for each record with
+    its "id" (Team Database ID), "orbit", "priority" (its new priority),
+    "latitude", "intervals" (the exclusion intervals it was tested
+    against), and the "reason" for its priority, which is one of:
+    "kept", "high_alt", "high_roll", "per_orbit" (there were already
+    enough observations in the orbit), "excluded" (it was in the
+    intervals), "optimized" (it was not chosen by optimize_orbit()), or
+    "negative" (it already had a negative priority).
+
+    Raises SPORCError if one half of a SPORC has to be deprioritized.
+    A half with a zero priority can't be given a lower one, but its
+    partner still has to be, so it raises SPORCError too, unless its
+    Team Database ID is in *zero_sporcs*, since its partner has already
+    been deprioritized.
+    """
+    priority = cols.priority
+    latitude = cols.latitude
+    roll = cols.roll
+
+    def abs_roll(i):
+        # A missing or non-numeric Roll Angle is a NaN in the column.
+        if math.isnan(roll[i]):
+            raise ValueError(
+                f"{cols[i]['Team Database ID']} does not have a Roll Angle."
+            )
+        return abs(roll[i])
+
+    # The log messages are only put together if they will be emitted.
+    info = logger.isEnabledFor(logging.INFO)
+
+    # We create new_records, so that we can later examine which
+    # observations have already been prioritized for *this* orbit.
+    # new_rows holds the row and current priority of each of them.
+    new_records = list()
+    new_rows = list()
+    exclude = Intervals(half_widths)
+    high_roll_exclude = Intervals(half_widths)
+    obs_count = 0
+    # Each group of rows with the same priority, with each row paired
+    # with the priority it is ranked by.
+    groups = list()
+    by_orbit = sorted(rows, key=priority.__getitem__, reverse=True)
+    for pri, pri_g in groupby(by_orbit, key=priority.__getitem__):
+        pri_rows = list(pri_g)
+        if pri < 0:
+            groups.append((pri, [(i, pri) for i in pri_rows]))
+            continue
+
+        # The rank priority is the group's priority unless it is a tie,
+        # in which case they are assigned unique priorities by latitude,
+        # exactly as priority_rewrite.priority_rewrite() would.
+        if len(pri_rows) != 1:
+            pri_rows.sort(key=lambda x: abs(latitude[x]), reverse=True)
+            ranked = [(i, pri + j) for j, i in enumerate(pri_rows)]
+            ranked.reverse()
+        else:
+            ranked = [(pri_rows[0], pri)]
+        groups.append((pri, ranked))
+
+    if optimize:
+        candidates = list()
+        for pri, ranked in groups:
+            if pri < 0:
+                continue
+            for i, rank_pri in ranked:
+                if math.isnan(latitude[i]):
+                    raise ValueError(
+                        f"{cols[i]['Team Database ID']} does not have a "
+                        f"Latitude."
+                    )
+                candidates.append((i, pri, rank_pri, latitude[i]))
+        chosen = optimize_orbit(
+            candidates, observations, exclude.get_half_width
+        )
+
+    for pri, ranked in groups:
+        if pri < 0:
+            for i, _ in ranked:
+                new_records.append(ptf.COWRecord(cols[i]))
+                new_rows.append((i, pri))
+                if trace is not None:
+                    trace({
+                        "id": cols[i]["Team Database ID"],
+                        "orbit": orbit,
+                        "reason": "negative",
+                        "priority": pri,
+                        "latitude": latitude[i],
+                        "intervals": exclude.intervals,
+                    })
+            continue
+
+        for i, rank_pri in ranked:
+            r = ptf.COWRecord(cols[i])
+            lat = latitude[i]
+            if math.isnan(lat):
+                raise ValueError(
+                    f"{r['Team Database ID']} does not have a Latitude."
+                )
+            cur_pri = rank_pri
+            if trace is not None:
+                tested = exclude.intervals
+
+            if optimize:
+                keep = i in chosen
+            else:
+                keep = obs_count < observations and not exclude.is_in(lat)
+
+            if keep:
+                exclude.add(lat, cur_pri)
+                obs_count += 1
+                r["Request Priority"] = pri
+                cur_pri = pri
+                kept = True
+                reason = "kept"
+            else:
+                kept = False
+                if (
+                    high_alt is not None and
+                    abs(lat) > 65 and
+                    len(r["Orbit Alternatives"].split()) > 3
+                ):
+                    ha_pri = pri if high_alt < 0 else high_alt
+                    r["Request Priority"] = ha_pri
+                    cur_pri = ha_pri
+                    if info:
+                        logger.info(
+                            "%s would have been observation #%s in orbit "
+                            "%s or would have been excluded on the basis of "
+                            "existing intervals %s, but was higher than 65 "
+                            "latitude and had more than 3 Alternative "
+                            "orbits.",
+                            r["Team Database ID"], observations, orbit,
+                            exclude.intervals
+                        )
+                    kept = True
+                    reason = "high_alt"
+
+                if(
+                    high_roll is not None and
+                    abs_roll(i) < 5.0
                 ):
-                    recs = list(pri_g)
-                    if pri < 0:
-                        new_records += recs
-                        continue
-                    if len(recs) != 1:
-                        # need to prioritize these by latitude
-                        recs = pr.priority_rewrite(recs, keepzero=True)
-
-                    for r in sorted(
-                        recs, key=lambda x: int(x["Request Priority"]), reverse=True
-                    ):
-                        if obs_count < observations and not exclude.is_in(
-                            r["Latitude"]
+                    for nr, (j, nr_pri) in zip(new_records, new_rows):
+                        if (
+                            nr_pri > 0 and
+                            abs(lat - latitude[j]) < 5.0 and
+                            not high_roll_exclude.is_in(lat) and
+                            abs_roll(j) > high_roll
                         ):
-                            exclude.add(r["Latitude"], int(r["Request Priority"]))
-                            obs_count += 1
+                            high_roll_exclude.add(lat, cur_pri)
+                            profiling.count("high roll intervals added")
                             r["Request Priority"] = pri
-                        else:
-                            kept = False
-                            if (
-                                high_alt is not None and
-                                abs(float(r["Latitude"])) > 65 and
-                                len(r["Orbit Alternatives"].split()) > 3
-                            ):
-                                ha_pri = pri if high_alt < 0 else high_alt
-                                r["Request Priority"] = ha_pri
+                            cur_pri = pri
+                            if info:
                                 logger.info(
-                                    f"{r['Team Database ID']} would have been "
-                                    f"observation #{observations} in orbit "
-                                    f"{orbit} or would have been excluded on "
-                                    f"the basis of existing intervals "
-                                    f"{exclude}, but was higher than 65 "
-                                    f"latitude and had more than 3 Alternative "
-                                    f"orbits."
+                                    "%s would have been deprioritized in "
+                                    "orbit %s, but has a similar latitude as "
+                                    "a prioritized observation (%s) with a "
+                                    "high roll (> %s).",
+                                    r["Team Database ID"], orbit,
+                                    nr["Team Database ID"], high_roll
                                 )
-                                kept = True
-
-                            if(
-                                high_roll is not None and
-                                abs(float(r["Roll Angle"])) < 5.0
-                            ):
-                                for nr in new_records:
-                                    if (
-                                        int(nr["Request Priority"]) > 0 and
-                                        abs(
-                                            float(r["Latitude"]) -
-                                            float(nr["Latitude"])
-                                        ) < 5.0 and
-                                        not high_roll_exclude.is_in(
-                                            r["Latitude"]
-                                        ) and
-                                        abs(float(nr["Roll Angle"])) > high_roll
-                                    ):
-                                        high_roll_exclude.add(
-                                            r["Latitude"],
-                                            int(r["Request Priority"])
-                                        )
-                                        r["Request Priority"] = pri
-                                        logger.info(
-                                            f"{r['Team Database ID']} would "
-                                            f"have been deprioritized in orbit "
-                                            f"{orbit}, but has a similar "
-                                            f"latitude as a prioritized "
-                                            f"observation "
-                                            f"({nr['Team Database ID']}) with "
-                                            f"a high roll (> {high_roll})."
-                                        )
-                                        kept = True
-                                        break
-
-                            if not kept:
-                                r["Request Priority"] = -1 * pri
-                                if obs_count >= observations:
-                                    logger.info(
-                                        f"{r['Team Database ID']} would have been "
-                                        f"observation #{observations} in orbit "
-                                        f"{orbit} and was given priority "
-                                        f"{r['Request Priority']}."
-                                    )
-                                else:
-                                    logger.info(
-                                        f"{r['Team Database ID']} (latitude: "
-                                        f"{r['Latitude']}) is in the intervals "
-                                        f"{exclude} in orbit "
-                                        f"{orbit}, priority: "
-                                        f"{r['Request Priority']}."
-                                    )
-
-                                if r["Spare 4"].startswith("SPORC"):
-                                    # If we're knocking out one half of a SPORC,
-                                    # that needs to remove the other half, which
-                                    # could have a ripple in this process, so we
-                                    # need to interrupt
-                                    raise SPORCError(
-                                        (
-                                            f"{r['Team Database ID']} is a SPORC that "
-                                            f"could not be acquired"
-                                        ),
-                                        rec=r
-                                    )
-
-                        new_records.append(r)
-
-                out_records += new_records
-
-            return out_records
+                            kept = True
+                            reason = "high_roll"
+                            break
 
-        except SPORCError as err:
-            spnum, other_half = (err.record["Spare 4"].split()[0]).split(":")
-            logger.info(
-                f"{r['Team Database ID']} is part of {spnum}"
-            )
-            for i, r in enumerate(records):
-                if int(r["Request Priority"]) > 0 and (
-                    r["Team Database ID"] == err.record["Team Database ID"] or
-                    r["Team Database ID"] == other_half
+                if not kept:
+                    r["Request Priority"] = -1 * pri
+                    cur_pri = -1 * pri
+                    if obs_count >= observations:
+                        reason = "per_orbit"
+                        if info:
+                            logger.info(
+                                "%s would have been observation #%s in "
+                                "orbit %s and was given priority %s.",
+                                r["Team Database ID"], observations, orbit,
+                                cur_pri
+                            )
+                    elif not optimize or exclude.is_in(lat):
+                        reason = "excluded"
+                        if info:
+                            logger.info(
+                                "%s (latitude: %s) is in the intervals %s "
+                                "in orbit %s, priority: %s.",
+                                r["Team Database ID"], r["Latitude"],
+                                exclude.intervals, orbit, cur_pri
+                            )
+                    else:
+                        reason = "optimized"
+                        if info:
+                            logger.info(
+                                "%s (latitude: %s) would exclude observations "
+                                "that make a better set in orbit %s, "
+                                "priority: %s.",
+                                r["Team Database ID"], r["Latitude"], orbit,
+                                cur_pri
+                            )
+
+            if trace is not None:
+                trace({
+                    "id": r["Team Database ID"],
+                    "orbit": orbit,
+                    "reason": reason,
+                    "priority": cur_pri,
+                    "latitude": lat,
+                    "intervals": tested,
+                })
+
+            if (
+                not kept and
+                r["Spare 4"].startswith("SPORC") and
+                (pri > 0 or r["Team Database ID"] not in zero_sporcs)
+            ):
+                # If we're knocking out one half of a SPORC,
+                # that needs to remove the other half, which
+                # could have a ripple in this process, so we
+                # need to interrupt
+                raise SPORCError(
+                    (
+                        f"{r['Team Database ID']} is a SPORC that "
+                        f"could not be acquired"
+                    ),
+                    rec=r
+                )
+
+            new_records.append(r)
+            new_rows.append((i, cur_pri))
+
+    if profiling.enabled:
+        profiling.count("orbits prioritized")
+        profiling.count("intervals added", obs_count)
+        profiling.count(
+            "intervals merged", obs_count - len(exclude.intervals)
+        )
+
+    return new_records
+
+
+def optimize_orbit(candidates, observations: int, half_width) -> set:
+    """Returns the set of rows of the best selection of at most
+    *observations* of the *candidates*, which are (row, priority, rank
+    priority, latitude) four-tuples.
+
+    No two observations in a selection may be closer in latitude than,
+    or as close as, the larger of their half-widths, which the
+    *half_width* function gives for a rank priority.  Selections are
+    compared by the number of observations with the highest priority,
+    then by the number with the next highest, and so on, so that no
+    number of lower-priority observations is worth one of a higher
+    priority, and then by having the smallest total absolute latitude.
+
+    Since the half-widths never shrink as priority goes up (HalfWidths
+    makes sure of that), the greedy approach's choices for the same
+    candidates are always one of the possible selections, so this is
+    never worse by that measure, and can keep more observations, when a
+    lower-latitude observation that would be picked first would exclude
+    two others of the same priority.  This is only so for one orbit,
+    though, a SPORC half left out here takes its partner out of another
+    orbit, so over many orbits, the result may not be better.
+
+    This is a dynamic program over the candidates sorted by latitude.
+    Because every observation's exclusion zone is centered on it, a
+    selection is allowed if each pair that are next to each other in
+    latitude are far enough apart, so each candidate's best selection
+    of a given size that ends with it is built on the best of one fewer
+    that ends with an allowed candidate below it.
+    """
+    if observations < 1 or not candidates:
+        return set()
+
+    # Each priority's weight is larger than any number of lower
+    # priority observations that could be kept with it.
+    base = observations + 1
+    levels = {
+        p: base ** n
+        for n, p in enumerate(sorted(set(c[1] for c in candidates)))
+    }
+
+    items = sorted(candidates, key=lambda c: (c[3], c[0]))
+    lats = [c[3] for c in items]
+    widths = [half_width(c[2]) for c in items]
+    values = [(levels[c[1]], -abs(c[3])) for c in items]
+
+    # best[k][j] is the value of the best selection of k + 1 items whose
+    # highest-latitude item is items[j], and back[k][j] the index of the
+    # item before it.
+    best = [[None] * len(items) for _ in range(observations)]
+    back = [[None] * len(items) for _ in range(observations)]
+    top = None
+    for j in range(len(items)):
+        best[0][j] = values[j]
+        for k in range(1, observations):
+            for i in range(j):
+                prev = best[k - 1][i]
+                if (
+                    prev is not None and
+                    lats[j] - lats[i] > max(widths[i], widths[j])
                 ):
-                    r["Request Priority"] = -1 * int(r["Request Priority"])
-                    logger.info(
-                        f"{r['Team Database ID']} is {spnum} and was given "
-                        f"priority {r['Request Priority']}."
-                    )
-                    records[i] = r
+                    v = (prev[0] + values[j][0], prev[1] + values[j][1])
+                    if best[k][j] is None or v > best[k][j]:
+                        best[k][j] = v
+                        back[k][j] = i
+        for k in range(observations):
+            if best[k][j] is not None and (top is None or best[k][j] > top[0]):
+                top = (best[k][j], k, j)
 
-            logger.info(
-                "Re-prioritizing from the top with this now-missing SPORC."
-            )
+    chosen = set()
+    _, k, j = top
+    while j is not None:
+        chosen.add(items[j][0])
+        j = back[k][j]
+        k -= 1
+    return chosen
 
 
 if __name__ == "__main__":
@@ -23,13 +23,20 @@ import collections
 import getpass
 import io
 import logging
+import math
 import os
+from array import array
 from datetime import datetime
 
+import cippd_client
+import profiling
 import ptf
+import ptf_cache
 
 
 def main():
+    cippd_client.forward('priority_rewrite')
+
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('-o', '--output', required=False)
     parser.add_argument('-r', '--reset', required=False, help='A set of '
@@ -42,8 +49,10 @@ def main():
                         action='store_true', help='Perform the rearranging '
                         'but do not write out results.')
     parser.add_argument('in_file', help="a .ptf or .csv file")
+    profiling.add_arguments(parser)
 
     args = parser.parse_args()
+    profiling.start(args)
 
     logging.basicConfig(format='%(levelname)s: %(message)s')
 
@@ -61,12 +70,19 @@ def main():
             print(out_str)
 
 
+@profiling.timed('rewrite')
 def priority_rewrite(records, reset_str=None, keepzero=False) -> list:
     '''Rewrites identical priorities based on Latitude.
+
+       *records* may be any sequence of records, a PTF, or a
+       ptf.ColumnarPTF.
     '''
-    count = collections.Counter()
-    for r in records:
-        count[int(r['Request Priority'])] += 1
+    cols = ptf.columns(records)
+    if ptf.MISSING in cols.priority:
+        raise ValueError('A record does not have an integer Request Priority.')
+
+    buckets = bucket_by_priority(cols.priority)
+    count = collections.Counter({p: len(b) for (p, b) in buckets.items()})
 
     reset = make_reset_dict(reset_str, count)
 
@@ -77,6 +93,9 @@ def priority_rewrite(records, reset_str=None, keepzero=False) -> list:
 
     ordered_p = sort_and_filter(count.keys(), keepzero)
 
+    unreset = {v: k for (k, v) in reset.items()}
+    abs_lat = array('d', map(abs, cols.latitude))
+
     new_records = list()
     for i, pri in enumerate(ordered_p):
         try:
@@ -84,13 +103,24 @@ def priority_rewrite(records, reset_str=None, keepzero=False) -> list:
         except IndexError:
             next_pri = None
 
-        pri_records = get_records_for_this_priority(pri, records, reset)
-        pri_records.sort(key=lambda x: abs(float(x['Latitude'])), reverse=True)
+        pri_rows = buckets.get(unreset.get(pri, pri), list())
+        if len(pri_rows) > 1:
+            # Only the Latitudes of records that are put in order need
+            # to be numbers.
+            for row in pri_rows:
+                if math.isnan(abs_lat[row]):
+                    raise ValueError(
+                        'The record with Team Database ID {} and Request '
+                        'Priority {} does not have a numeric Latitude: '
+                        '{!r}'.format(cols[row].get('Team Database ID'),
+                                      pri, cols[row].get('Latitude'))
+                    )
+            pri_rows.sort(key=abs_lat.__getitem__, reverse=True)
 
         if is_enough_space(pri, next_pri, count[pri]):
-            for j, r in enumerate(pri_records):
-                r['Request Priority'] = pri + j
-                new_records.append(r)
+            for j, row in enumerate(pri_rows):
+                cols.set_priority(row, pri + j)
+                new_records.append(cols[row])
         else:
             logging.warning('Starting at {} we need {} spots, but the next '
                             'priority is {}.'.format(pri,
@@ -98,8 +128,8 @@ def priority_rewrite(records, reset_str=None, keepzero=False) -> list:
                                                      next_pri))
             logging.warning('\tLeaving these {} as identical priority '
                             '{}.'.format(count[pri], pri))
-            for r in pri_records:
-                new_records.append(r)
+            for row in pri_rows:
+                new_records.append(cols[row])
     return new_records
 
 
@@ -123,15 +153,28 @@ def sort_and_filter(iterable, keepzero=False) -> list:
         return sorted(filter(lambda x: x > 0, iterable))
 
 
+def bucket_by_priority(priorities) -> dict:
+    '''Returns a dict whose keys are the distinct values in *priorities*,
+       and whose values are lists of the indices where they occur.'''
+    buckets = dict()
+    for i, p in enumerate(priorities):
+        try:
+            buckets[p].append(i)
+        except KeyError:
+            buckets[p] = [i]
+    return buckets
+
+
 def get_records_for_this_priority(pri: int, records: list, reset: dict) -> list:
-    out_records = list()
+    '''Returns a list of the *records* whose Request Priority is *pri*,
+       or the priority that *reset* maps to *pri*, by way of
+       bucket_by_priority().'''
     if pri in reset.values():
         for (k, v) in reset.items():
             if pri == v:
                 pri = k
-    out_records = list(filter(lambda x: int(x['Request Priority']) == pri,
-                              records))
-    return out_records
+    buckets = bucket_by_priority(int(r['Request Priority']) for r in records)
+    return [records[i] for i in buckets.get(pri, ())]
 
 
 def is_enough_space(priority: int, next_priority: int, span: int) -> bool:
@@ -143,21 +186,73 @@ def is_enough_space(priority: int, next_priority: int, span: int) -> bool:
         return False
 
 
+@profiling.timed('read')
 def get_input(p: os.PathLike) -> collections.abc.Sequence:
-    seq = list()
+    '''Returns a PTF read from *p*, or if it isn't a PTF, a list of
+       PTFDicts of the rows of the CSV file.  Like ptf.load(), this uses
+       the cache, if it is turned on (see ptf_cache).'''
+    seq, err = ptf_cache.cached(
+        p, 'input', _parse_input, _pack_input, _unpack_input
+    )
+    if err is not None:
+        print(err)
+    return seq
+
+
+def _parse_input(data: bytes) -> tuple:
+    # Returns the sequence of records, and the error message from
+    # trying to read it as a PTF, if it is a CSV file.
+    text = ptf.decode(data)
     try:
-        seq = ptf.load(p)
+        return ptf.loads(text.lstrip(u'\ufeff')), None
+    except ValueError as err:
+        with io.StringIO(text, newline='') as csvfile:
+            fieldnames = next(csv.reader(csvfile), None)
+            if fieldnames is None:
+                return list(), str(err)
+            seq = list(ptf.read_rows(csvfile, fieldnames))
+        return seq, str(err)
+
+
+def _pack_input(parsed: tuple) -> tuple:
+    seq, err = parsed
+    if err is None:
+        return ptf.pack(seq), None
+    return ptf.pack_records(seq), err
+
+
+def _unpack_input(packed: tuple) -> tuple:
+    parts, err = packed
+    if err is None:
+        return ptf.unpack(parts), None
+    return ptf.unpack_records(parts), err
+
+
+def iter_input(p: os.PathLike) -> collections.abc.Iterable:
+    '''Like get_input(), but the records are read lazily, one at a time,
+       as the returned iterable is iterated over.
+
+       If ptf_cache.memory is set, this is just get_input(), so that a
+       long-running process (like the cippd server) only parses each
+       file once.'''
+    if ptf_cache.memory is not None:
+        return get_input(p)
+    try:
+        return ptf.iterload(p)
     except ValueError as err:
         print(err)
-        with open(p) as csvfile:
-            reader = csv.DictReader(csvfile)
-            seq = list()
-            for row in reader:
-                seq.append(ptf.PTFDict(row))
+        return _iter_csv(p)
 
-    return seq
+
+def _iter_csv(p: os.PathLike):
+    encoding = ptf.guess_encoding(p)
+    with open(p, 'rb') as csvfile:
+        reader = csv.DictReader(ptf.decode_lines(csvfile, encoding))
+        for row in reader:
+            yield ptf.PTFDict(row)
 
 
+@profiling.timed('write')
 def write_output(seq, records, output=None) -> str:
     out_string = None
     fieldnames = list()
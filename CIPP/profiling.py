@@ -0,0 +1,264 @@
+"""Optional profiling of where the CIPP programs spend their time.
+
+Each of the programs takes a --profile option, and setting the
+CIPP_PROFILE environment variable to 1 does the same for all of them.
+When it is on, the time spent in each stage of the work (decoding,
+parsing, grouping by orbit, prioritizing, writing, and so on), the most
+memory that Python had allocated during each stage (from tracemalloc),
+and counts of things like the records parsed and SPORC restarts are
+gathered, and a table of them is printed to standard error when the
+program ends.
+
+If --profile_output (or CIPP_PROFILE) is the name of a file that ends
+in .json, all of that is also written to it as JSON, and if it is the
+name of any other file, the program is also run under cProfile, and
+its statistics are written there, for the pstats module to read.
+
+Tracing memory slows Python down, so the times are best compared with
+each other, rather than with an unprofiled run.  When profiling is off,
+which it is unless asked for, none of this is done, and the stages and
+counters cost no more than a function call.
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Whether profiling is on, which code that would do extra work to
+# count something can check first.
+enabled = False
+
+# The number of times each named thing has happened.
+counters = collections.Counter()
+
+# For each stage name, a list of the number of times it ran, the total
+# seconds it took, and the most bytes allocated while it ran.
+stages = dict()
+
+_stack = list()
+_null = contextlib.nullcontext()
+_output = None
+_profiler = None
+_start = None
+_peak = 0
+
+
+def add_arguments(parser):
+    """Adds the --profile and --profile_output options to the argparse
+    *parser*.
+    """
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report the time and memory that each stage of the work took "
+             "to standard error.  Setting CIPP_PROFILE=1 does the same.",
+    )
+    parser.add_argument(
+        "--profile_output", "--profile-output",
+        metavar="FILE",
+        help="Implies --profile, and also writes the report to FILE as "
+             "JSON, if it ends in .json, or else writes cProfile "
+             "statistics to it.",
+    )
+
+
+def start(args=None):
+    """Turns profiling on if the --profile or --profile_output options
+    in the argparse *args* were given, or the CIPP_PROFILE environment
+    variable is set, and returns whether it is on.
+
+    The report is made when the program exits, or stop() is called.
+    """
+    global enabled, _output, _profiler, _start, _peak
+
+    output = getattr(args, "profile_output", None)
+    if output is None and not getattr(args, "profile", False):
+        value = os.environ.get("CIPP_PROFILE", "").strip()
+        if value.casefold() in ("", "0", "no", "off", "false"):
+            return enabled
+        if value.casefold() not in ("1", "yes", "on", "true"):
+            output = value
+
+    if enabled:
+        return True
+    enabled = True
+    _output = output
+    counters.clear()
+    stages.clear()
+    _peak = 0
+
+    tracemalloc.start()
+    if _output is not None and not _output.endswith(".json"):
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    _start = time.perf_counter()
+    atexit.register(stop)
+    return True
+
+
+def stop(file=None):
+    """Turns profiling off, and prints the report to *file* (standard
+    error by default), and writes it to the output file, if there is
+    one.
+    """
+    global enabled, _profiler
+
+    if not enabled:
+        return
+    total = time.perf_counter() - _start
+    if _profiler is not None:
+        _profiler.disable()
+    peak = max(_peak, _traced_peak())
+    tracemalloc.stop()
+    enabled = False
+    atexit.unregister(stop)
+
+    r = report(total, peak)
+    print("\n".join(format_report(r)), file=file or sys.stderr)
+    if _output is not None:
+        if _profiler is None:
+            with open(_output, "w") as f:
+                json.dump(r, f, indent=2)
+        else:
+            _profiler.dump_stats(_output)
+    _profiler = None
+
+
+def count(name: str, n=1):
+    """Adds *n* to the counter called *name*, if profiling is on."""
+    if enabled:
+        counters[name] += n
+
+
+def stage(name: str):
+    """Returns a context manager that times the work done within it as
+    part of the stage called *name*, if profiling is on.
+
+    Stages may be nested, in which case the time spent in the inner
+    stage is also counted in the outer one.
+    """
+    if not enabled:
+        return _null
+    return _Stage(name)
+
+
+def timed(name: str):
+    """A decorator which makes every call of the function a run of the
+    stage called *name*.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def report(total: float, peak: int) -> dict:
+    """Returns a dict of the *total* seconds, the *peak* bytes, and the
+    stages and counters so far, which can be written as JSON.
+    """
+    return {
+        "seconds": total,
+        "peak_bytes": peak,
+        "stages": {
+            k: {"calls": v[0], "seconds": v[1], "peak_bytes": v[2]}
+            for k, v in stages.items()
+        },
+        "counters": dict(counters),
+    }
+
+
+def format_report(r: dict) -> list:
+    """Returns a list of the lines of a table of the report *r*."""
+    lines = [
+        f"{'Stage':<24} {'Calls':>7} {'Seconds':>9} {'%':>6} {'Peak MB':>9}"
+    ]
+    for name, s in sorted(
+        r["stages"].items(), key=lambda x: x[1]["seconds"], reverse=True
+    ):
+        percent = 100 * s["seconds"] / r["seconds"] if r["seconds"] else 0
+        lines.append(
+            f"{name:<24} {s['calls']:>7} {s['seconds']:>9.4f} "
+            f"{percent:>6.1f} {s['peak_bytes'] / 1e6:>9.1f}"
+        )
+    lines.append(
+        f"{'Total':<24} {'':>7} {r['seconds']:>9.4f} {'':>6} "
+        f"{r['peak_bytes'] / 1e6:>9.1f}"
+    )
+    if r["counters"]:
+        lines.append("")
+        lines.append(f"{'Counter':<32} {'Count':>17}")
+        for name, n in sorted(r["counters"].items()):
+            lines.append(f"{name:<32} {n:>17}")
+    return lines
+
+
+class _Stage(object):
+    # The peak of traced memory is reset at the start of each stage, so
+    # the peak that a stage saw is handed on to the stage it is within.
+
+    __slots__ = ("name", "peak", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.peak = 0
+
+    def __enter__(self):
+        if _stack:
+            _stack[-1].peak = max(_stack[-1].peak, _traced_peak())
+        _reset_peak()
+        _stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        _stack.pop()
+        self.peak = max(self.peak, _traced_peak())
+        if _stack:
+            _stack[-1].peak = max(_stack[-1].peak, self.peak)
+
+        s = stages.setdefault(self.name, [0, 0.0, 0])
+        s[0] += 1
+        s[1] += seconds
+        s[2] = max(s[2], self.peak)
+
+
+def _traced_peak() -> int:
+    return tracemalloc.get_traced_memory()[1]
+
+
+def _reset_peak():
+    # tracemalloc.reset_peak() is new in Python 3.9, without it, the
+    # peak of each stage is the peak so far.  The overall peak is kept
+    # before it is reset.
+    global _peak
+    _peak = max(_peak, _traced_peak())
+    reset = getattr(tracemalloc, "reset_peak", None)
+    if reset is not None:
+        reset()
@@ -15,13 +15,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import codecs
 import collections.abc
 import copy
 import csv
+import functools
 import io
+import itertools
+import locale
+import marshal
+import math
+import mmap
 import os
+import zlib
 
-from collections import Counter, UserDict
+from array import array
+from collections import UserDict
+
+import profiling
+import ptf_cache
 
 
 header_order = ('FILE_TYPE', 'START_TIME', 'STOP_TIME', 'USERNAME',
@@ -42,15 +54,326 @@ fieldnames = ('Instrument Set', 'Predict Time', 'Latitude', 'Longitude',
 
 
 class PTFDict(UserDict):
-    """Provides a case-independent dict."""
+    """Provides a case-independent dict.
+
+       The *generation* attribute of a PTFDict counts the changes that
+       have been made to it (but not its making), so that cached
+       information about records, like a PTF's columns(), can tell
+       whether it is out of date.
+    """
+
+    # Each PTFDict only gets a generation of its own when it is first
+    # changed.
+    generation = 0
+
+    def __init__(self, *args, **kwargs):
+        # Maps the casefolded version of each key to the first key
+        # (in insertion order) that folds to it.
+        self._folded = dict()
+        self.data = dict(*args, **kwargs)
+        for k in self.data:
+            self._folded.setdefault(_fold(k), k)
+
+    def __getitem__(self, key):
+        if key in self.data:
+            return self.data[key]
+        return self.__missing__(key)
+
+    @classmethod
+    def _from_dict(cls, data: dict, folded: dict):
+        # Makes a PTFDict around the *data* dict itself (not a copy),
+        # and the *folded* map of its keys, which may be shared between
+        # records with the same keys, since it is copied before it is
+        # ever changed.
+        new = cls.__new__(cls)
+        new.data = data
+        new._folded = folded
+        return new
+
+    def __setitem__(self, key, value):
+        if key not in self.data:
+            folded = _fold(key)
+            if folded not in self._folded:
+                self._folded = dict(self._folded)
+                self._folded[folded] = key
+        self.data[key] = value
+        self.generation += 1
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.generation += 1
+        folded = _fold(key)
+        if self._folded.get(folded) == key:
+            self._folded = dict(self._folded)
+            del self._folded[folded]
+            for k in self.data:
+                if _fold(k) == folded:
+                    self._folded[folded] = k
+                    break
+
+    def __missing__(self, key):
+        try:
+            return self.data[self._folded[_fold(key)]]
+        except KeyError:
+            raise KeyError(f"{key} could not be found.") from None
+
+    def __copy__(self):
+        inst = self.__class__.__new__(self.__class__)
+        inst.__dict__.update(self.__dict__)
+        inst.data = self.data.copy()
+        inst._folded = self._folded.copy()
+        return inst
+
+
+def _fold(key):
+    return key.casefold() if isinstance(key, str) else key
+
+
+def _folded_map(keys) -> dict:
+    # The map of folded keys that a PTFDict with these *keys* has.
+    folded = dict()
+    for k in keys:
+        folded.setdefault(_fold(k), k)
+    return folded
+
+
+# Marks a field that has been deleted from a PTFRecord.
+_ABSENT = object()
+
+
+class PTFRecord(collections.abc.MutableMapping):
+    """A compact, case-independent PTF record.
+
+       It can be used just like a PTFDict, but rather than a dict of its
+       own, it only holds a list of its values, in the order of a set of
+       keys which is shared by all of the records read from the same
+       PTF, along with the maps from those keys (and their casefolded
+       forms) to positions in the list.  That takes less than half of
+       the memory of a PTFDict.  Any key that isn't one of the shared
+       keys is held in a dict of this record's own.
+
+       Changing a PTFRecord increments its *generation*, just like
+       changing a PTFDict does.  See the *compact* argument of load().
+    """
+
+    __slots__ = ('_schema', '_values', '_extra', 'generation')
+
+    def __init__(self, *args, **kwargs):
+        data = dict(*args, **kwargs)
+        self._schema = _Schema(data)
+        self._values = list(data.values())
+        self._extra = None
+        self.generation = 0
+
+    @classmethod
+    def _from_values(cls, values: list, schema):
+        # Makes a PTFRecord around the *values* list itself (not a
+        # copy), whose keys are those of the shared *schema*.
+        new = cls.__new__(cls)
+        new._schema = schema
+        new._values = values
+        new._extra = None
+        new.generation = 0
+        return new
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, dict(self))
+
+    def __getitem__(self, key):
+        i = self._schema.index.get(key)
+        if i is not None:
+            value = self._values[i]
+            if value is not _ABSENT:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        return self.__missing__(key)
 
     def __missing__(self, key):
+        folded = _fold(key)
+        schema = self._schema
+        k = schema.folded.get(folded)
+        if k is not None:
+            value = self._values[schema.index[k]]
+            if value is not _ABSENT:
+                return value
+            for k, value in zip(schema.keys, self._values):
+                if value is not _ABSENT and _fold(k) == folded:
+                    return value
+        if self._extra is not None:
+            for k, value in self._extra.items():
+                if _fold(k) == folded:
+                    return value
+        raise KeyError(f"{key} could not be found.")
+
+    def __contains__(self, key):
+        # Like a PTFDict, only exact keys are in it.
+        i = self._schema.index.get(key)
+        if i is not None and self._values[i] is not _ABSENT:
+            return True
+        return self._extra is not None and key in self._extra
+
+    def __setitem__(self, key, value):
+        i = self._schema.index.get(key)
+        if i is None:
+            if self._extra is None:
+                self._extra = dict()
+            self._extra[key] = value
+        else:
+            self._values[i] = value
+        self.generation += 1
 
-        for k in self.data.keys():
-            if key.casefold() == k.casefold():
-                return self.data[k]
+    def __delitem__(self, key):
+        i = self._schema.index.get(key)
+        if i is not None and self._values[i] is not _ABSENT:
+            self._values[i] = _ABSENT
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
         else:
-            raise KeyError(f"{key} could not be found.")
+            raise KeyError(key)
+        self.generation += 1
+
+    def __iter__(self):
+        for k, value in zip(self._schema.keys, self._values):
+            if value is not _ABSENT:
+                yield k
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        n = len(self._values) - self._values.count(_ABSENT)
+        if self._extra is not None:
+            n += len(self._extra)
+        return n
+
+    def __copy__(self):
+        new = self._from_values(self._values[:], self._schema)
+        if self._extra is not None:
+            new._extra = dict(self._extra)
+        return new
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    @property
+    def _folded(self):
+        # The map of folded keys to the keys they came from, which a
+        # COWRecord looks in.
+        if self._extra is None and _ABSENT not in self._values:
+            return self._schema.folded
+        return _folded_map(self)
+
+
+class _Schema(object):
+    # The keys of a set of PTFRecords, without duplicates, and the maps
+    # from each key, and from the folded form of each key, to its
+    # position.
+
+    __slots__ = ('keys', 'index', 'folded')
+
+    def __init__(self, keys):
+        self.keys = tuple(dict.fromkeys(keys))
+        self.index = {k: i for i, k in enumerate(self.keys)}
+        self.folded = _folded_map(self.keys)
+
+
+class COWRecord(collections.abc.MutableMapping):
+    """A copy-on-write view of a PTF record.
+
+       Reading a field gives the value from the wrapped *record*, until
+       that field is set (or deleted) on this object.  Only the changed
+       fields are held here, and the wrapped record is never modified,
+       so an algorithm that just rewrites the Request Priority of each
+       record doesn't have to copy the other thirty fields.
+
+       Like a PTFDict, keys may be given in any case, but ``in`` only
+       finds a key in the case it was given, and changing a COWRecord
+       increments its own *generation* (not that of the wrapped record).
+    """
+
+    __slots__ = ('record', '_changes', '_deleted', 'generation')
+
+    def __init__(self, record):
+        self.record = record
+        self._changes = None
+        self._deleted = None
+        self.generation = 0
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, dict(self))
+
+    def __getitem__(self, key):
+        changes = self._changes
+        if changes is not None and key in changes:
+            return changes[key]
+        deleted = self._deleted
+        if key in self.record and (deleted is None or key not in deleted):
+            return self.record[key]
+
+        # Not an exact match, so try the key's casefolded form, in the
+        # wrapped record first, and then in any new keys.
+        folded = _fold(key)
+        k = getattr(self.record, '_folded', {}).get(folded)
+        if k is not None and (deleted is None or k not in deleted):
+            if changes is not None and k in changes:
+                return changes[k]
+            return self.record[k]
+        if changes is not None:
+            for k, v in changes.items():
+                if _fold(k) == folded:
+                    return v
+        raise KeyError(f"{key} could not be found.")
+
+    def __contains__(self, key):
+        changes = self._changes
+        if changes is not None and key in changes:
+            return True
+        deleted = self._deleted
+        return key in self.record and (deleted is None or key not in deleted)
+
+    def __setitem__(self, key, value):
+        if self._changes is None:
+            self._changes = dict()
+        self._changes[key] = value
+        if self._deleted is not None:
+            self._deleted.discard(key)
+        self.generation += 1
+
+    def __delitem__(self, key):
+        changes = self._changes
+        in_record = key in self.record and (
+            self._deleted is None or key not in self._deleted
+        )
+        if changes is not None and key in changes:
+            del changes[key]
+        elif not in_record:
+            raise KeyError(key)
+        if in_record:
+            if self._deleted is None:
+                self._deleted = set()
+            self._deleted.add(key)
+        self.generation += 1
+
+    def __iter__(self):
+        deleted = self._deleted or ()
+        for k in self.record:
+            if k not in deleted:
+                yield k
+        if self._changes is not None:
+            for k in self._changes:
+                if k not in self.record or k in deleted:
+                    yield k
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __copy__(self):
+        new = type(self)(self.record)
+        if self._changes is not None:
+            new._changes = dict(self._changes)
+        if self._deleted is not None:
+            new._deleted = set(self._deleted)
+        return new
 
 
 class PTF(collections.abc.Sequence):
@@ -71,6 +394,7 @@ class PTF(collections.abc.Sequence):
         self.comments = None
         self.fieldnames = list()
         self.ptf_recs = list()
+        self._columns = None
         if len(args) == 1:
             (self.dictionary,
              self.comments,
@@ -103,8 +427,13 @@ class PTF(collections.abc.Sequence):
 
     def __getitem__(self, key):
         if isinstance(key, slice):
-            sliced = copy.deepcopy(self)
-            sliced.ptf_recs = sliced.ptf_recs[key]
+            # Only the header and the selected records are copied, and
+            # the records only shallowly, since their values are strings.
+            sliced = copy.copy(self)
+            sliced.dictionary = copy.deepcopy(self.dictionary)
+            sliced.fieldnames = copy.copy(self.fieldnames)
+            sliced.ptf_recs = [copy.copy(r) for r in self.ptf_recs[key]]
+            sliced._columns = None
             return sliced
         else:
             try:
@@ -115,6 +444,7 @@ class PTF(collections.abc.Sequence):
     def __setitem__(self, key, value):
         if isinstance(key, slice):
             self.ptf_recs[key] = value
+            self._columns = None
         else:
             self.dictionary[key] = value
         return
@@ -139,15 +469,53 @@ class PTF(collections.abc.Sequence):
         '''Gets the values from the initial portion of the ptf file.'''
         return self.dictionary.values()
 
+    def columns(self):
+        '''Returns a ColumnarPTF view of this PTF's records.
+
+           The ColumnarPTF (and so its columns and orbit_index) is kept
+           and given again on later calls, unless the records have been
+           changed by anything other than its set_priority().
+        '''
+        cols = self._columns
+        if cols is None or not cols.is_current(self.ptf_recs):
+            cols = ColumnarPTF(self.ptf_recs)
+            self._columns = cols
+        return cols
+
+    def orbit_index(self):
+        '''Returns the OrbitIndex of this PTF's records.'''
+        return self.columns().orbit_index
+
     def dumps(self) -> str:
         s = io.StringIO()
         return(self._dump_it(s).getvalue())
 
     def dump(self, p: os.PathLike) -> None:
         with open(p, mode='w') as f:
-            f.write(self.dumps())
+            self._dump_it(f)
+
+    def dump_iter(self, p: os.PathLike, records) -> None:
+        '''Writes this PTF's header to *p* (a path, or a file opened for
+           writing text), followed by the records from the *records*
+           iterable, rather than this PTF's records.
+
+           The records are written as they come, so *records* can be a
+           generator (like a PTFReader) whose records are never all in
+           memory at once.
+        '''
+        if hasattr(p, 'write'):
+            self._dump_header(p)
+            self._dump_records(p, records)
+        else:
+            with open(p, mode='w') as f:
+                self.dump_iter(f, records)
 
     def _dump_it(self, f: io.TextIOBase) -> io.TextIOBase:
+        self._dump_header(f)
+        self._dump_records(f, self.ptf_recs)
+        return f
+
+    def _dump_header(self, f: io.TextIOBase) -> None:
         for k in header_order[:-2]:
             f.write('# {}: {}\n'.format(k, self[k]))
         if len(self['SPK']) > 0:
@@ -168,17 +536,286 @@ class PTF(collections.abc.Sequence):
         f.write('# ' + ','.join(map(str, list(range(1, len(fieldnames) + 1)))) + '\n')
         # f.write('# ' + ','.join(x.capitalize() for x in fieldnames) + '\n')
         f.write('# ' + ','.join(fieldnames) + '\n')
-        writer = csv.DictWriter(f, fieldnames=fieldnames,
-                                extrasaction='ignore',
-                                restval='')
-        if(Counter(fieldnames) == Counter(self.fieldnames)):
-            for record in self.ptf_recs:
-                writer.writerow(record)
-        else:
-            t = key_translation(fieldnames, self.fieldnames)
-            for record in self.ptf_recs:
-                writer.writerow({t.get(k, k): v for k, v in record.items()})
-        return f
+
+    @profiling.timed('serialize')
+    def _dump_records(self, f: io.TextIOBase, records) -> None:
+        writer = csv.writer(f)
+        writer.writerows(map(self._projection(), records))
+
+    def _projection(self):
+        '''Returns a function that gives the list of a record's values
+           in the order of the PTF fieldnames, with blanks for any that
+           are missing.
+
+           If this PTF's fieldnames only differ from the PTF fieldnames
+           by case, each of a record's keys is matched to a column
+           without regard to case, and if a record has more than one key
+           for a column (say, 'Request priority' from the file, and
+           'Request Priority' set afterwards), the last one wins.  Which
+           column each key goes in is only worked out once.
+        '''
+        if set(fieldnames) == set(self.fieldnames):
+            def project(record):
+                return [record.get(k, '') for k in fieldnames]
+
+            return project
+
+        index = {_fold(k): i for i, k in enumerate(fieldnames)}
+        columns = dict()
+
+        def project(record):
+            row = [''] * len(fieldnames)
+            for k, v in record.items():
+                i = columns.get(k)
+                if i is None:
+                    i = columns[k] = index.get(_fold(k), -1)
+                if i >= 0:
+                    row[i] = v
+            return row
+
+        return project
+
+
+# The value given to integer columns of a ColumnarPTF when the record's
+# field is blank or can't be converted.  Float columns get NaN instead.
+MISSING = -2 ** 63
+
+
+class ColumnarPTF(collections.abc.Sequence):
+    """A column-oriented view of a sequence of PTF records.
+
+       The numeric fields that the CIPP algorithms sort and compare on
+       are converted once, and held in compact ``array`` columns which
+       are only built the first time they are asked for:
+
+       ============  =======================================
+       orbit         integer part of Orbit Number
+       orbit_suffix  the trailing 'a' or 'd' of Orbit Number
+       priority      Request Priority
+       latitude      Latitude
+       longitude     Longitude
+       roll          Roll Angle
+       volume        Raw Data Volume (summed, if it has
+                     more than one value)
+       ============  =======================================
+
+       Position *i* in every column describes ``records[i]``, and the
+       object behaves like a sequence of those records.  The records
+       themselves are not copied or converted, so writing them back out
+       gives the exact PTF text they were read from.  Any change to a
+       Request Priority should be made with set_priority() so that the
+       record, the priority column, and the orbit_index stay in
+       agreement.
+    """
+
+    def __init__(self, records):
+        if isinstance(records, PTF):
+            records = records.ptf_recs
+        self.records = records
+        self._columns = dict()
+        self._generation = _generation(records)
+        self._length = len(records)
+
+    def is_current(self, records=None) -> bool:
+        '''Returns True if none of the records has been changed since
+           this object was made (other than by set_priority()), and
+           *records* (if given) are the same records it was made from.
+
+           Changes to records that this object doesn't hold, even ones
+           wrapped by the same records or read from the same file, don't
+           make it out of date.
+        '''
+        if records is not None and records is not self.records:
+            return False
+        return (self._length == len(self.records) and
+                self._generation == _generation(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    def __iter__(self):
+        return iter(self.records)
+
+    @property
+    def orbit(self):
+        return self._column('orbit', 'Orbit Number', 'q',
+                            lambda x: int(x[:-1]))
+
+    @property
+    def orbit_suffix(self):
+        try:
+            return self._columns['orbit_suffix']
+        except KeyError:
+            col = [_field(r, 'Orbit Number')[-1:] for r in self.records]
+            self._columns['orbit_suffix'] = col
+            return col
+
+    @property
+    def priority(self):
+        return self._column('priority', 'Request Priority', 'q', int)
+
+    @property
+    def latitude(self):
+        return self._column('latitude', 'Latitude', 'd', float)
+
+    @property
+    def longitude(self):
+        return self._column('longitude', 'Longitude', 'd', float)
+
+    @property
+    def roll(self):
+        return self._column('roll', 'Roll Angle', 'd', float)
+
+    @property
+    def volume(self):
+        return self._column('volume', 'Raw Data Volume', 'd', _sum_floats)
+
+    @property
+    def orbit_index(self):
+        try:
+            return self._columns['orbit_index']
+        except KeyError:
+            with profiling.stage('group by orbit'):
+                index = OrbitIndex(self.orbit, self.priority)
+            self._columns['orbit_index'] = index
+            return index
+
+    def set_priority(self, i: int, priority: int):
+        '''Sets the Request Priority of the *i*th record.'''
+        record = self.records[i]
+        before = getattr(record, 'generation', 0)
+        record['Request Priority'] = priority
+        self._generation += getattr(record, 'generation', 0) - before
+        if 'priority' in self._columns:
+            self._columns['priority'][i] = priority
+        if 'orbit_index' in self._columns:
+            self._columns['orbit_index'].reorder(self.orbit[i])
+
+    def copy(self):
+        '''Returns a ColumnarPTF of shallow copies of the records, with
+           copies of the columns (and orbit_index) that have been built,
+           so that priorities can be set on one without changing the
+           other, and without converting the fields again.'''
+        new = type(self)([copy.copy(r) for r in self.records])
+        for name, col in self._columns.items():
+            if name != 'orbit_index':
+                new._columns[name] = col[:]
+        if 'orbit_index' in self._columns:
+            new._columns['orbit_index'] = self._columns['orbit_index'].copy(
+                new.priority
+            )
+        return new
+
+    def _column(self, name, field, typecode, convert):
+        try:
+            return self._columns[name]
+        except KeyError:
+            bad = MISSING if typecode == 'q' else math.nan
+            col = array(typecode)
+            with profiling.stage('columns'):
+                for r in self.records:
+                    try:
+                        col.append(convert(_field(r, field)))
+                    except (AttributeError, TypeError, ValueError):
+                        col.append(bad)
+            self._columns[name] = col
+            return col
+
+
+class OrbitIndex(collections.abc.Mapping):
+    """Maps each orbit number to the row indices of the records in that
+       orbit, ordered from the highest Request Priority to the lowest,
+       and by row within a priority.
+
+       It is made from the *orbit* and *priority* columns of a
+       ColumnarPTF (usually as its orbit_index), iterates over the orbits
+       in ascending order, and the rows for each orbit are an
+       ``array``.
+    """
+
+    def __init__(self, orbit, priority):
+        self.priority = priority
+        rows = dict()
+        for i, o in enumerate(orbit):
+            try:
+                rows[o].append(i)
+            except KeyError:
+                rows[o] = [i]
+        # Python's sort is stable, even when reversed, so the rows of
+        # a priority stay in order.
+        key = priority.__getitem__
+        self._rows = {
+            o: array('q', sorted(rows[o], key=key, reverse=True))
+            for o in sorted(rows)
+        }
+
+    def __getitem__(self, orbit):
+        return self._rows[orbit]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def copy(self, priority=None):
+        '''Returns a copy of this index, which is kept in the order of
+           *priority* (this index's priority column, if not given).'''
+        new = copy.copy(self)
+        if priority is not None:
+            new.priority = priority
+        new._rows = {o: rows[:] for o, rows in self._rows.items()}
+        return new
+
+    def reorder(self, orbit):
+        '''Re-sorts the rows of *orbit*, after a priority has changed.'''
+        self._rows[orbit] = array('q', sorted(
+            sorted(self._rows[orbit]), key=self.priority.__getitem__,
+            reverse=True
+        ))
+
+
+def orbit_index(records) -> OrbitIndex:
+    '''Returns an OrbitIndex for *records*, which may be a PTF, any
+       sequence of records, or a ColumnarPTF.  For a PTF or a
+       ColumnarPTF, the index is kept, and given again the next time.'''
+    return columns(records).orbit_index
+
+
+def columns(records) -> ColumnarPTF:
+    '''Returns a ColumnarPTF for *records*, which may be a PTF, any
+       sequence of records, or already a ColumnarPTF.'''
+    if isinstance(records, ColumnarPTF):
+        return records
+    elif isinstance(records, PTF):
+        return records.columns()
+    else:
+        return ColumnarPTF(records)
+
+
+def _field(record, key):
+    try:
+        return record[key]
+    except KeyError:
+        return None
+
+
+def _generation(records) -> int:
+    # The total of the generations of the *records*, which only grows,
+    # so it is the same as an earlier total only if none of them has
+    # been changed.  Records without a generation, like a plain dict,
+    # count as zero.
+    return sum(getattr(r, 'generation', 0) for r in records)
+
+
+def _sum_floats(value: str) -> float:
+    values = value.split()
+    if not values:
+        raise ValueError('no values')
+    return math.fsum(map(float, values))
 
 
 def key_translation(new_keys: list, old_keys: list) -> dict:
@@ -196,7 +833,8 @@ def key_translation(new_keys: list, old_keys: list) -> dict:
     return d
 
 
-def parse(ptf_str: str) -> tuple:
+@profiling.timed('parse')
+def parse(ptf_str: str, compact=False) -> tuple:
     '''Takes a string, and parses the output.
 
        A three-element namedtuple is returned: the first element
@@ -266,18 +904,31 @@ def parse(ptf_str: str) -> tuple:
        dictionary whose keys are the ``h`` values and whose values are
        the ``n`` values.
     '''
+    reader = PTFReader(io.StringIO(ptf_str, newline=''), compact=compact)
+    records = list(reader)
+    profiling.count('records parsed', len(records))
+    return(reader.dictionary, reader.comments, reader.fieldnames, records)
+
+
+def parse_header(lines: collections.abc.Iterator) -> tuple:
+    '''Consumes the header and comment lines of a PTF from the *lines*
+       iterator.
+
+       A four-element tuple is returned: the header dictionary, the
+       comment string, the list of fieldnames (as described in
+       parse()), and an iterator which will yield the remaining lines
+       of the PTF (the records).
+    '''
     d = dict().fromkeys(header_order)
     d['SPK'] = list()
     c = ''
-    ptf_rows = []
-    lines = collections.deque(ptf_str.splitlines())
-    ft = lines.popleft().lstrip('#').strip()
+    ft = _next_line(lines).lstrip(u'\ufeff').lstrip('#').strip()
     if ft.startswith('FILE_TYPE:'):
         (k, v) = ft.split(':')
         d[k] = v.strip()
     else:
         raise ValueError('This file does not start with FILE_TYPE.')
-    line = lines.popleft()
+    line = _next_line(lines)
     while not line.startswith('##'):
         if line.startswith('#'):
             (k, v) = line.split(':', maxsplit=1)
@@ -287,13 +938,15 @@ def parse(ptf_str: str) -> tuple:
                 d[k.lstrip('#').strip()] = v.strip()
         else:
             raise ValueError('Insufficient header elements for a PTF.')
-        line = lines.popleft()
+        line = _next_line(lines)
 
-    line = lines.popleft()
-    while line.startswith('#'):
-        c += line.lstrip('#').strip() + '\n'
-        line = lines.popleft()
-    lines.appendleft(line)
+    rest = iter(())
+    for line in lines:
+        if line.startswith('#'):
+            c += line.lstrip('#').strip() + '\n'
+        else:
+            rest = itertools.chain((line,), lines)
+            break
 
     my_fieldnames = None
     for comment_line in c.splitlines():
@@ -304,40 +957,620 @@ def parse(ptf_str: str) -> tuple:
     if my_fieldnames is None:
         my_fieldnames = fieldnames
 
-    reader = csv.DictReader(lines, fieldnames=my_fieldnames)
+    return(d, c, my_fieldnames, rest)
+
+
+def _next_line(lines: collections.abc.Iterator) -> str:
+    try:
+        return next(lines)
+    except StopIteration:
+        raise ValueError('The PTF header ended unexpectedly.')
+
 
-    for row in reader:
-        ptf_rows.append(PTFDict(row))
+class PTFReader(collections.abc.Iterable):
+    """Reads the records of a PTF lazily, one row at a time.
 
-    return(d, c, my_fieldnames, ptf_rows)
+       The header and comment block are parsed when the reader is
+       created, so the ``dictionary``, ``comments``, and ``fieldnames``
+       attributes are available straight away (just like on a PTF
+       object), and iterating over the reader yields each row as a
+       PTFDict (or as a PTFRecord, if *compact* is true).
 
+       *lines* can be any iterable of strings, like a list or an open
+       file.  If *closer* is given, it will be closed once the records
+       are exhausted, or when the reader is used as a context manager.
+    """
 
-def loads(ptf_str: str) -> PTF:
-    return PTF(ptf_str)
+    def __init__(self, lines, closer=None, compact=False):
+        self._closer = closer
+        self._compact = compact
+        try:
+            (self.dictionary,
+             self.comments,
+             self.fieldnames,
+             self._lines) = parse_header(iter(lines))
+        except Exception:
+            self.close()
+            raise
 
+    def __iter__(self):
+        try:
+            yield from read_rows(
+                self._lines, self.fieldnames, self._compact
+            )
+        finally:
+            self.close()
 
-def load(ptf_path: os.PathLike) -> PTF:
-    with open(ptf_path, 'r',
-              encoding=guess_encoding(ptf_path)) as f:
-        ptf_str = f.read()
+    def __enter__(self):
+        return self
 
-    return loads(ptf_str.lstrip(u'\ufeff'))
+    def __exit__(self, *exc_info):
+        self.close()
 
+    def close(self):
+        if self._closer is not None:
+            self._closer.close()
+            self._closer = None
 
-def guess_encoding(path):
-    """Sample a file, seeing if the platform-dependent encoding works, and
-       trying latin_1 if it doesn't.
+
+class _LoadedReader(PTFReader):
+    # A PTFReader of the records of the PTF *p*, which has already been
+    # read, see iterload().
+
+    def __init__(self, p: PTF):
+        self._closer = None
+        self.dictionary = p.dictionary
+        self.comments = p.comments
+        self.fieldnames = p.fieldnames
+        self._records = p.ptf_recs
+
+    def __iter__(self):
+        return iter(self._records)
+
+
+def read_rows(lines, fieldnames, compact=False) -> collections.abc.Iterator:
+    '''Yields a PTFDict (or a PTFRecord, if *compact* is true) for each
+       of the comma-separated *lines*, whose keys are the *fieldnames*,
+       just as csv.DictReader would make them: empty lines are skipped,
+       missing fields are None, and any extra fields are a list under
+       the None key.
+
+       Most PTF lines have no quotes in them, and those are just split
+       on commas, only the others are read by a csv.reader, which may
+       read more than one line for a quoted field with a line break in
+       it.  The records with just the *fieldnames* share one map of
+       their folded keys (or all of their keys, if *compact*, when any
+       value that is the same as the previous record's value for that
+       field is also shared, since many of a PTF's fields are).
+    '''
+    lines = iter(lines)
+    pending = list()
+
+    def quoted():
+        # Gives the csv.reader the line that it is asked to read, and
+        # then any more that it needs.
+        while True:
+            if pending:
+                yield pending.pop()
+            else:
+                line = next(lines, None)
+                if line is None:
+                    return
+                yield line
+
+    reader = csv.reader(quoted())
+    fieldnames = tuple(fieldnames)
+    n = len(fieldnames)
+    folded = _folded_map(fieldnames)
+    from_dict = PTFDict._from_dict
+    schema = _Schema(fieldnames) if compact else None
+    from_values = PTFRecord._from_values
+    previous = ()
+
+    for line in lines:
+        values = line.rstrip('\r\n')
+        if '"' in values or '\r' in values:
+            pending.append(line)
+            values = next(reader, [])
+            if not values:
+                continue
+        elif not values:
+            continue
+        else:
+            values = values.split(',')
+
+        if len(values) == n:
+            if schema is None:
+                yield from_dict(dict(zip(fieldnames, values)), folded)
+                continue
+            if len(schema.keys) == n:
+                if previous:
+                    values = [
+                        p if p == v else v for p, v in zip(previous, values)
+                    ]
+                previous = values
+                yield from_values(values, schema)
+                continue
+            d = dict(zip(fieldnames, values))
+        elif len(values) < n:
+            d = dict(zip(fieldnames, values))
+            for k in fieldnames[len(values):]:
+                d[k] = None
+        else:
+            d = dict(zip(fieldnames, values))
+            d[None] = values[n:]
+
+        if schema is not None:
+            yield _compact_record(d, schema)
+        elif None in d:
+            yield PTFDict(d)
+        else:
+            yield from_dict(d, folded)
+
+
+def _split_lines(chunks) -> collections.abc.Iterator:
+    # Yields the lines of the *chunks* of text, which each end at a \n
+    # (like the decoded lines of a file opened in binary mode), split at
+    # each \n, \r, or \r\n, with those line endings, just as parse() splits
+    # a PTF with io.StringIO(text, newline=''), and as csv.reader expects.
+    for chunk in chunks:
+        if '\r' in chunk:
+            yield from io.StringIO(chunk, newline='')
+        else:
+            yield chunk
+
+
+def _compact_record(data: dict, schema: _Schema) -> PTFRecord:
+    # Makes a PTFRecord with the shared *schema* from the *data* dict,
+    # which is emptied, and kept for any keys that aren't in *schema*.
+    record = PTFRecord._from_values(
+        [data.pop(k, _ABSENT) for k in schema.keys], schema
+    )
+    if data:
+        record._extra = data
+    return record
+
+
+def loads(ptf_str: str, compact=False) -> PTF:
+    return PTF(*parse(ptf_str, compact))
+
+
+@profiling.timed('read')
+def load(ptf_path: os.PathLike, compact=False) -> PTF:
+    '''Reads the PTF at *ptf_path*.
+
+       If *compact* is true, the records are PTFRecords rather than
+       PTFDicts, which behave the same, but take much less memory.
+
+       If the cache is turned on (see ptf_cache), and this file has
+       been read before, the records are read from there, rather than
+       being parsed again.
+    '''
+    return ptf_cache.cached(
+        ptf_path, 'ptf',
+        functools.partial(_load_bytes, compact=compact),
+        pack,
+        functools.partial(unpack, compact=compact)
+    )
+
+
+def _load_bytes(data: bytes, compact=False) -> PTF:
+    return loads(decode(data).lstrip(u'\ufeff'), compact)
+
+
+def pack(p: PTF) -> tuple:
+    '''Returns the header dictionary, comments, fieldnames, and records
+       of *p* as a tuple of plain Python objects (which can be written
+       by the marshal module), from which unpack() makes a PTF again.'''
+    return (p.dictionary, p.comments, p.fieldnames,
+            pack_records(p.ptf_recs))
+
+
+def unpack(parts: tuple, compact=False) -> PTF:
+    '''Returns a PTF made from the *parts* that pack() returned.'''
+    dictionary, comments, fieldnames, records = parts
+    return PTF(dictionary, comments, fieldnames,
+               unpack_records(records, fieldnames, compact))
+
+
+def pack_records(records) -> list:
+    '''Returns a list of plain dicts of the *records*, which are shared
+       with them, where possible, rather than copied.'''
+    return [r.data if isinstance(r, PTFDict) else dict(r) for r in records]
+
+
+@profiling.timed('unpack')
+def unpack_records(records: list, fieldnames=None, compact=False) -> list:
+    '''Returns a list of PTFDicts that wrap each of the dicts in
+       *records*, like those from pack_records(), or of PTFRecords with
+       their values, if *compact* is true.
+
+       The records that have just the *fieldnames* (or the keys of the
+       first record) as their keys share one map of those keys, rather
+       than each making its own.
+    '''
+    if fieldnames is None:
+        fieldnames = list(records[0]) if records else list()
+    keys = dict.fromkeys(fieldnames).keys()
+
+    if compact:
+        schema = _Schema(keys)
+        return [
+            PTFRecord._from_values(list(d.values()), schema)
+            if d.keys() == keys else _compact_record(dict(d), schema)
+            for d in records
+        ]
+
+    folded = _folded_map(keys)
+    new = list()
+    for d in records:
+        if d.keys() == keys:
+            new.append(PTFDict._from_dict(d, folded))
+        else:
+            new.append(PTFDict(d))
+    return new
+
+
+def iterload(ptf_path: os.PathLike, compact=False) -> PTFReader:
+    '''Opens the PTF at *ptf_path* and returns a PTFReader for it.
+
+       Unlike load(), the records are not all read into memory, they
+       are parsed one at a time as the returned reader is iterated
+       over, and the file is closed when they run out::
+
+           with ptf.iterload('HiTList.ptf') as reader:
+               print(reader.dictionary['START_TIME'])
+               for record in reader:
+                   ...
+
+       The file is read through once before that, in pieces, to choose
+       one encoding for all of it, just as load() would (see
+       guess_encoding()).
+
+       If ptf_cache.memory is set, the PTF is read with load() instead,
+       so that it is only parsed once, and the reader gives its records.
+    '''
+    if ptf_cache.memory is not None:
+        # A long-running process (like the cippd server) keeps the files
+        # it reads in memory, so that each is only parsed once, which is
+        # better than reading it again.
+        return _LoadedReader(load(ptf_path, compact))
+
+    encoding = guess_encoding(ptf_path)
+    f = open(ptf_path, 'rb')
+    return PTFReader(
+        _split_lines(decode_lines(f, encoding)), closer=f, compact=compact
+    )
+
+
+# The fields that open_indexed() makes indexes of, unless told otherwise.
+index_fields = ('Team Database ID', 'Orbit Number', 'Product ID')
+
+# Changing this makes all of the existing index sidecar files out of
+# date, which is needed if what is stored in them changes.
+_index_version = 1
+
+
+def open_indexed(ptf_path: os.PathLike, fields=index_fields,
+                 sidecar=None) -> 'IndexedPTF':
+    '''Opens the PTF at *ptf_path* for random access, and returns an
+       IndexedPTF for it.
+
+       The file is memory-mapped, and when it is opened, only the
+       offset of each record in it, and an index of the values of each
+       of the *fields*, are worked out.  The records themselves are only
+       parsed when they are asked for::
+
+           with ptf.open_indexed('HiTList.ptf') as p:
+               for record in p.find('Team Database ID', '163582'):
+                   ...
+
+       If *sidecar* is the path of a file (or True, for the path of the
+       PTF with .idx added to it), the offsets and indexes are written
+       to it, and are read from it the next time, rather than being
+       worked out again, as long as the PTF hasn't changed.
+    '''
+    return IndexedPTF(ptf_path, fields, sidecar)
+
+
+class IndexedPTF(collections.abc.Sequence):
+    """The records of a memory-mapped PTF file, see open_indexed().
+
+       Like a PTFReader, it has the ``dictionary``, ``comments``, and
+       ``fieldnames`` of the PTF, and it is a sequence of the PTF's
+       records, each of which is parsed (as a new PTFDict) whenever it
+       is asked for, so changing one doesn't change the file, or what
+       is given the next time.
+
+       The records with a value of a field are given by find(), and
+       their positions by rows(), and the values themselves by
+       values().  Any field can be looked up, but one
+       that isn't indexed yet is indexed, by reading all of the records,
+       the first time.
+    """
+
+    def __init__(self, ptf_path: os.PathLike, fields=index_fields,
+                 sidecar=None):
+        if sidecar is True:
+            sidecar = os.fspath(ptf_path) + '.idx'
+        self._encoding = _default_encoding()
+        self._map = None
+        self._file = open(ptf_path, 'rb')
+        try:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+            start = self._records_start()
+            (self.dictionary,
+             self.comments,
+             self.fieldnames,
+             _) = parse_header(iter(
+                self._decode(self._map[:start]).splitlines()
+            ))
+            self._positions = dict(zip(self.fieldnames, itertools.count()))
+
+            st = os.fstat(self._file.fileno())
+            stamp = [st.st_mtime_ns, st.st_size]
+            columns = {self._column(f) for f in fields} - {None}
+            self._indexes = None
+            if sidecar is not None:
+                self._read_sidecar(sidecar, stamp, columns)
+            if self._indexes is None:
+                self._scan(start, columns)
+                if sidecar is not None:
+                    self._write_sidecar(sidecar, stamp)
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(len(self))[key]]
+        i = range(len(self))[key]
+        text = self._decode(self._map[self._offsets[i]:self._offsets[i + 1]])
+        return next(read_rows(text.splitlines(True), self.fieldnames))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def rows(self, field: str, value) -> list:
+        '''Returns a list of the positions of the records whose *field*
+           is *value*, in order.'''
+        column = self._column(field)
+        if column is None:
+            return list()
+        index = self._indexes.get(column)
+        if index is None:
+            self._scan(self._offsets[0], {column})
+            index = self._indexes[column]
+        elif isinstance(index, list):
+            # An index from a sidecar is a list of marshalled buckets,
+            # and only the bucket that the value would be in is read.
+            index = marshal.loads(index[_bucket(value, len(index))])
+        return list(index.get(value, ()))
+
+    def values(self, field: str) -> list:
+        '''Returns a list of the distinct values of *field* in the
+           records, in no particular order.'''
+        column = self._column(field)
+        if column is None:
+            return list()
+        index = self._indexes.get(column)
+        if index is None:
+            self._scan(self._offsets[0], {column})
+            index = self._indexes[column]
+        elif isinstance(index, list):
+            return [v for b in index for v in marshal.loads(b)]
+        return list(index)
+
+    def find(self, field: str, value) -> list:
+        '''Returns a list of the records whose *field* is *value*.'''
+        return [self[i] for i in self.rows(field, value)]
+
+    def _column(self, field: str):
+        # The position of *field* in a row (or None, if it isn't one of
+        # the fieldnames), found just as a PTFDict would find it.
+        if field not in self._positions:
+            field = _folded_map(self.fieldnames).get(_fold(field))
+        return self._positions.get(field)
+
+    def _decode(self, data: bytes) -> str:
+        try:
+            return data.decode(self._encoding)
+        except UnicodeDecodeError:
+            return data.decode('latin_1')
+
+    def _records_start(self) -> int:
+        # The offset of the first line after the first one which doesn't
+        # start with #, where parse_header() would stop.
+        m = self._map
+        m.seek(0)
+        m.readline()
+        while True:
+            offset = m.tell()
+            line = m.readline()
+            if not line or not line.startswith(b'#'):
+                return offset
+
+    def _scan(self, start: int, columns: set):
+        # Reads every record, from *start*, to get its offset, and to add
+        # its values in the *columns* to indexes of them.
+        m = self._map
+        m.seek(start)
+        pending = list()
+
+        def more():
+            # Gives the csv.reader the line that it is asked to read, and
+            # then any more that it needs, just like read_rows().
+            while True:
+                if pending:
+                    yield pending.pop()
+                else:
+                    line = m.readline()
+                    if not line:
+                        return
+                    yield self._decode(line)
+
+        reader = csv.reader(more())
+        indexes = {c: dict() for c in columns}
+        items = list(indexes.items())
+        offsets = array('q')
+        decode = self._decode
+        with profiling.stage('index'):
+            while True:
+                offset = m.tell()
+                line = m.readline()
+                if not line:
+                    break
+                values = line.rstrip(b'\r\n')
+                if b'"' in values or b'\r' in values:
+                    pending.append(decode(line))
+                    values = next(reader, [])
+                    if not values:
+                        continue
+                elif not values:
+                    continue
+                else:
+                    values = decode(values).split(',')
+
+                row = len(offsets)
+                offsets.append(offset)
+                n = len(values)
+                for c, index in items:
+                    value = values[c] if c < n else None
+                    rows = index.get(value)
+                    if rows is None:
+                        index[value] = [row]
+                    else:
+                        rows.append(row)
+        offsets.append(len(m))
+
+        self._offsets = offsets
+        if self._indexes is None:
+            self._indexes = indexes
+        else:
+            self._indexes.update(indexes)
+
+    def _read_sidecar(self, path: os.PathLike, stamp: list, columns: set):
+        # Sets the offsets and indexes from the sidecar file at *path*,
+        # if it can be read, is of the PTF as it is now, and has indexes
+        # of all of the *columns*.
+        try:
+            with open(path, 'rb') as f:
+                data = marshal.loads(f.read())
+            if (
+                data['version'] != _index_version or
+                data['stamp'] != stamp or
+                not columns <= data['indexes'].keys()
+            ):
+                return
+            offsets = array('q')
+            offsets.frombytes(data['offsets'])
+            indexes = dict(data['indexes'])
+        except (OSError, EOFError, ValueError, TypeError, KeyError,
+                AttributeError):
+            return
+        if offsets:
+            self._offsets = offsets
+            self._indexes = indexes
+
+    def _write_sidecar(self, path: os.PathLike, stamp: list):
+        indexes = dict()
+        for c, index in self._indexes.items():
+            if isinstance(index, dict):
+                buckets = [dict() for _ in range(max(1, len(index) // 64))]
+                for value, rows in index.items():
+                    buckets[_bucket(value, len(buckets))][value] = rows
+                index = [marshal.dumps(b) for b in buckets]
+            indexes[c] = index
+        data = marshal.dumps({
+            'version': _index_version,
+            'stamp': stamp,
+            'offsets': self._offsets.tobytes(),
+            'indexes': indexes,
+        })
+        directory, name = os.path.split(os.path.abspath(path))
+        try:
+            ptf_cache.write_atomic(directory, name, data)
+        except OSError:
+            pass
+
+
+def _bucket(value, n: int) -> int:
+    # Which of the *n* buckets of a sidecar index *value* is in, which
+    # is the same in every process, unlike hash().
+    return zlib.crc32(str(value).encode('utf-8', 'surrogatepass')) % n
+
+
+def read_text(path: os.PathLike) -> str:
+    """Returns the decoded contents of the file at *path*, which is
+       opened and read just once.  See decode().
+
+       Line endings are left as they are in the file, so the result
+       can be given to csv.reader() via io.StringIO(text, newline='').
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    return decode(data)
+
+
+@profiling.timed('decode')
+def decode(data: bytes) -> str:
+    """Decodes all of *data* with the platform-dependent encoding, or
+       with latin_1 if that doesn't work.
 
        A more robust solution would be to use the chardet library,
        but we want to try and keep this dependency-free."""
-
     try:
-        e = None
-        with open(path, newline='', encoding=e) as f:
-            f.readline()
-        return e
+        return data.decode(_default_encoding())
     except UnicodeDecodeError:
-        e = 'latin_1'
-        with open(path, newline='', encoding=e) as f:
-            f.readline()
-        return e
+        return data.decode('latin_1')
+
+
+def decode_lines(lines, encoding=None):
+    """Yields each of the bytes in *lines* (like a file opened in binary
+       mode) decoded with *encoding*, or with the platform-dependent
+       encoding if it is None, just as guess_encoding() returns.
+
+       So that all of a file is decoded one way, as decode() would
+       decode it, *encoding* should come from guess_encoding().
+    """
+    if encoding is None:
+        encoding = _default_encoding()
+    for line in lines:
+        yield line.decode(encoding)
+
+
+def guess_encoding(path):
+    """Read through a file, seeing if the platform-dependent encoding
+       works for all of it, and returning latin_1 if it doesn't.
+
+       The file is decoded in pieces, so this doesn't need to hold all
+       of it in memory.  None is returned for the platform-dependent
+       encoding, suitable for the encoding argument of open()."""
+    decoder = codecs.getincrementaldecoder(_default_encoding())()
+    with open(path, 'rb') as f:
+        try:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return 'latin_1'
+    return None
+
+
+def _default_encoding() -> str:
+    # This is the encoding that open() uses when none is given.
+    return locale.getpreferredencoding(False)
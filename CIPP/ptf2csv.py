@@ -20,10 +20,14 @@ import argparse
 import csv
 from pathlib import Path
 
+import cippd_client
+import profiling
 import ptf
 
 
 def main():
+    cippd_client.forward('ptf2csv')
+
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('-o', '--output', required=False, default='.csv')
     parser.add_argument('-l', '--links', required=False, action='store_true',
@@ -33,8 +37,10 @@ def main():
                              'imported by a spreadsheet program, there '
                              'should be clickable links in those cells.')
     parser.add_argument('ptf', metavar="some.ptf-file")
+    profiling.add_arguments(parser)
 
     args = parser.parse_args()
+    profiling.start(args)
 
     csv_path = ''
     if args.output.startswith('.'):
@@ -42,30 +48,38 @@ def main():
     else:
         csv_path = Path(args.output)
 
-    ptf_in = ptf.load(args.ptf)
+    with ptf.iterload(args.ptf) as reader:
+        with open(csv_path, 'w') as csvfile:
+            write_csv(csvfile, reader.fieldnames, reader, args.links)
+
+
+@profiling.timed('write csv')
+def write_csv(csvfile, fieldnames, records, links=False):
+    '''Writes the *records* to *csvfile* as CSV, with a header of the
+       *fieldnames*.  If *links* is True, a final column is added with
+       a spreadsheet formula which links to each record's suggestion in
+       HiReport.'''
+    link_key = 'HiReport URLs'
+    fieldnames = list(fieldnames)
+    if links:
+        fieldnames.append(link_key)
 
-    if args.links:
-        # Add HiReport Links
-        link_key = 'HiReport URLs'
-        ptf_in.fieldnames.append(link_key)
-        for i, rec in enumerate(ptf_in):
-            new_rec = rec
+    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    writer.writeheader()
+    for row in records:
+        if links:
+            # Add HiReport Links
             u = 'https://hireport.lpl.arizona.edu/hireport/suggestion/'
-            sugg = rec['Team Database ID']
+            sugg = row['Team Database ID']
             url = u + sugg
             f = '=HYPERLINK("{}", "HiReport {}")'.format(url, sugg)
 
             # If the formula is too fancy, can always fall back to
             # just the URL:
-            # new_rec[link_key] = url
-            new_rec[link_key] = f
-            ptf_in[i] = new_rec
-
-    with open(csv_path, 'w') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=ptf_in.fieldnames)
-        writer.writeheader()
-        for row in ptf_in:
-            writer.writerow(row)
+            # row[link_key] = url
+            row = dict(row)
+            row[link_key] = f
+        writer.writerow(row)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""Manages an optional on-disk cache of parsed PTF and CSV files.
+
+During a CIPP session, the same HiTList is read by one tool after
+another, and parsing it is a good part of the time that each of them
+takes.  If the CIPP_CACHE environment variable is set, the parsed
+contents of each file that ptf.load() or priority_rewrite.get_input()
+reads are kept in a cache directory, and are read from there the next
+time that file (or another with the same contents) is read.
+
+CIPP_CACHE may be set to 1 to use the default directory
+($XDG_CACHE_HOME/cipp, or ~/.cache/cipp), or to the path of a directory
+to use.  CIPP_CACHE_SIZE is the most megabytes that the cache will hold
+(the default is 256), and the least recently used files are removed to
+keep it under that.
+
+Files are matched by a hash of their contents, so a changed file is
+always parsed again.  The hash is only recalculated if a file's
+modification time or size has changed since it was last read.
+
+Running this program reports what is in the cache, or with --clear,
+empties it.
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import hashlib
+import json
+import locale
+import marshal
+import os
+import sys
+import tempfile
+
+import profiling
+
+# Changing this makes all of the existing cache entries misses, which
+# is needed if what is stored for a kind of file changes.
+version = 2
+
+default_size = 256  # megabytes
+
+_index_name = "index.json"
+_suffix = ".marshal"
+
+# If this is set to a dict (as the cippd server does), the marshalled
+# form of each file that is read is also kept in it, whether or not the
+# on-disk cache is on, so that a long-running process only parses a
+# file once.
+memory = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--clear", action="store_true", help="Remove everything in the cache."
+    )
+
+    args = parser.parse_args()
+
+    cache_dir = directory()
+    if cache_dir is None:
+        print("The cache is off, set CIPP_CACHE to turn it on.")
+        return
+
+    if args.clear:
+        clear(cache_dir)
+
+    entries = _entries(cache_dir)
+    total = sum(e[1] for e in entries)
+    print(cache_dir)
+    print(f"{len(entries)} files, {total / 1e6:.1f} of {max_size() / 1e6} MB")
+
+
+def directory():
+    """Returns the path of the cache directory given by the CIPP_CACHE
+    environment variable, or None if the cache is off.
+    """
+    value = os.environ.get("CIPP_CACHE", "").strip()
+    if value.casefold() in ("", "0", "no", "off", "false"):
+        return None
+    if value.casefold() in ("1", "yes", "on", "true"):
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        return os.path.join(base, "cipp")
+    return os.path.expanduser(value)
+
+
+def max_size() -> int:
+    """Returns the most bytes that the cache should hold, from the
+    CIPP_CACHE_SIZE environment variable (in megabytes).
+    """
+    try:
+        return int(float(os.environ["CIPP_CACHE_SIZE"]) * 10**6)
+    except (KeyError, ValueError):
+        return default_size * 10**6
+
+
+def cached(path: os.PathLike, kind: str, parse, pack=None, unpack=None):
+    """Returns what *parse* returns for the bytes of the file at *path*,
+    from the cache if it is there.
+
+    *kind* names what *parse* makes of a file, so that different kinds
+    of results from the same file are kept apart.  If given, *pack* is
+    used to turn what *parse* returns into plain Python objects that the
+    marshal module can write, and *unpack* to turn those back into what
+    *parse* would have returned.
+
+    If the cache is off, or can't be read or written, the file is just
+    parsed.
+    """
+    if pack is None:
+        pack = _same
+    if unpack is None:
+        unpack = _same
+
+    if memory is None:
+        return _cached(path, kind, parse, pack, unpack)
+
+    st = os.stat(path)
+    name = (kind, os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    try:
+        data = memory.pop(name)
+    except KeyError:
+        result = _cached(path, kind, parse, pack, unpack)
+        data = marshal.dumps(pack(result))
+    else:
+        profiling.count("memory cache hits")
+        result = unpack(marshal.loads(data))
+
+    # The most recently used are kept at the end.
+    memory[name] = data
+    size = max_size()
+    total = sum(len(x) for x in memory.values())
+    while total > size and len(memory) > 1:
+        total -= len(memory.pop(next(iter(memory))))
+    return result
+
+
+def _cached(path: os.PathLike, kind: str, parse, pack, unpack):
+    cache_dir = directory()
+    if cache_dir is None:
+        with open(path, "rb") as f:
+            return parse(f.read())
+
+    st = os.stat(path)
+    index = _read_index(cache_dir)
+    name = kind + " " + os.path.abspath(path)
+    stamp = [st.st_mtime_ns, st.st_size]
+
+    entry = index.get(name)
+    if entry is not None and entry[:2] == stamp:
+        value = _read_entry(cache_dir, entry[2])
+        if value is not None:
+            profiling.count("cache hits")
+            return unpack(value)
+
+    with open(path, "rb") as f:
+        data = f.read()
+    key = _key(kind, data)
+
+    value = _read_entry(cache_dir, key)
+    if value is None:
+        profiling.count("cache misses")
+        result = parse(data)
+        _write_entry(cache_dir, key, pack(result))
+    else:
+        profiling.count("cache hits")
+        result = unpack(value)
+
+    index[name] = stamp + [key]
+    _write_index(cache_dir, index)
+    evict(cache_dir, max_size(), keep=key)
+    return result
+
+
+def evict(cache_dir: os.PathLike, size: int, keep=None):
+    """Removes the least recently used entries from the cache until they
+    take up no more than *size* bytes, other than the entry with the
+    *keep* key.
+    """
+    entries = _entries(cache_dir)
+    total = sum(e[1] for e in entries)
+    if total <= size:
+        return
+
+    removed = False
+    for key, nbytes, used in sorted(entries, key=lambda e: e[2]):
+        if total <= size:
+            break
+        if key == keep:
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, key + _suffix))
+        except OSError:
+            continue
+        total -= nbytes
+        removed = True
+
+    if removed:
+        # Clean up the index entries for the removed files.
+        keys = set(e[0] for e in _entries(cache_dir))
+        index = _read_index(cache_dir)
+        _write_index(
+            cache_dir, {k: v for k, v in index.items() if v[2] in keys}
+        )
+
+
+def clear(cache_dir: os.PathLike):
+    """Removes all of the entries, and the index, from *cache_dir*."""
+    for key, _, _ in _entries(cache_dir):
+        try:
+            os.remove(os.path.join(cache_dir, key + _suffix))
+        except OSError:
+            pass
+    try:
+        os.remove(os.path.join(cache_dir, _index_name))
+    except OSError:
+        pass
+
+
+def _same(x):
+    return x
+
+
+def _key(kind: str, data: bytes) -> str:
+    # The decoded text of a file depends on the locale's encoding, so
+    # that is part of the key, along with the version of what is stored.
+    h = hashlib.sha256(
+        "{}\0{}\0{}\0{}\0".format(
+            version, marshal.version, kind, locale.getpreferredencoding(False)
+        ).encode()
+    )
+    h.update(data)
+    return h.hexdigest()
+
+
+def _entries(cache_dir: os.PathLike) -> list:
+    # A list of (key, size, last used time) three-tuples of the entries.
+    entries = list()
+    try:
+        with os.scandir(cache_dir) as it:
+            for de in it:
+                if de.name.endswith(_suffix):
+                    try:
+                        st = de.stat()
+                    except OSError:
+                        continue
+                    entries.append(
+                        (de.name[:-len(_suffix)], st.st_size, st.st_mtime)
+                    )
+    except OSError:
+        pass
+    return entries
+
+
+@profiling.timed("cache read")
+def _read_entry(cache_dir: os.PathLike, key: str):
+    # Returns None if the entry isn't there, or can't be read.
+    path = os.path.join(cache_dir, key + _suffix)
+    try:
+        with open(path, "rb") as f:
+            # Much faster than marshal.load(f), which reads a little
+            # at a time.
+            value = marshal.loads(f.read())
+        # Marks the entry as recently used.
+        os.utime(path)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return value
+
+
+def _write_entry(cache_dir: os.PathLike, key: str, value):
+    try:
+        write_atomic(cache_dir, key + _suffix, marshal.dumps(value))
+    except (OSError, ValueError):
+        pass
+
+
+def _read_index(cache_dir: os.PathLike) -> dict:
+    # The index maps kind and path to the modification time, size, and
+    # key of that file when it was last read.
+    try:
+        with open(os.path.join(cache_dir, _index_name)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(index, dict):
+        return dict()
+    return {
+        k: v for k, v in index.items() if isinstance(v, list) and len(v) == 3
+    }
+
+
+def _write_index(cache_dir: os.PathLike, index: dict):
+    try:
+        write_atomic(cache_dir, _index_name, json.dumps(index).encode())
+    except OSError:
+        pass
+
+
+def write_atomic(directory: os.PathLike, name: str, data: bytes):
+    """Writes *data* to the file called *name* in *directory* (which is
+    made, if it isn't there).
+
+    It is written to a temporary file, and then renamed, so that another
+    process never reads a partly-written file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(directory, name))
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+if __name__ == "__main__":
+    sys.exit(main())
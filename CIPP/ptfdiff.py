@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""Reports the records that were added, removed, or had their Request
+Priority changed between one PTF and the next.
+
+Records are matched by their Team Database ID, or for those without
+one, by their Orbit Number and Predict Time.  Each PTF after the first
+is compared with the one before it, so the delivered HiTList, the
+CIPP-modified PTF, and the final IPTF can be compared in one go:
+
+    ptfdiff.py HiTList.ptf HiTList_cipp.ptf IPTF.ptf
+
+Only a few fields of each of the older PTF's records are kept in memory
+for a comparison, and the newer PTF is read one record at a time, so
+very large PTFs can be compared.  The changes are reported as they are
+found, with the removed records last.
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import collections
+import csv
+import logging
+import sys
+
+import priority_rewrite as pr
+import profiling
+
+# The fields of each record that are kept to describe it in a report.
+report_fields = ("Team Database ID", "Orbit Number", "Predict Time",
+                 "Instrument Set", "Comment")
+
+# A difference between two PTFs.  The kind is "added", "removed", or
+# "changed", the key is the join_key() of the record, and old and new
+# are dicts of the report fields and compared fields of the record in
+# the older and newer PTFs (or None, for the one that it isn't in).
+Change = collections.namedtuple("Change", ["kind", "key", "old", "new"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-f", "--format",
+        choices=("text", "csv"),
+        default="text",
+        help="The text report is for people, and the CSV has a row for "
+             "each change, with the files it was between.  "
+             "Default: %(default)s"
+    )
+    parser.add_argument(
+        "-c", "--compare",
+        action="append",
+        metavar="FIELD",
+        help="A field whose changes are reported, which may be given more "
+             "than once.  Default: Request Priority"
+    )
+    parser.add_argument(
+        "ptf", nargs="+",
+        help="Two or more .ptf or .csv files, from the oldest to the newest."
+    )
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args()
+    profiling.start(args)
+
+    if len(args.ptf) < 2:
+        parser.error("At least two files are needed to compare.")
+    compare = args.compare or ["Request Priority"]
+
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+
+    if args.format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(csv_fields(compare))
+
+    for old_path, new_path in zip(args.ptf, args.ptf[1:]):
+        counts = collections.Counter()
+        if args.format == "text":
+            print(f"--- {old_path}\n+++ {new_path}")
+        for change in diff(
+            pr.iter_input(old_path), pr.iter_input(new_path), compare
+        ):
+            counts[change.kind] += 1
+            if args.format == "csv":
+                writer.writerow(csv_row(old_path, new_path, change, compare))
+            else:
+                print(format_change(change, compare))
+        if args.format == "text":
+            print(format_summary(counts))
+
+
+def join_key(record) -> tuple:
+    """Returns the key that *record* is matched on, which is a one-tuple
+    of its Team Database ID, or if it doesn't have one, a two-tuple of
+    its Orbit Number and Predict Time.
+    """
+    tdid = _value(record, "Team Database ID")
+    if tdid:
+        return (tdid,)
+    return (_value(record, "Orbit Number"), _value(record, "Predict Time"))
+
+
+def diff(old, new, compare=("Request Priority",)):
+    """Yields a Change for each difference between the *old* and *new*
+    iterables of records.
+
+    Records are matched by join_key(), and if there is more than one
+    record with the same key, they are matched in order.  A matched
+    pair of records is changed if any of the *compare* fields differ.
+
+    All of *old* is read first, and only the fields of its records that
+    are needed are kept, then *new* is read a record at a time, and the
+    "added" and "changed" records are given as they are found.  The
+    "removed" records come last.
+    """
+    fields = tuple(dict.fromkeys(tuple(report_fields) + tuple(compare)))
+    positions = [fields.index(c) for c in compare]
+
+    def slim(record):
+        return tuple(_value(record, f) for f in fields)
+
+    index = dict()
+    for r in old:
+        index.setdefault(join_key(r), list()).append(slim(r))
+
+    for r in new:
+        key = join_key(r)
+        values = slim(r)
+        olds = index.get(key)
+        if olds is None:
+            yield Change("added", key, None, dict(zip(fields, values)))
+            continue
+
+        old_values = olds.pop(0)
+        if not olds:
+            del index[key]
+        if any(old_values[i] != values[i] for i in positions):
+            yield Change(
+                "changed", key,
+                dict(zip(fields, old_values)), dict(zip(fields, values))
+            )
+
+    for key, olds in index.items():
+        for old_values in olds:
+            yield Change("removed", key, dict(zip(fields, old_values)), None)
+
+
+def format_change(change: Change, compare=("Request Priority",)) -> str:
+    """Returns a line of text that describes the *change*."""
+    record = change.old if change.new is None else change.new
+    label = "{} ({}, {})".format(
+        " ".join(change.key),
+        record["Orbit Number"],
+        record["Instrument Set"]
+    )
+    if change.kind == "changed":
+        return "~ {} {}".format(label, "; ".join(
+            f"{c} {change.old[c]} -> {change.new[c]}"
+            for c in compare if change.old[c] != change.new[c]
+        ))
+    sign = "+" if change.kind == "added" else "-"
+    values = ", ".join(f"{c} {record[c]}" for c in compare)
+    return f"{sign} {label} {values}: {record['Comment']}"
+
+
+def format_summary(counts: collections.Counter) -> str:
+    """Returns a line of text with the number of each kind of change in
+    *counts*.
+    """
+    return "Added: {}, removed: {}, changed: {}".format(
+        counts["added"], counts["removed"], counts["changed"]
+    )
+
+
+def csv_fields(compare=("Request Priority",)) -> list:
+    """Returns the list of the fields of each csv_row()."""
+    fields = ["Old PTF", "New PTF", "Change"]
+    fields.extend(report_fields)
+    for c in compare:
+        fields.extend((f"Old {c}", f"New {c}"))
+    return fields
+
+
+def csv_row(old_path, new_path, change: Change,
+            compare=("Request Priority",)) -> list:
+    """Returns a list of the values of the csv_fields() for the *change*
+    between the files at *old_path* and *new_path*.
+    """
+    record = change.old if change.new is None else change.new
+    row = [old_path, new_path, change.kind]
+    row.extend(record[f] for f in report_fields)
+    for c in compare:
+        row.append("" if change.old is None else change.old[c])
+        row.append("" if change.new is None else change.new[c])
+    return row
+
+
+def _value(record, key: str) -> str:
+    # The value of the *key* field of *record*, without any leading or
+    # trailing spaces, or "" if it doesn't have one.
+    try:
+        value = record[key]
+    except KeyError:
+        return ""
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""Merges the records of several PTFs into one.
+
+Records are matched just as ptfdiff.py matches them, by their Team
+Database ID, or for those without one, by their Orbit Number and
+Predict Time, and a record that is in more than one of the PTFs is
+taken from the last one it is in.  So merging a HiTList with a PTF of
+just the records that were changed gives the HiTList with those
+changes:
+
+    ptfmerge.py -o merged.ptf HiTList.ptf changes.ptf
+
+If each of the PTFs is in Predict Time order, the merged records are
+too.  If any of them isn't, that is reported, and the records are given
+in the order of the PTFs instead: those of the first PTF that aren't in
+a later one, then those of the second, and so on.  The PTFs are read
+one record at a time, first to find the last PTF that each record is in
+(and whether each PTF is in order), and then to merge them, so only the
+keys of the records are ever all in memory.
+
+The header of the first PTF is used, and if it is a CSV file, the
+result is written as CSV.
+"""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import getpass
+import heapq
+import itertools
+import logging
+import os
+import sys
+from datetime import datetime
+
+import priority_rewrite as pr
+import profiling
+import ptf
+from ptfdiff import join_key
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="The file to write the merged PTF to, the default is to write "
+             "it to standard output."
+    )
+    parser.add_argument(
+        "-a", "--all", action="store_true",
+        help="Keep every record, even those that are in more than one of "
+             "the PTFs."
+    )
+    parser.add_argument(
+        "ptf", nargs="+",
+        help="The .ptf or .csv files, a record from a later one replaces "
+             "the same record from an earlier one."
+    )
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args()
+    profiling.start(args)
+
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+
+    last, ordered = index_sources(pr.iter_input(p) for p in args.ptf)
+    if args.all:
+        last = None
+
+    sources = [pr.iter_input(p) for p in args.ptf]
+    if all(ordered):
+        records = merge(sources, last, names=args.ptf)
+    else:
+        for path, in_order in zip(args.ptf, ordered):
+            if not in_order:
+                logging.warning(
+                    f"{path} is not in Predict Time order, so the records "
+                    f"are given in the order of the PTFs."
+                )
+        records = concat(sources, last)
+
+    first = sources[0]
+    try:
+        if hasattr(first, "dictionary"):
+            header = ptf.PTF(
+                first.dictionary, first.comments, first.fieldnames, list()
+            )
+            header["USERNAME"] = getpass.getuser()
+            header["CREATION_DATE"] = datetime.utcnow().strftime(
+                "%Y-%jT%H:%M:%S"
+            )
+            header.dump_iter(
+                sys.stdout if args.output is None else args.output, records
+            )
+        elif args.output is None:
+            write_csv(sys.stdout, records)
+        else:
+            with open(args.output, "w", newline="") as f:
+                write_csv(f, records)
+    except ValueError as err:
+        if args.output is not None and os.path.exists(args.output):
+            os.remove(args.output)
+        sys.exit(f"ERROR: {err}")
+
+
+def last_sources(sources) -> dict:
+    """Returns a dict which maps the join_key() of each of the records
+    in the *sources* iterable of iterables of records to the position
+    of the last of the *sources* that it is in.
+    """
+    return index_sources(sources)[0]
+
+
+def index_sources(sources) -> tuple:
+    """Returns the dict from last_sources() for the *sources* iterable
+    of iterables of records, and a list of whether each of them is in
+    Predict Time order, as merge() needs, from one read of each.
+    """
+    last = dict()
+    ordered = list()
+    for i, records in enumerate(sources):
+        previous = ""
+        in_order = True
+        for r in records:
+            last[join_key(r)] = i
+            time = _predict_time((i, r))
+            if time < previous:
+                in_order = False
+            previous = time
+        ordered.append(in_order)
+    return last, ordered
+
+
+def merge(sources: list, last=None, names=None):
+    """Yields the records of the *sources* list of iterables of records,
+    in Predict Time order, by way of a k-way merge, so each of them
+    must already be in Predict Time order.  Records with the same
+    Predict Time are given in the order of the *sources* they are from.
+
+    If *last* is given, it is the dict from last_sources(), and only
+    the records from the last of the *sources* that each key is in are
+    given.
+
+    A ValueError is raised as soon as a record from one of the *sources*
+    has an earlier Predict Time than the one before it in that source,
+    which is named by the matching entry of *names*, if given.
+    index_sources() tells whether they are all in order first, and
+    concat() takes those that aren't.
+    """
+    def tagged(records, i):
+        previous = None
+        for n, r in enumerate(records, start=1):
+            item = (i, r)
+            if previous is not None and _predict_time(item) < previous:
+                raise ValueError(
+                    "Record {} of {} has a Predict Time ({}) that is "
+                    "before the one before it ({}), so it is not in "
+                    "Predict Time order.".format(
+                        n,
+                        names[i] if names is not None else f"source {i}",
+                        _predict_time(item), previous
+                    )
+                )
+            previous = _predict_time(item)
+            yield item
+
+    for i, r in heapq.merge(
+        *(tagged(s, i) for i, s in enumerate(sources)), key=_predict_time
+    ):
+        if last is None or last[join_key(r)] == i:
+            yield r
+
+
+def concat(sources: list, last=None):
+    """Yields the records of each of the *sources* list of iterables of
+    records in turn, which, unlike with merge(), can be in any order.
+
+    If *last* is given, it is the dict from last_sources(), and only
+    the records from the last of the *sources* that each key is in are
+    given, so a record that is in a later source is given where it is
+    in that source.
+    """
+    for i, records in enumerate(sources):
+        for r in records:
+            if last is None or last[join_key(r)] == i:
+                yield r
+
+
+def write_csv(f, records):
+    """Writes the *records* iterable to the file *f* as CSV, with the
+    fields of the first record.
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return
+    fieldnames = list(first)
+
+    def project(r):
+        # Records from other files may have fieldnames in another case.
+        return {k: r.get(k, "") for k in fieldnames}
+
+    pr.dict_write(
+        f, fieldnames, map(project, itertools.chain((first,), records))
+    )
+
+
+def _predict_time(item):
+    try:
+        return item[1]["Predict Time"] or ""
+    except KeyError:
+        return ""
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,14 +30,19 @@ a 6 becomes 11360, a 2 becomes 11320, etc.
 
 import argparse
 import csv
+import io
 import logging
 import os
 
+import cippd_client
 import priority_rewrite as pr
+import profiling
 import ptf
 
 
 def main():
+    cippd_client.forward("special_priorities")
+
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument(
         "-v",
@@ -53,8 +58,10 @@ def main():
     parser.add_argument(
         "wth", nargs="+", help="File(s) with text copied from WTH list."
     )
+    profiling.add_arguments(parser)
 
     args = parser.parse_args()
+    profiling.start(args)
 
     logging.basicConfig(
         format="%(levelname)s: %(message)s", level=(30 - 10 * args.verbose)
@@ -73,6 +80,7 @@ def main():
         print(out_str)
 
 
+@profiling.timed("read WTH")
 def get_special_priorities(path: os.PathLike) -> dict:
     """Returns a dict whose keys are suggestion IDs, and
     whose values are integer priorities.
@@ -83,7 +91,7 @@ def get_special_priorities(path: os.PathLike) -> dict:
     priority and converted to an integer.
     """
     d = {}
-    with open(path, newline="", encoding=ptf.guess_encoding(path)) as f:
+    with io.StringIO(ptf.read_text(path), newline="") as f:
         reader = csv.reader(f)
         for row in reader:
             if row:
@@ -91,6 +99,7 @@ def get_special_priorities(path: os.PathLike) -> dict:
     return d
 
 
+@profiling.timed("special")
 def apply_priorities(records: list, basepriority: int, specials: dict):
     """For each item in *records* that has *basepriority*, its suggestion
     number is checked for in *specials*.  If present, the priority of the
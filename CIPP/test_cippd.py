@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""This module has tests for the cippd server."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+import cippd
+import cippd_client
+import orbit_count as oc
+import prioritize_by_orbit as pbo
+import priority_rewrite as pr
+import profiling
+import ptf
+from bench import synthetic
+
+half_widths = ((17000, 40), (14600, 30), (13000, 20), (10000, 15), (0, 0))
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.path = os.path.join(self.tmpdir, "s.ptf")
+        synthetic.make_ptf(300, orbits=30, seed=7).dump(self.path)
+
+        self.socket = os.path.join(self.tmpdir, "cippd.sock")
+        server = cippd.Server(self.socket)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+        self.addCleanup(stop)
+
+    def request(self, command, **kwargs):
+        return cippd_client.request(
+            command, self.socket, cwd=self.tmpdir, **kwargs
+        )
+
+    def test_workspace(self):
+        self.assertTrue(self.request("load", name="hit", path="s.ptf")["ok"])
+        self.assertTrue(self.request("prioritize", name="hit")["ok"])
+        count = self.request("count", name="hit")
+        self.assertTrue(self.request("rewrite", name="hit")["ok"])
+        written = self.request("write", name="hit")
+
+        # The same steps, the way the programs do them.
+        p = ptf.load(self.path)
+        records = pbo.prioritize_by_orbit(p, half_widths)
+        records.sort(key=lambda x: int(x["Orbit Number"][:-1]))
+        p = ptf.loads(pr.write_output(p, records))
+        self.assertEqual(
+            "\n".join(oc.format_report(oc.orbit_count(p))) + "\n",
+            count["stdout"]
+        )
+        records = pr.priority_rewrite(p)
+        records.sort(key=lambda x: int(x["Request Priority"]), reverse=True)
+        expected = pr.write_output(p, records)
+        self.assertEqual(
+            [x for x in expected.splitlines() if "CREATION_DATE" not in x],
+            [x for x in written["stdout"].splitlines()
+             if "CREATION_DATE" not in x][:-1]
+        )
+
+        self.assertIn(
+            f"hit: {len(records)} records", self.request("list")["stdout"]
+        )
+        self.assertTrue(self.request("drop", name="hit")["ok"])
+        response = self.request("count", name="hit")
+        self.assertFalse(response["ok"])
+        self.assertIn("hit", response["error"])
+
+    def test_run(self):
+        response = self.request("run", program="orbit_count",
+                                argv=["-f", "csv", "s.ptf"])
+        self.assertEqual(0, response["status"])
+        self.assertEqual(
+            oc.format_csv(oc.orbit_count(ptf.load(self.path))),
+            response["stdout"]
+        )
+
+        response = self.request("run", program="orbit_count", argv=["-x"])
+        self.assertEqual(2, response["status"])
+        self.assertIn("usage:", response["stderr"])
+
+        response = self.request("run", program="os", argv=[])
+        self.assertFalse(response["ok"])
+
+    def test_run_profile(self):
+        # Profiling only lasts for the one run, and its report goes back
+        # with the output.
+        response = self.request("run", program="orbit_count",
+                                argv=["--profile", "s.ptf"])
+        self.assertEqual(0, response["status"])
+        self.assertIn("Stage", response["stderr"])
+        self.assertFalse(profiling.enabled)
+        self.assertFalse(tracemalloc.is_tracing())
+
+        response = self.request("run", program="orbit_count",
+                                argv=["s.ptf"], profile="1")
+        self.assertIn("Stage", response["stderr"])
+        response = self.request("run", program="orbit_count",
+                                argv=["s.ptf"], profile="")
+        self.assertNotIn("Stage", response["stderr"])
+        self.assertFalse(profiling.enabled)
+
+    def test_run_parses_once(self):
+        # The server keeps each file that the programs read in memory
+        # (as serve() sets up), even those that stream their input.
+        init = ptf.PTFReader.__init__
+        with patch("ptf_cache.memory", dict()):
+            with patch.object(ptf.PTFReader, "__init__", autospec=True,
+                              side_effect=init) as m:
+                for program in ("orbit_count", "orbit_count", "ptf2csv",
+                                "ptf2csv", "orbit_count"):
+                    response = self.request("run", program=program,
+                                            argv=["s.ptf"])
+                    self.assertEqual(0, response["status"])
+        self.assertEqual(2, m.call_count)
+        self.assertEqual(
+            "\n".join(oc.format_report(oc.orbit_count(ptf.load(self.path))))
+            + "\n",
+            response["stdout"]
+        )
+
+    def test_forward(self):
+        out = io.StringIO()
+        with patch.dict(os.environ, {"CIPP_DAEMON": self.socket}):
+            with contextlib.redirect_stdout(out):
+                with self.assertRaises(SystemExit) as cm:
+                    cippd_client.forward("orbit_count", [self.path])
+        self.assertEqual(0, cm.exception.code)
+        self.assertIn("Orbit", out.getvalue())
+
+        # If there's no server, the program carries on.
+        err = io.StringIO()
+        with patch.dict(os.environ, {"CIPP_DAEMON": self.socket + "x"}):
+            with contextlib.redirect_stderr(err):
+                self.assertIsNone(cippd_client.forward("orbit_count", []))
+        self.assertIn("WARNING", err.getvalue())
+        with patch.dict(os.environ, {"CIPP_DAEMON": ""}):
+            self.assertIsNone(cippd_client.forward("orbit_count", []))
+
+    def test_bad_requests(self):
+        self.assertFalse(self.request("nonsense")["ok"])
+        self.assertFalse(self.request("load", name="x")["ok"])
+        with cippd_client.Connection(self.socket) as conn:
+            conn._file.write(b"[1, 2]\n")
+            conn._file.flush()
+            self.assertIn(b'"ok": false', conn._file.readline())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""This module has tests for the orbit_count functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+import orbit_count as oc
+import ptf
+
+
+def record(orbit, priority):
+    return ptf.PTFDict({'Orbit Number': orbit,
+                        'Request Priority': priority})
+
+
+class TestFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [record('103a', '5'), record('100a', '-3'),
+                        record('100d', '7'), record('107a', ''),
+                        record('103a', '0'), record('100a', '1')]
+        self.reports = [{'orbit': 100, 'pos': 2, 'neg': 1},
+                        {'orbit': 103, 'pos': 1, 'neg': 1},
+                        {'orbit': 107, 'pos': 0, 'neg': 0}]
+
+    def test_orbit_count(self):
+        self.assertEqual(self.reports, oc.orbit_count(iter(self.records)))
+        p = ptf.PTF({}, ptf.fieldnames, self.records)
+        self.assertEqual(self.reports, oc.orbit_count(p))
+
+    def test_find_gaps(self):
+        self.assertEqual([(101, 102), (104, 106)],
+                         oc.find_gaps([100, 103, 107]))
+        self.assertEqual([(101, 102), (104, 106)],
+                         oc.find_gaps([107, 100, 103, 103]))
+        self.assertEqual([], oc.find_gaps([5, 6, 7]))
+        self.assertEqual([], oc.find_gaps([]))
+        self.assertEqual(['101-102', '104'],
+                         oc.format_ranges([(101, 102), (104, 104)]))
+        self.assertEqual([101, 102, 104, 105, 106],
+                         oc.find_empty_orbits(self.reports))
+
+    def test_format_report(self):
+        lines = oc.format_report(self.reports)
+        self.assertEqual(['Orbit (3) # obs # negative obs',
+                          '--------- ----- --------------',
+                          '100         2   1             '], lines[:3])
+        self.assertEqual('    5    =  3  + 2             ', lines[6])
+        self.assertEqual('# of Observations:  2   1   0 ', lines[8])
+        self.assertEqual(['Empty Orbits', '------------', '101-102',
+                          '104-106'], lines[-4:])
+
+    def test_format_json(self):
+        d = json.loads(oc.format_json(self.reports))
+        self.assertEqual(self.reports, d['orbits'])
+        self.assertEqual(3, d['pos'])
+        self.assertEqual(2, d['neg'])
+        self.assertEqual({'0': 1, '1': 1, '2': 1}, d['histogram'])
+        self.assertEqual([[101, 102], [104, 106]], d['empty'])
+
+    def test_format_csv(self):
+        self.assertEqual(
+            'orbit,pos,neg\r\n100,2,1\r\n103,1,1\r\n107,0,0\r\n',
+            oc.format_csv(self.reports)
+        )
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""This module has tests for the pipeline functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import orbit_count as oc
+import pipeline
+import prioritize_by_orbit as pbo
+import priority_rewrite as pr
+import ptf
+import special_priorities as sp
+from bench import synthetic
+
+half_widths = ((17000, 40), (14600, 30), (13000, 20), (10000, 15), (0, 0))
+
+
+class TestStages(unittest.TestCase):
+
+    def test_split_stages(self):
+        self.assertEqual(
+            [["special", "w.txt"], ["prioritize", "-a"], ["rewrite"]],
+            pipeline.split_stages(
+                ["special", "w.txt", "then", "prioritize", "-a", "then",
+                 "rewrite", "then"]
+            )
+        )
+
+    def test_parse_stages(self):
+        stages = pipeline.parse_stages([
+            ["prioritize", "-a", "-r"],
+            "rewrite -k -r 800:700",
+            {"command": "count", "format": "csv"},
+        ])
+        self.assertEqual(
+            ["prioritize", "rewrite", "count"], [s[0] for s in stages]
+        )
+        self.assertEqual(-1, stages[0][1]["high_alt"])
+        self.assertEqual(8.8, stages[0][1]["high_roll"])
+        self.assertEqual(
+            {"reset": "800:700", "keepzero": True}, stages[1][1]
+        )
+        self.assertEqual({"format": "csv"}, stages[2][1])
+
+        for bad in (
+            [["frob"]],
+            [["prioritize", "--nope"]],
+            [{"command": "prioritize", "nope": 1}],
+            [{"format": "csv"}],
+        ):
+            with self.subTest(bad=bad):
+                self.assertRaises(ValueError, pipeline.parse_stages, bad)
+
+
+class TestRun(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.path = os.path.join(self.tmpdir, "s.ptf")
+        p = synthetic.make_ptf(300, orbits=30, seed=7)
+        p.dump(self.path)
+
+        ids = [
+            r["Team Database ID"] for r in p
+            if r["Request Priority"] == "11000"
+        ]
+        self.wth = os.path.join(self.tmpdir, "wth.txt")
+        with open(self.wth, "w") as f:
+            for i, tdid in enumerate(ids[:20:2]):
+                f.write(f"{tdid},{i + 1}\n")
+
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def test_run(self):
+        stages = pipeline.parse_stages(pipeline.split_stages(
+            ["special", self.wth, "then", "prioritize", "-a", "then", "count",
+             "then", "rewrite", "-r", "800:700"]
+        ))
+        snapshots = os.path.join(self.tmpdir, "snapshots")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            workspace = pipeline.run(self.path, stages, snapshots)
+        result = os.path.join(self.tmpdir, "result.ptf")
+        workspace.write("pipeline", result)
+
+        # The same steps, the way the programs do them, each one
+        # reading what the one before it wrote.
+        p = ptf.load(self.path)
+        records = sp.apply_priorities(
+            p, 11000, sp.get_special_priorities(self.wth)
+        )
+        special = pr.write_output(p, records)
+        p = ptf.loads(special)
+        records = pbo.prioritize_by_orbit(p, half_widths, high_alt=-1)
+        records.sort(key=lambda x: int(x["Orbit Number"][:-1]))
+        prioritized = pr.write_output(p, records)
+        p = ptf.loads(prioritized)
+        self.assertEqual(
+            "\n".join(oc.format_report(oc.orbit_count(p))) + "\n",
+            out.getvalue()
+        )
+        records = pr.priority_rewrite(p, "800:700")
+        records.sort(key=lambda x: int(x["Request Priority"]), reverse=True)
+        expected = pr.write_output(p, records)
+
+        def lines(text):
+            return [
+                x for x in text.splitlines() if "CREATION_DATE" not in x
+            ]
+
+        def read(path):
+            with open(path) as f:
+                return lines(f.read())
+
+        self.assertEqual(lines(expected), read(result))
+        self.assertEqual(
+            ["01_special.ptf", "02_prioritize.ptf", "03_count.ptf",
+             "04_rewrite.ptf"],
+            sorted(os.listdir(snapshots))
+        )
+        self.assertEqual(
+            lines(special), read(os.path.join(snapshots, "01_special.ptf"))
+        )
+        self.assertEqual(
+            lines(prioritized),
+            read(os.path.join(snapshots, "02_prioritize.ptf"))
+        )
+
+    def test_compact(self):
+        # The programs give the same results with PTFRecords as PTFDicts.
+        results = list()
+        for compact in (False, True):
+            p = ptf.load(self.path, compact=compact)
+            sp.apply_priorities(
+                p, 11000, sp.get_special_priorities(self.wth)
+            )
+            records = pbo.prioritize_by_orbit(
+                p, half_widths, high_alt=-1, jobs=2
+            )
+            records = pr.priority_rewrite(records, "800:700")
+            results.append(
+                (oc.orbit_count(p), [dict(r) for r in records])
+            )
+        self.assertIsInstance(p[0], ptf.PTFRecord)
+        self.assertEqual(results[0], results[1])
+
+    def test_read_recipe(self):
+        path = os.path.join(self.tmpdir, "r.json")
+        with open(path, "w") as f:
+            json.dump({"input": "s.ptf", "stages": ["rewrite"]}, f)
+        self.assertEqual(["rewrite"], pipeline.read_recipe(path)["stages"])
+
+        with open(path, "w") as f:
+            json.dump({"stages": "rewrite"}, f)
+        self.assertRaises(ValueError, pipeline.read_recipe, path)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+"""This module has tests for the prioritize_by_orbit functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import prioritize_by_orbit as pbo
+import ptf
+from bench import synthetic
+
+half_widths = ((17000, 40), (14600, 30), (13000, 20), (10000, 15), (0, 0))
+
+
+def record(tdid, orbit, priority, latitude, spare4=''):
+    return ptf.PTFDict({'Latitude': str(latitude),
+                        'Orbit Number': orbit,
+                        'Orbit Alternatives': orbit,
+                        'Spare 4': spare4,
+                        'Request Priority': str(priority),
+                        'Team Database ID': str(tdid),
+                        'Roll Angle': '0.000'})
+
+
+def merge(intervals):
+    # The original, sort-everything-and-merge, Intervals.add() logic.
+    merged = list()
+    for higher in sorted(intervals, key=lambda x: x[0]):
+        if merged and higher[0] <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], higher[1]))
+        else:
+            merged.append(higher)
+    return merged
+
+
+class TestIntervals(unittest.TestCase):
+
+    def test_add(self):
+        i = pbo.Intervals(list(half_widths))
+        i.add(0, 16000)
+        self.assertEqual([(-40, 40)], i.intervals)
+        i.add(60, 800)
+        self.assertEqual([(-40, 40), (45, 75)], i.intervals)
+        # Touching intervals are merged.
+        i.add(-55, 800)
+        self.assertEqual([(-70, 40), (45, 75)], i.intervals)
+        i.add(42, 10000)
+        self.assertEqual([(-70, 75)], i.intervals)
+        self.assertEqual('[(-70.0, 75.0)]', str(i))
+
+    def test_is_in(self):
+        i = pbo.Intervals.from_intervals([(20, 30), (-10, 0), (5, 6)])
+        self.assertEqual([(-10, 0), (5, 6), (20, 30)], i.intervals)
+        for p in (-10, -5, 0, 5, 6, 20, 25.5, 30):
+            self.assertTrue(i.is_in(p), p)
+        for p in (-10.1, 0.1, 4.9, 6.1, 19, 30.1):
+            self.assertFalse(i.is_in(p), p)
+        self.assertFalse(pbo.Intervals().is_in(0))
+
+    def test_matches_merge(self):
+        rnd = random.Random(5)
+        for trial in range(200):
+            added = list()
+            i = pbo.Intervals()
+            for n in range(rnd.randrange(1, 30)):
+                low = rnd.randrange(-90, 90)
+                new = (low, low + rnd.choice((0, 1, 2, 5, 15)))
+                added.append(new)
+                i.add_interval(*new)
+                self.assertEqual(merge(added), i.intervals)
+            self.assertEqual(
+                merge(added),
+                pbo.Intervals.from_intervals(added).intervals
+            )
+            for p in range(-95, 110):
+                self.assertEqual(
+                    any(a <= p <= b for a, b in added), i.is_in(p)
+                )
+
+
+class TestHalfWidths(unittest.TestCase):
+
+    def test_get(self):
+        hw = pbo.HalfWidths(half_widths[:-1])
+        self.assertEqual(half_widths, hw)
+        self.assertEqual(40, hw.get())
+        for priority in range(-1, 17001):
+            # The linear scan that get() replaces.
+            for i in range(len(half_widths) - 1):
+                if half_widths[i][0] > priority >= half_widths[i + 1][0]:
+                    self.assertEqual(half_widths[i][1], hw.get(priority))
+                    break
+            else:
+                self.assertRaises(ValueError, hw.get, priority)
+        self.assertIs(hw, pbo.Intervals(hw).half_widths)
+
+    def test_invalid(self):
+        for table in (
+            [(17000, 40), (14600, 50), (15000, 30)],
+            [(17000, 40), (17000, 30)],
+            [(17000, 30), (14600, 40)],
+            [(17000, 40), (14600, 30), (13000, 35), (0, 0)],
+            [(17000, -1)],
+            [(17000, 'forty')],
+            [(17000, 40, 1)],
+            [(1.5, 4)],
+            [(-10, 4)],
+            [],
+        ):
+            with self.subTest(table=table):
+                self.assertRaises(ValueError, pbo.HalfWidths, table)
+
+    def test_parse_half_widths(self):
+        self.assertEqual(
+            {"17000:40,14600:30,13000:20,10000:15,0:0": half_widths},
+            pbo.parse_half_widths("17000:40, 14600:30,13000:20,10000:15")
+        )
+        self.assertRaises(ValueError, pbo.parse_half_widths, "17000,40")
+        self.assertRaises(ValueError, pbo.parse_half_widths, "100:4,200:4")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "narrow.json")
+            with open(path, "w") as f:
+                json.dump([[17000, 20], [10000, 10]], f)
+            self.assertEqual(
+                {"narrow": ((17000, 20), (10000, 10), (0, 0))},
+                pbo.parse_half_widths(path)
+            )
+
+            with open(path, "w") as f:
+                json.dump({"a": half_widths, "b": [[5000, 1]]}, f)
+            self.assertEqual(
+                {"a": half_widths, "b": ((5000, 1), (0, 0))},
+                pbo.parse_half_widths(path)
+            )
+
+            with open(path, "w") as f:
+                json.dump({"a": [[5000, 1], [6000, 1]]}, f)
+            self.assertRaisesRegex(
+                ValueError, "a in .*narrow.json", pbo.parse_half_widths, path
+            )
+
+            if pbo.tomllib is not None:
+                path = os.path.join(tmpdir, "tables.toml")
+                with open(path, "w") as f:
+                    f.write("wide = [[17000, 45], [10000, 22.5]]\n")
+                self.assertEqual(
+                    {"wide": ((17000, 45), (10000, 22.5), (0, 0))},
+                    pbo.parse_half_widths(path)
+                )
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_prioritize_by_orbit(self):
+        records = [record(1, '100a', 16000, 0),
+                   record(2, '100a', 800, 50),
+                   record(3, '100a', 800, 70),
+                   record(4, '100a', 800, 10)]
+        out = pbo.prioritize_by_orbit(records, list(half_widths), 2)
+        # Of the tied records, 4 is tried first for being closest to the
+        # equator, but is too close to 1.
+        self.assertEqual(['1', '4', '2', '3'],
+                         [r['Team Database ID'] for r in out])
+        self.assertEqual([16000, -800, 800, -800],
+                         [r['Request Priority'] for r in out])
+
+    def test_sporc(self):
+        # Record 2 is excluded by record 1, so its SPORC partner, 3, has
+        # to go, which then lets record 4 into orbit 200.
+        records = [record(1, '100a', 16000, 0),
+                   record(2, '100a', 11000, 10, 'SPORC001:3 r=8'),
+                   record(3, '200a', 15000, 0, 'SPORC001:2 r=8'),
+                   record(4, '200a', 12000, 10),
+                   record(5, '300a', 5000, 0)]
+        out = pbo.prioritize_by_orbit(records, list(half_widths))
+        self.assertEqual(['1', '2', '4', '3', '5'],
+                         [r['Team Database ID'] for r in out])
+        self.assertEqual([16000, -11000, 12000, -15000, 5000],
+                         [int(r['Request Priority']) for r in out])
+
+        # Both halves of the SPORC are deprioritized in the input, too.
+        self.assertEqual([-11000, -15000],
+                         [records[1]['Request Priority'],
+                          records[2]['Request Priority']])
+
+    def test_zero_sporc(self):
+        # Record 2 can't be given a lower priority than zero, but its
+        # SPORC partner, 3, still has to go.
+        records = [record(1, '100a', 16000, 0),
+                   record(2, '100a', 0, 10, 'SPORC001:3 r=8'),
+                   record(3, '200a', 15000, 0, 'SPORC001:2 r=8'),
+                   record(4, '200a', 12000, 10)]
+        out = pbo.prioritize_by_orbit(records, list(half_widths))
+        self.assertEqual(['1', '2', '4', '3'],
+                         [r['Team Database ID'] for r in out])
+        self.assertEqual([16000, 0, 12000, -15000],
+                         [int(r['Request Priority']) for r in out])
+        self.assertEqual(-15000, records[2]['Request Priority'])
+
+    def test_high_roll(self):
+        def records(roll1, roll2):
+            r = [record(1, '100a', 16000, 0), record(2, '100a', 15000, 2)]
+            r[0]['Roll Angle'] = roll1
+            r[1]['Roll Angle'] = roll2
+            return r
+
+        out = pbo.prioritize_by_orbit(records('10.0', '0.000'),
+                                      list(half_widths), high_roll=8.8)
+        self.assertEqual([16000, 15000],
+                         [int(r['Request Priority']) for r in out])
+
+        out = pbo.prioritize_by_orbit(records('', 'N/A'), list(half_widths))
+        self.assertEqual([16000, -15000],
+                         [int(r['Request Priority']) for r in out])
+
+        for rolls in (('10.0', ''), ('N/A', '0.000')):
+            with self.subTest(rolls=rolls):
+                self.assertRaises(ValueError, pbo.prioritize_by_orbit,
+                                  records(*rolls), list(half_widths),
+                                  high_roll=8.8)
+
+    def test_trace(self):
+        records = [record(1, '100a', 16000, 0),
+                   record(2, '100a', 11000, 10, 'SPORC001:3 r=8'),
+                   record(3, '200a', 15000, 0, 'SPORC001:2 r=8'),
+                   record(4, '200a', 12000, 10)]
+        events = list()
+        pbo.prioritize_by_orbit(records, list(half_widths), trace=events.append)
+        self.assertEqual(
+            [('1', 100, 'kept'), ('2', 100, 'excluded'),
+             ('2', 100, 'sporc'), ('3', 200, 'sporc'),
+             ('1', 100, 'kept'), ('2', 100, 'negative'),
+             ('4', 200, 'kept'), ('3', 200, 'negative')],
+            [(e['id'], e['orbit'], e['reason']) for e in events]
+        )
+        self.assertEqual({'id': '2', 'orbit': 100, 'reason': 'excluded',
+                          'priority': -11000, 'latitude': 10.0,
+                          'intervals': [(-40.0, 40.0)]}, events[1])
+
+    def test_optimize_orbit(self):
+        hw = pbo.Intervals(list(half_widths)).get_half_width
+        # Greedy would take the equatorial row 1, which excludes both 2 and 3.
+        candidates = [(1, 800, 800, 0), (2, 800, 801, -12), (3, 800, 802, 12),
+                      (4, 5000, 5000, 50)]
+        self.assertEqual({2, 3, 4}, pbo.optimize_orbit(candidates, 4, hw))
+        # No number of lower priorities outweighs a higher one.
+        self.assertEqual({4}, pbo.optimize_orbit(candidates, 1, hw))
+        candidates[0] = (1, 11000, 11000, 0)
+        self.assertEqual({1, 4}, pbo.optimize_orbit(candidates, 4, hw))
+        self.assertEqual(set(), pbo.optimize_orbit(candidates, 0, hw))
+        self.assertEqual(set(), pbo.optimize_orbit([], 4, hw))
+
+    def test_optimize(self):
+        records = [record(1, '100a', 800, 0),
+                   record(2, '100a', 800, -12),
+                   record(3, '100a', 800, 12, 'SPORC001:5 r=8'),
+                   record(4, '100a', 5000, 50),
+                   record(5, '200a', 800, 0, 'SPORC001:3 r=8')]
+        greedy = pbo.prioritize_by_orbit(copy.deepcopy(records),
+                                         list(half_widths))
+        self.assertEqual(2, pbo.count_kept(greedy))
+        events = list()
+        out = pbo.prioritize_by_orbit(records, list(half_widths),
+                                      trace=events.append, optimize=True)
+        self.assertEqual(4, pbo.count_kept(out))
+        self.assertEqual(['4', '1', '3', '2', '5'],
+                         [r['Team Database ID'] for r in out])
+        self.assertEqual([5000, -800, 800, 800, 800],
+                         [int(r['Request Priority']) for r in out])
+        self.assertEqual(('1', 'optimized'),
+                         (events[1]['id'], events[1]['reason']))
+
+        self.assertEqual(
+            "Kept 332 observations, 1 fewer than the 333 kept without "
+            "--optimize.",
+            pbo.format_kept(332, 333)
+        )
+        self.assertIn(", 2 more than", pbo.format_kept(4, 2))
+
+    def test_shard_orbits(self):
+        records = [record(1, '100a', 16000, 0),
+                   record(2, '100a', 11000, 10, 'SPORC001:3 r=8'),
+                   record(3, '300a', 15000, 0, 'SPORC001:2 r=8'),
+                   record(4, '200a', 12000, 10),
+                   record(5, '200a', 5000, 0),
+                   record(6, '400a', 5000, 0)]
+        cols = ptf.columns(records)
+        self.assertEqual([[0, 1, 2], [3, 4], [5]], pbo.shard_orbits(cols, 3))
+        self.assertEqual([[0, 1, 2], [3, 4, 5]], pbo.shard_orbits(cols, 2))
+        self.assertEqual([list(range(6))], pbo.shard_orbits(cols, 1))
+
+    def test_jobs(self):
+        records = synthetic.make_records(600, orbits=60, sporc=0.03)
+        serial_in = [copy.copy(r) for r in records]
+        parallel_in = [copy.copy(r) for r in records]
+        serial_trace = list()
+        parallel_trace = list()
+        with self.assertLogs(pbo.logger, level="INFO") as serial_logs:
+            serial = pbo.prioritize_by_orbit(
+                serial_in, list(half_widths), high_alt=5, high_roll=8.8,
+                trace=serial_trace.append
+            )
+        with self.assertLogs(pbo.logger, level="INFO") as parallel_logs:
+            parallel = pbo.prioritize_by_orbit(
+                parallel_in, list(half_widths), high_alt=5, high_roll=8.8,
+                jobs=3, trace=parallel_trace.append
+            )
+        self.assertEqual(3, len(pbo.shard_orbits(ptf.columns(records), 3)))
+        self.assertEqual([dict(r) for r in serial],
+                         [dict(r) for r in parallel])
+        self.assertEqual(serial_in, parallel_in)
+        self.assertNotEqual(records, parallel_in)
+        self.assertEqual(sorted(serial_logs.output),
+                         sorted(parallel_logs.output))
+        self.assertCountEqual(serial_trace, parallel_trace)
+
+    def test_sweep(self):
+        records = synthetic.make_records(600, orbits=60, sporc=0.03)
+        before = [dict(r) for r in records]
+        tables = {"default": half_widths, "narrow": [(17000, 10), (0, 0)]}
+        expected = dict()
+        for name, table in tables.items():
+            expected[name] = pbo.count_kept(pbo.prioritize_by_orbit(
+                [copy.copy(r) for r in records], table, high_roll=8.8
+            ))
+        self.assertLess(expected["default"], expected["narrow"])
+        self.assertEqual(expected,
+                         pbo.sweep(records, tables, high_roll=8.8))
+        self.assertEqual(before, [dict(r) for r in records])
@@ -20,6 +20,7 @@ import unittest
 from unittest.mock import patch, mock_open
 
 import priority_rewrite as pr
+import ptf
 
 
 hitlist = '''Instrument Set,Predict Time,Latitude,Longitude,Elevation,Observation Type,Orbit Number,Orbit Alternatives,Observation Duration,Setup Duration,Orbital Data Table,Parameters Table,Sequence Filename,Downlink Priority,Product ID,Spare 1,Spare 2,Spare 3,Spare 4,Comment,Request Priority,Coordinated Track History,Raw Data Volume,Team Database ID,Request Category,Compression,Pixel Scale,Observation Mode,Ancillary Data,LsubS,Roll Angle,
@@ -39,16 +40,17 @@ def my_mock_open(read_data):
     # my_mock_open() can be replaced with mock_open().
     m = mock_open(read_data=read_data)
     m.return_value.__iter__ = lambda self: self
-    m.return_value.__next__ = lambda self: next(iter(self.readline, ''))
+    m.return_value.__next__ = lambda self: next(iter(self.readline,
+                                                     read_data[:0]))
     return m
 
 
 class TestFunctions(unittest.TestCase):
 
     def test_get_input(self):
-        m = my_mock_open(read_data=hitlist)
+        m = my_mock_open(read_data=hitlist.encode())
         with patch('priority_rewrite.open', m):
-            with patch('ptf.open', m):
+            with patch('ptf_cache.open', m):
                 targets = pr.get_input('dummy/path/to/hitlist')
                 self.assertEqual(4, len(targets))
 
@@ -60,9 +62,9 @@ class TestFunctions(unittest.TestCase):
         self.assertIn('A,B', f.getvalue())
 
     def test_write_output(self):
-        m = my_mock_open(read_data=hitlist)
+        m = my_mock_open(read_data=hitlist.encode())
         with patch('priority_rewrite.open', m):
-            with patch('ptf.open', m):
+            with patch('ptf_cache.open', m):
                 targets = pr.get_input('dummy/path/to/hitlist')
                 out_str = pr.write_output(targets, targets)
                 self.assertEqual(5, len(out_str.splitlines()))
@@ -104,3 +106,23 @@ class TestFunctions(unittest.TestCase):
                                                   ('Name', 'One at priority 800'),
                                                   ('Latitude', 40)]),
                          pr.priority_rewrite(r, '800:700')[0])
+
+    def test_priority_rewrite_columns(self):
+        def read():
+            m = my_mock_open(read_data=hitlist.encode())
+            with patch('ptf_cache.open', m):
+                return pr.get_input('dummy/path/to/hitlist')
+
+        # Only the records that share a priority are put in order by
+        # Latitude, so only they need one.
+        targets = read()
+        targets[0]['Latitude'] = ''
+        new = pr.priority_rewrite(ptf.ColumnarPTF(targets))
+        self.assertEqual(['160087', '118256', '169940', '164320'],
+                         [r['Team Database ID'] for r in new])
+        self.assertEqual([15000, 15001, 16300, 16500],
+                         [r['Request Priority'] for r in new])
+
+        targets = read()
+        targets[2]['Latitude'] = 'N/A'
+        self.assertRaises(ValueError, pr.priority_rewrite, targets)
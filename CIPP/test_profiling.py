@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""This module has tests for the profiling functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import io
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import profiling
+import ptf
+from bench import synthetic
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.parser = argparse.ArgumentParser()
+        profiling.add_arguments(self.parser)
+        self.addCleanup(profiling.stop, io.StringIO())
+        # What an earlier profiled run (in this or another test) left.
+        profiling.stages.clear()
+        profiling.counters.clear()
+
+        env = patch.dict(os.environ, {"CIPP_PROFILE": ""})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_off(self):
+        self.assertFalse(profiling.start(self.parser.parse_args([])))
+        with profiling.stage("a"):
+            profiling.count("b")
+        self.assertEqual(dict(), profiling.stages)
+        self.assertEqual(0, profiling.counters["b"])
+
+    def test_report(self):
+        self.assertTrue(profiling.start(self.parser.parse_args(["--profile"])))
+        ptf.loads(synthetic.make_ptf(20, seed=3).dumps())
+        with profiling.stage("outer"):
+            with profiling.stage("inner"):
+                x = [0] * 100000
+            del x
+        out = io.StringIO()
+        profiling.stop(out)
+        self.assertFalse(profiling.enabled)
+
+        self.assertEqual(20, profiling.counters["records parsed"])
+        self.assertEqual(1, profiling.stages["parse"][0])
+        outer = profiling.stages["outer"]
+        inner = profiling.stages["inner"]
+        self.assertGreaterEqual(outer[1], inner[1])
+        self.assertGreaterEqual(inner[2], 800000)
+        self.assertGreaterEqual(outer[2], inner[2])
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("Stage"))
+        self.assertTrue(any(x.startswith("records parsed") for x in lines))
+
+    def test_output(self):
+        path = os.path.join(self.tmpdir, "p.json")
+        with patch.dict(os.environ, {"CIPP_PROFILE": path}):
+            self.assertTrue(profiling.start(self.parser.parse_args([])))
+        with profiling.stage("a"):
+            profiling.count("b", 2)
+        profiling.stop(io.StringIO())
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual({"b": 2}, report["counters"])
+        self.assertEqual(1, report["stages"]["a"]["calls"])
+
+        path = os.path.join(self.tmpdir, "p.prof")
+        profiling.start(
+            self.parser.parse_args(["--profile_output", path])
+        )
+        ptf.loads(synthetic.make_ptf(20, seed=3).dumps())
+        profiling.stop(io.StringIO())
+        self.assertIn(
+            "parse",
+            [k[2] for k in pstats.Stats(path).stats.keys()]
+        )
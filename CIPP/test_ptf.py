@@ -14,6 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+import csv
+import io
+import math
+import os
+import pickle
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
 
@@ -89,6 +96,142 @@ class TestVariables(unittest.TestCase):
         self.assertTupleEqual(fn, ptf.fieldnames)
 
 
+class TestPTFDict(unittest.TestCase):
+
+    def test_case_insensitive(self):
+        d = ptf.PTFDict({'Orbit Number': '59593a', 'Latitude': '2.906'})
+        self.assertEqual('59593a', d['orbit number'])
+        self.assertEqual('2.906', d['LATITUDE'])
+        self.assertRaises(KeyError, d.__getitem__, 'Longitude')
+
+        d['orbit NUMBER'] = '59594a'
+        self.assertEqual('59593a', d['ORBIT NUMBER'])
+        del d['Orbit Number']
+        self.assertEqual('59594a', d['Orbit number'])
+        del d['orbit NUMBER']
+        self.assertRaises(KeyError, d.__getitem__, 'Orbit Number')
+
+    def test_copy(self):
+        d = ptf.PTFDict({'Latitude': '2.906'})
+        c = copy.copy(d)
+        c['Longitude'] = '339.281'
+        self.assertEqual('339.281', c['longitude'])
+        self.assertRaises(KeyError, d.__getitem__, 'longitude')
+
+
+class TestPTFRecord(unittest.TestCase):
+
+    def test_case_insensitive(self):
+        d = ptf.PTFRecord({'Orbit Number': '59593a', 'Latitude': '2.906'})
+        self.assertEqual('59593a', d['orbit number'])
+        self.assertEqual('2.906', d['LATITUDE'])
+        self.assertRaises(KeyError, d.__getitem__, 'Longitude')
+        self.assertNotIn('latitude', d)
+        self.assertEqual('2.906', d.get('latitude'))
+
+        d['orbit NUMBER'] = '59594a'
+        self.assertEqual('59593a', d['ORBIT NUMBER'])
+        del d['Orbit Number']
+        self.assertEqual('59594a', d['Orbit number'])
+        del d['orbit NUMBER']
+        self.assertRaises(KeyError, d.__getitem__, 'Orbit Number')
+        self.assertEqual({'Latitude': '2.906'}, dict(d))
+        self.assertEqual(1, len(d))
+
+        d['Orbit Number'] = '59595a'
+        self.assertEqual(ptf.PTFDict(d), d)
+
+    def test_copy(self):
+        d = ptf.PTFRecord({'Latitude': '2.906'})
+        c = copy.copy(d)
+        c['Longitude'] = '339.281'
+        self.assertEqual(1, c.generation)
+        self.assertEqual(0, d.generation)
+        self.assertEqual('339.281', c['longitude'])
+        self.assertRaises(KeyError, d.__getitem__, 'longitude')
+        self.assertEqual(c, pickle.loads(pickle.dumps(c)))
+
+        cow = ptf.COWRecord(c)
+        cow['Latitude'] = '3'
+        self.assertEqual('3', cow['latitude'])
+        self.assertEqual('339.281', cow['LONGITUDE'])
+        self.assertEqual('2.906', c['Latitude'])
+
+    def test_compact(self):
+        p = ptf.loads(ptf_str)
+        compact = ptf.loads(ptf_str, compact=True)
+        self.assertIsInstance(compact[0], ptf.PTFRecord)
+        self.assertEqual(p.ptf_recs, compact.ptf_recs)
+        self.assertEqual(p.dumps(), compact.dumps())
+        self.assertEqual(
+            p.ptf_recs,
+            ptf.unpack(ptf.pack(compact), compact=True).ptf_recs
+        )
+
+        rows = ['1,2', '1,2,3,4', '']
+        for fieldnames in (('a', 'b', 'c'), ('a', 'b', 'a')):
+            with self.subTest(fieldnames=fieldnames):
+                self.assertEqual(
+                    list(ptf.read_rows(rows, fieldnames)),
+                    list(ptf.read_rows(rows, fieldnames, compact=True))
+                )
+
+        self.assertIn('_values', ptf.PTFRecord.__slots__)
+        self.assertFalse(hasattr(compact[0], '__dict__'))
+
+
+class TestCOWRecord(unittest.TestCase):
+
+    def test_copy_on_write(self):
+        d = ptf.PTFDict({'Request Priority': '799', 'Latitude': '58.184'})
+        c = ptf.COWRecord(d)
+        self.assertEqual('799', c['request priority'])
+        c['Request Priority'] = -799
+        self.assertEqual(-799, c['REQUEST PRIORITY'])
+        self.assertEqual('799', d['Request Priority'])
+
+        c['Comment'] = 'new'
+        self.assertEqual(['Request Priority', 'Latitude', 'Comment'], list(c))
+        del c['Latitude']
+        self.assertRaises(KeyError, c.__getitem__, 'latitude')
+        self.assertEqual('58.184', d['Latitude'])
+        self.assertEqual({'Request Priority': -799, 'Comment': 'new'},
+                         dict(c))
+
+    def test_contains(self):
+        # Just like a PTFDict, in only finds keys in the same case.
+        d = ptf.PTFDict({'Request Priority': '799', 'Latitude': '58.184'})
+        c = ptf.COWRecord(d)
+        c['Comment'] = 'new'
+        del c['Latitude']
+        for key in ('Request Priority', 'request priority', 'Comment',
+                    'comment', 'Latitude'):
+            with self.subTest(key=key):
+                self.assertEqual(key in ptf.PTFDict(c), key in c)
+        self.assertIn('Request Priority', c)
+        self.assertNotIn('comment', c)
+
+    def test_generation(self):
+        q = ptf.loads(ptf_str)
+        p = ptf.PTF(q.dictionary, q.comments, q.fieldnames,
+                    [ptf.COWRecord(r) for r in q[3:6]])
+        cols = p.columns()
+        self.assertEqual(799, cols.priority[0])
+        q_cols = q.columns()
+        p[0]['Request Priority'] = '42'
+        self.assertEqual(1, p[0].generation)
+        self.assertEqual(0, p[0].record.generation)
+        self.assertIsNot(cols, p.columns())
+        self.assertEqual(42, p.columns().priority[0])
+
+        # The wrapped records haven't changed.
+        self.assertIs(q_cols, q.columns())
+
+        cols = p.columns()
+        del p[1]['Comment']
+        self.assertIsNot(cols, p.columns())
+
+
 class TestPTF(unittest.TestCase):
 
     def setUp(self):
@@ -128,6 +271,145 @@ Instrument set,Predict time,Latitude,Longitude,Elevation,Observation type,Orbit
 
         self.assertRaises(IndexError, ptf.PTF)
 
+    def test_slice(self):
+        p = ptf.PTF(ptf_str)
+        s = p[:3]
+        self.assertEqual(3, len(s))
+        self.assertEqual(31, len(p))
+        self.assertEqual(p['SPK'], s['SPK'])
+        self.assertEqual(p[2], s[2])
+        s[2]['Request Priority'] = '-2'
+        s['SPK'].append('another.bsp')
+        self.assertEqual('2', p[2]['Request Priority'])
+        self.assertEqual(2, len(p['SPK']))
+
+    def test_dump(self):
+        p = ptf.PTF(ptf_str)
+        s = p.dumps()
+        self.assertEqual(ptf.loads(s)[30], p[30])
+        self.assertTrue(s.endswith(
+            'C_59835216,395.000,48383781,IO,1.70,1,,1,10.9,8.546\r\n'
+        ))
+
+        # Fieldnames which only differ by case are translated.
+        lower = [f.lower() for f in ptf.fieldnames]
+        records = [{f.lower(): v for f, v in r.items()} for r in p]
+        q = ptf.PTF(p.dictionary, p.comments, lower, records)
+        self.assertEqual(s, q.dumps())
+
+        m = mock_open()
+        with patch('ptf.open', m):
+            p.dump('some.ptf')
+            q.dump_iter('other.ptf', iter(records))
+        written = ''.join(c.args[0] for c in m().write.call_args_list)
+        self.assertEqual(s * 2, written)
+
+        # A field set after loading under its canonical case is written
+        # in place of the file's own-case field.
+        p = ptf.loads(ptf_str.replace(
+            '# OS version:', '# {}\n# OS version:'.format(','.join(lower)), 1
+        ))
+        self.assertEqual(lower, p.fieldnames)
+        p[3]['Request Priority'] = '16503'
+        cow = ptf.COWRecord(p[5])
+        cow['Request Priority'] = '42'
+        q = ptf.PTF(p.dictionary, p.comments, p.fieldnames,
+                    [p[3], cow, p[6]])
+        written = ptf.loads(q.dumps())
+        self.assertEqual('16503', written[0]['Request Priority'])
+        self.assertEqual('42', written[1]['Request Priority'])
+        self.assertEqual('6', written[2]['Request Priority'])
+        self.assertEqual('59593a', written[0]['Orbit Number'])
+
+
+class TestColumnarPTF(unittest.TestCase):
+
+    def test_columns(self):
+        p = ptf.loads(ptf_str)
+        c = p.columns()
+        self.assertEqual(31, len(c))
+        self.assertIs(p[3], c[3])
+        self.assertEqual(59593, c.orbit[0])
+        self.assertEqual('d', c.orbit_suffix[4])
+        self.assertEqual(799, c.priority[3])
+        self.assertEqual(ptf.MISSING, c.priority[4])
+        self.assertAlmostEqual(58.184, c.latitude[3])
+        self.assertAlmostEqual(330.470, c.longitude[3])
+        self.assertAlmostEqual(4.114, c.roll[3])
+        self.assertAlmostEqual(422.185, c.volume[0])
+        self.assertTrue(math.isnan(c.roll[8]))
+
+    def test_set_priority(self):
+        p = ptf.loads(ptf_str)
+        c = ptf.columns(p)
+        self.assertEqual(9, c.priority[0])
+        c.set_priority(0, -9)
+        self.assertEqual(-9, c.priority[0])
+        self.assertEqual(-9, p[0]['Request Priority'])
+
+    def test_orbit_index(self):
+        records = [ptf.PTFDict({'Orbit Number': o, 'Request Priority': p})
+                   for o, p in (('12a', '5'), ('10d', '1'), ('12a', '7'),
+                                ('12a', '5'), ('10d', ''), ('10d', '3'))]
+        c = ptf.columns(records)
+        i = c.orbit_index
+        self.assertIs(i, ptf.orbit_index(c))
+        self.assertEqual([10, 12], list(i))
+        self.assertEqual([5, 1, 4], list(i[10]))
+        self.assertEqual([2, 0, 3], list(i[12]))
+
+        c.set_priority(3, 6)
+        self.assertEqual([2, 3, 0], list(i[12]))
+        c.set_priority(3, 5)
+        self.assertEqual([2, 0, 3], list(i[12]))
+
+    def test_cache(self):
+        p = ptf.loads(ptf_str)
+        c = p.columns()
+        self.assertIs(c, p.columns())
+        self.assertIs(c.orbit_index, p.orbit_index())
+
+        # Changes through set_priority() keep the columns current.
+        c.set_priority(3, 800)
+        self.assertIs(c, p.columns())
+
+        # Other changes to records, or the list of them, don't.
+        p[3]['Request Priority'] = '801'
+        d = p.columns()
+        self.assertIsNot(c, d)
+        self.assertEqual(801, d.priority[3])
+        p[1:3] = [p[2], p[1]]
+        self.assertIsNot(d, p.columns())
+        p.ptf_recs.append(p[0])
+        self.assertEqual(32, len(p.columns()))
+        self.assertIsNot(p.columns(), p[:].columns())
+
+        # Making a PTFDict, or changing records of another PTF, doesn't
+        # make the columns out of date.
+        c = p.columns()
+        ptf.PTFDict({'Orbit Number': '12a'})
+        q = ptf.loads(ptf_str, compact=True)
+        q[3]['Request Priority'] = '802'
+        q.columns().set_priority(4, 803)
+        p[:3][0]['Request Priority'] = '804'
+        self.assertIs(c, p.columns())
+
+    def test_copy(self):
+        p = ptf.loads(ptf_str)
+        c = p.columns()
+        index = c.orbit_index
+        d = c.copy()
+        self.assertEqual(list(c.priority), list(d.priority))
+        self.assertEqual(dict(index), dict(d.orbit_index))
+        self.assertNotIn('latitude', d._columns)
+
+        d.set_priority(3, -800)
+        self.assertEqual(-800, d.priority[3])
+        self.assertEqual('-800', str(d[3]['Request Priority']))
+        self.assertNotEqual(-800, c.priority[3])
+        self.assertNotEqual('-800', str(p[3]['Request Priority']))
+        self.assertNotEqual(dict(index), dict(d.orbit_index))
+
 
 class TestFunctions(unittest.TestCase):
 
@@ -152,29 +434,176 @@ H,2019-104T01:33:31.327,19.476,312.078,-4.305,4,59594a,59594a,30.00,321.0,,,N/A,
         loaded = ptf.loads(ptf_str)
         self.assertEqual(31, len(loaded))
 
-        m = mock_open(read_data=ptf_str)
-        with patch('ptf.open', m):
+        m = mock_open(read_data=ptf_str.encode())
+        with patch('ptf_cache.open', m):
             loaded = ptf.load('path/to/ptf')
             self.assertEqual(31, len(loaded))
 
+    def test_iterload(self):
+        m = mock_open(read_data=ptf_str.encode())
+        with patch('ptf.open', m):
+            reader = ptf.iterload('path/to/ptf')
+            self.assertEqual('IPTF', reader.dictionary['FILE_TYPE'])
+            self.assertEqual(ptf.fieldnames, reader.fieldnames)
+            records = list(reader)
+            self.assertEqual(31, len(records))
+            self.assertEqual('59593a', records[0]['orbit number'])
+            self.assertEqual(ptf.loads(ptf_str).ptf_recs, records)
+
+        self.assertRaises(ValueError, ptf.PTFReader,
+                          ptf_str.splitlines()[:4])
+
+        # A line break in a quoted field, and lines that end with a bare
+        # carriage return, are read by iterload() just as by load().
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'breaks.ptf')
+        p = ptf.loads(ptf_str)
+        p[3]['Comment'] = 'two\nlines, "quoted"'
+        p[4]['Comment'] = 'carriage\rreturn'
+        with open(path, 'w', newline='') as f:
+            f.write(p.dumps().replace('\n', '\r', 5))
+        loaded = ptf.load(path)
+        self.assertEqual(31, len(loaded))
+        self.assertEqual('two\nlines, "quoted"', loaded[3]['Comment'])
+        self.assertEqual('carriage\rreturn', loaded[4]['Comment'])
+        with ptf.iterload(path) as reader:
+            self.assertEqual(list(loaded), list(reader))
+
+    def test_open_indexed(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'i.ptf')
+        p = ptf.loads(ptf_str)
+        p[3]['Comment'] = 'two\nlines, "quoted"'
+        p.dump(path)
+        with ptf.iterload(path) as reader:
+            expected = list(reader)
+
+        with ptf.open_indexed(path, sidecar=True) as ix:
+            self.assertEqual('IPTF', ix.dictionary['FILE_TYPE'])
+            self.assertEqual(31, len(ix))
+            self.assertEqual(expected, list(ix))
+            self.assertEqual('two\nlines, "quoted"', ix[3]['Comment'])
+            self.assertEqual(expected[-2:], ix[-2:])
+            self.assertEqual([1], ix.rows('team database id', '48383682'))
+            self.assertEqual(
+                [expected[4]],
+                ix.find('Team Database ID', 'MRO_MSL_2019_104_01')
+            )
+            self.assertEqual(
+                [r for r in expected if r['Orbit Number'] == '59601a'],
+                ix.find('Orbit Number', '59601a')
+            )
+            self.assertEqual(
+                [i for i, r in enumerate(expected)
+                 if r['Request Priority'] == ''],
+                ix.rows('Request Priority', '')
+            )
+            self.assertEqual([], ix.rows('Nope', ''))
+            self.assertEqual(
+                sorted({r['Orbit Number'] for r in expected}),
+                sorted(ix.values('orbit number'))
+            )
+            self.assertEqual([], ix.values('Nope'))
+        self.assertTrue(os.path.exists(path + '.idx'))
+
+        # The second time, the sidecar is used.
+        with patch.object(ptf.IndexedPTF, '_scan', side_effect=AssertionError):
+            with ptf.open_indexed(path, sidecar=True) as ix:
+                self.assertEqual(expected, list(ix))
+                self.assertEqual([9], ix.rows('Team Database ID', '59835353'))
+                self.assertEqual(
+                    sorted({r['Orbit Number'] for r in expected}),
+                    sorted(ix.values('Orbit Number'))
+                )
+
+        # Unless the PTF has changed.
+        p.ptf_recs = p.ptf_recs[:5]
+        p.dump(path)
+        with ptf.open_indexed(path, sidecar=True) as ix:
+            self.assertEqual(5, len(ix))
+            self.assertEqual([], ix.rows('Team Database ID', '59835353'))
+
+        with open(path, 'w') as f:
+            f.write('\n'.join(ptf_str.splitlines()[12:]))
+        self.assertRaises(ValueError, ptf.open_indexed, path)
+
+    def test_read_rows(self):
+        fields = ('Comment', 'Request Priority', 'comment')
+        text = (
+            'plain,800,x\r\n'
+            '"Gullies, north wall",801,y\n'
+            '\n'
+            '"He said ""look""",802,\n'
+            '"two\nlines",803,z\n'
+            'short\n'
+            'a,b,c,d,e\n'
+            'not"quoted,804,w'
+        )
+        for lines in (text.splitlines(), io.StringIO(text, newline='')):
+            with self.subTest(lines=type(lines)):
+                lines = list(lines)
+                expected = list(csv.DictReader(lines, fieldnames=fields))
+                records = list(ptf.read_rows(lines, fields))
+                self.assertEqual([dict(r) for r in expected],
+                                 [r.data for r in records])
+                self.assertEqual('Gullies, north wall', records[1]['COMMENT'])
+                self.assertEqual('He said "look"', records[2]['COMMENT'])
+
+        # Round trip, with the quotes that writing them needs.
+        p = ptf.loads(ptf_str)
+        p[0]['Comment'] = 'Gullies, "north" wall'
+        p[1]['Comment'] = '"Quoted"'
+        again = ptf.loads(p.dumps())
+        self.assertEqual('Gullies, "north" wall', again[0]['Comment'])
+        self.assertEqual('"Quoted"', again[1]['Comment'])
+        self.assertEqual(again.ptf_recs, ptf.loads(again.dumps()).ptf_recs)
+
     def test_guess_encoding(self):
-        m = mock_open(read_data='Regular text')
+        m = mock_open(read_data=b'Regular text')
         with patch('ptf.open', m):
             self.assertIsNone(ptf.guess_encoding('path/to/some/file'))
 
-        # I can't satisfactorily test this.  I *think* that the argument
-        # provided to read_data is converted into a string, via str(), so
-        # that the mocked open function is actually always returning a UTF
-        # string, which means that I can't test for the exception this way.
-        # The only way may be testing via an actual 'real' file.
-        #
-        # mo = mock_open(read_data='Latin-1 text'.encode(encoding='latin_1'))
-        # with patch('ptf.open', mo):
-        #     self.assertEqual('latin_1', ptf.guess_encoding('path/to/some/file'))
-
-    # def test_dump(self):
-    #     p = ptf.loads(ptf_str)
-    #     # print(p.dumps())
+        mo = mock_open(
+            read_data='Regular text\nLatin-1 text: caf\xe9'.encode('latin_1')
+        )
+        with patch('ptf.open', mo):
+            self.assertEqual('latin_1', ptf.guess_encoding('path/to/some/file'))
+
+    def test_read_text(self):
+        mo = mock_open(
+            read_data='Regular text\r\nLatin-1 text: caf\xe9'.encode('latin_1')
+        )
+        with patch('ptf.open', mo):
+            self.assertEqual('Regular text\r\nLatin-1 text: caf\xe9',
+                             ptf.read_text('path/to/some/file'))
+        self.assertEqual(['Regular text\n', 'caf\xe9'],
+                         list(ptf.decode_lines([b'Regular text\n',
+                                                'caf\xe9'.encode('latin_1')],
+                                               'latin_1')))
+
+    def test_decode_lines(self):
+        # A file that is only partly in UTF-8 (the usual platform
+        # encoding) is decoded as latin_1 from the start, by both load()
+        # and iterload().
+        p = ptf.loads(ptf_str)
+        p[1]['Comment'] = 'UTF-8 caf\xe9'
+        p[20]['Comment'] = 'Latin-1 cafX'
+        data = p.dumps().encode('utf-8').replace(
+            b'cafX', 'caf\xe9'.encode('latin_1')
+        )
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'mixed.ptf')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        self.assertEqual('latin_1', ptf.guess_encoding(path))
+        loaded = ptf.load(path)
+        self.assertEqual('Latin-1 caf\xe9', loaded[20]['Comment'])
+        with ptf.iterload(path) as reader:
+            self.assertEqual(list(loaded), list(reader))
 
     def test_key_translation(self):
         new = ('These', 'Are', 'Some Keys')
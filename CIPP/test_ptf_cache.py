@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""This module has tests for the ptf_cache functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import priority_rewrite as pr
+import ptf
+import ptf_cache
+from bench import synthetic
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+        env = patch.dict(os.environ, {"CIPP_CACHE": self.cache_dir})
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.parsed = list()
+
+    def parse(self, data):
+        self.parsed.append(data)
+        return data.decode().upper()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_directory(self):
+        self.assertEqual(self.cache_dir, ptf_cache.directory())
+        with patch.dict(os.environ, {"CIPP_CACHE": "0"}):
+            self.assertIsNone(ptf_cache.directory())
+        with patch.dict(
+            os.environ, {"CIPP_CACHE": "1", "XDG_CACHE_HOME": "/x"}
+        ):
+            self.assertEqual("/x/cipp", ptf_cache.directory())
+
+    def test_cached(self):
+        path = self.write("a.txt", "abc")
+        self.assertEqual("ABC", ptf_cache.cached(path, "t", self.parse))
+        self.assertEqual("ABC", ptf_cache.cached(path, "t", self.parse))
+        self.assertEqual(1, len(self.parsed))
+
+        # Another file with the same contents doesn't need parsing.
+        other = self.write("b.txt", "abc")
+        self.assertEqual("ABC", ptf_cache.cached(other, "t", self.parse))
+        self.assertEqual(1, len(self.parsed))
+
+        # But a different kind of result does.
+        ptf_cache.cached(path, "u", self.parse)
+        self.assertEqual(2, len(self.parsed))
+
+        # A changed file is parsed again.
+        self.write("a.txt", "abcd")
+        self.assertEqual("ABCD", ptf_cache.cached(path, "t", self.parse))
+        self.assertEqual(3, len(self.parsed))
+
+        # As is everything, when the cache is off.
+        with patch.dict(os.environ, {"CIPP_CACHE": ""}):
+            self.assertEqual("ABCD", ptf_cache.cached(path, "t", self.parse))
+        self.assertEqual(4, len(self.parsed))
+
+        ptf_cache.clear(self.cache_dir)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_evict(self):
+        paths = [self.write(f"{x}.txt", x * 100) for x in "abcd"]
+        for path in paths[:3]:
+            ptf_cache.cached(path, "t", self.parse)
+            # Make sure that they don't all have the same time.
+            for key, _, used in ptf_cache._entries(self.cache_dir):
+                os.utime(
+                    os.path.join(self.cache_dir, key + ptf_cache._suffix),
+                    (used - 10, used - 10)
+                )
+        ptf_cache.cached(paths[0], "t", self.parse)
+        self.assertEqual(3, len(self.parsed))
+
+        # Each entry is a little over 100 bytes, so adding d means that
+        # the least recently used, b, is removed.
+        with patch.dict(os.environ, {"CIPP_CACHE_SIZE": "0.00035"}):
+            ptf_cache.cached(paths[3], "t", self.parse)
+        self.assertEqual(3, len(ptf_cache._entries(self.cache_dir)))
+        for path in paths[:3]:
+            ptf_cache.cached(path, "t", self.parse)
+        self.assertEqual([b"a" * 100, b"b" * 100, b"c" * 100, b"d" * 100,
+                          b"b" * 100], self.parsed)
+
+    def test_load(self):
+        path = os.path.join(self.tmpdir, "s.ptf")
+        synthetic.make_ptf(50, seed=3).dump(path)
+        first = ptf.load(path)
+        second = ptf.load(path)
+        self.assertEqual(1, len(ptf_cache._entries(self.cache_dir)))
+        self.assertEqual(first.dictionary, second.dictionary)
+        self.assertEqual(first.comments, second.comments)
+        self.assertEqual(first.fieldnames, second.fieldnames)
+        self.assertEqual(first.ptf_recs, second.ptf_recs)
+        self.assertEqual(first.dumps(), second.dumps())
+        self.assertEqual(
+            first[0]["Request Priority"], second[0]["request priority"]
+        )
+
+        # Changing a record doesn't change the others.
+        second[0]["Request Priority"] = "-1"
+        second[0]["New"] = "x"
+        self.assertEqual("x", second[0]["new"])
+        self.assertNotIn("new", second[1])
+        self.assertEqual(first.ptf_recs, ptf.load(path).ptf_recs)
+
+    def test_get_input(self):
+        path = os.path.join(self.tmpdir, "s.csv")
+        p = synthetic.make_ptf(20, seed=3)
+        with open(path, "w", newline="") as f:
+            pr.dict_write(f, p.fieldnames, p.ptf_recs)
+        for i in range(2):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                records = pr.get_input(path)
+            self.assertIn("FILE_TYPE", out.getvalue())
+            self.assertEqual(20, len(records))
+            self.assertEqual(
+                p[5]["Team Database ID"], records[5]["team database id"]
+            )
+        self.assertEqual(1, len(ptf_cache._entries(self.cache_dir)))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""This module has tests for the ptfdiff functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import unittest
+
+import ptf
+import ptfdiff
+from bench import synthetic
+
+
+class TestFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.records = synthetic.make_records(20, seed=3)
+
+    def test_join_key(self):
+        r = ptf.PTFDict(self.records[0])
+        self.assertEqual(("100000",), ptfdiff.join_key(r))
+        r["Team Database ID"] = " "
+        self.assertEqual(
+            (r["Orbit Number"], r["Predict Time"]), ptfdiff.join_key(r)
+        )
+
+    def test_diff(self):
+        old = self.records[:15]
+        new = [ptf.PTFDict(r) for r in self.records[2:]]
+        new[0]["Request Priority"] = "1"
+        new[1]["Comment"] = "Only the comment changed."
+        new.append(ptf.PTFDict(self.records[19]))
+
+        changes = list(ptfdiff.diff(old, new))
+        kinds = collections.Counter(c.kind for c in changes)
+        self.assertEqual(
+            {"added": 6, "removed": 2, "changed": 1}, dict(kinds)
+        )
+        self.assertEqual(
+            ["changed", "added", "added", "added", "added", "added",
+             "added", "removed", "removed"],
+            [c.kind for c in changes]
+        )
+        self.assertEqual(("100002",), changes[0].key)
+        self.assertEqual("1", changes[0].new["Request Priority"])
+        self.assertEqual(
+            self.records[2]["Request Priority"],
+            changes[0].old["Request Priority"]
+        )
+        self.assertEqual(
+            [("100000",), ("100001",)], [c.key for c in changes[-2:]]
+        )
+        self.assertIsNone(changes[-1].new)
+
+        self.assertEqual(
+            ["changed", "changed"],
+            [c.kind for c in ptfdiff.diff(
+                old, new, ("Request Priority", "Comment")
+            )][:2]
+        )
+        self.assertEqual([], list(ptfdiff.diff(old, old)))
+
+    def test_format(self):
+        old = ptf.PTFDict(self.records[0])
+        new = ptf.PTFDict(old)
+        new["Request Priority"] = "1"
+        change = next(ptfdiff.diff([old], [new]))
+        self.assertEqual(
+            "~ 100000 ({}, H) Request Priority {} -> 1".format(
+                old["Orbit Number"], old["Request Priority"]
+            ),
+            ptfdiff.format_change(change)
+        )
+        row = ptfdiff.csv_row("a.ptf", "b.ptf", change)
+        self.assertEqual(len(ptfdiff.csv_fields()), len(row))
+        self.assertEqual(
+            ["a.ptf", "b.ptf", "changed", "100000"], row[:4]
+        )
+        self.assertEqual([old["Request Priority"], "1"], row[-2:])
+
+        removed = next(ptfdiff.diff([old], []))
+        self.assertTrue(
+            ptfdiff.format_change(removed).startswith("- 100000 (")
+        )
+        self.assertEqual(
+            "Added: 0, removed: 1, changed: 2",
+            ptfdiff.format_summary(
+                collections.Counter(removed=1, changed=2)
+            )
+        )
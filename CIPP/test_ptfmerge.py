@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""This module has tests for the ptfmerge functions."""
+
+# Copyright 2026, Ross A. Beyer (rbeyer@seti.org)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import tempfile
+import unittest
+
+import ptf
+import ptfmerge
+from bench import synthetic
+
+
+def by_time(records):
+    return sorted(records, key=lambda x: x["Predict Time"])
+
+
+class TestFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.records = by_time(synthetic.make_records(40, seed=5))
+
+    def test_merge(self):
+        first = self.records[:30]
+        changed = [ptf.PTFDict(r) for r in self.records[10:20]]
+        for r in changed:
+            r["Request Priority"] = "1"
+        last = by_time(changed + self.records[30:])
+        sources = (first, last)
+
+        merged = list(ptfmerge.merge(
+            sources, ptfmerge.last_sources(sources)
+        ))
+        self.assertEqual(
+            [r["Team Database ID"] for r in self.records],
+            [r["Team Database ID"] for r in merged]
+        )
+        self.assertEqual(
+            ["1"] * 10, [r["Request Priority"] for r in merged[10:20]]
+        )
+        self.assertEqual(self.records[:10], merged[:10])
+
+        self.assertEqual(50, len(list(ptfmerge.merge(sources))))
+
+    def test_unsorted(self):
+        first = self.records[:20]
+        last = self.records[20:]
+        last[3], last[4] = last[4], last[3]
+        sources = (first, last)
+
+        with self.assertRaisesRegex(ValueError, "Record 5 of last.ptf"):
+            list(ptfmerge.merge(sources, names=("first.ptf", "last.ptf")))
+        with self.assertRaisesRegex(ValueError, "source 1"):
+            list(ptfmerge.merge(
+                sources, ptfmerge.last_sources(sources)
+            ))
+
+        index, ordered = ptfmerge.index_sources(sources)
+        self.assertEqual([True, False], ordered)
+        self.assertEqual(first + last,
+                         list(ptfmerge.concat(sources, index)))
+
+        # A changed record is given where it is in the later source.
+        changed = [ptf.PTFDict(r) for r in reversed(self.records[5:8])]
+        for r in changed:
+            r["Request Priority"] = "1"
+        sources = (self.records[:10], changed)
+        index, ordered = ptfmerge.index_sources(sources)
+        self.assertEqual([True, False], ordered)
+        self.assertEqual(
+            self.records[:5] + self.records[8:10] + changed,
+            list(ptfmerge.concat(sources, index))
+        )
+        self.assertEqual(13, len(list(ptfmerge.concat(sources))))
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = list()
+            for i, records in enumerate(
+                (self.records[:25], self.records[15:])
+            ):
+                p = synthetic.make_ptf(0)
+                p = ptf.PTF(p.dictionary, p.comments, p.fieldnames, records)
+                paths.append(os.path.join(tmpdir, f"{i}.ptf"))
+                p.dump(paths[-1])
+
+            sources = [ptf.iterload(path) for path in paths]
+            last = ptfmerge.last_sources(
+                ptf.iterload(path) for path in paths
+            )
+            out = io.StringIO()
+            sources[0].dictionary["USERNAME"] = "merged"
+            header = ptf.PTF(
+                sources[0].dictionary, sources[0].comments,
+                sources[0].fieldnames, list()
+            )
+            header.dump_iter(out, ptfmerge.merge(sources, last))
+
+        merged = ptf.loads(out.getvalue())
+        self.assertEqual("merged", merged["USERNAME"])
+        self.assertEqual(
+            [dict(r) for r in self.records], [dict(r) for r in merged]
+        )
+
+        out = io.StringIO()
+        ptfmerge.write_csv(out, self.records[:3])
+        lines = out.getvalue().splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[0].startswith("Instrument Set,Predict Time"))
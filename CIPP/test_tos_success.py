@@ -14,10 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
 
 import tos_success as ts
+from bench import synthetic
 
 iof = '''C,2019-103T23:36:13.343,2.906,339.281,-3.559,1,59593a,59593a,180.00,13.0,,,0,X,,0.0,,,Type=MSV,COORD Target - Aram Chaos,9,C_59835359 X_48383682,422.185 0.000,59835359,IO,1.00,5/5,T-S,5Hz,10.6,2.139
 XC,2019-103T23:36:13.343,2.906,339.281,-3.559,1,59593a,59593a,88.40,10.0,,,d:/ctx/ctx_itl45.nifl,X,1,1.88,,0,,Aram Chaos,9,C X C_59835359,1817.000,48383682,IO,1.70,1,,2,10.6,2.139
@@ -39,14 +42,15 @@ def my_mock_open(read_data):
     # my_mock_open() can be replaced with mock_open().
     m = mock_open(read_data=read_data)
     m.return_value.__iter__ = lambda self: self
-    m.return_value.__next__ = lambda self: next(iter(self.readline, ''))
+    m.return_value.__next__ = lambda self: next(iter(self.readline,
+                                                     read_data[:0]))
     return m
 
 
 class TestFunctions(unittest.TestCase):
 
     def test_get_wths(self):
-        m = my_mock_open(read_data='''1234, This, has, commas
+        m = my_mock_open(read_data=b'''1234, This, has, commas
 567,
 890''')
         with patch('tos_success.open', m):
@@ -65,9 +69,38 @@ class TestFunctions(unittest.TestCase):
         self.assertIsNone(ts.find_suggestion(w, '777', 'H'))
 
     def test_get_suggestions(self):
-        m = my_mock_open(read_data=iof)
+        m = my_mock_open(read_data=iof.encode())
         with patch('tos_success.open', m):
             with patch('ptf.open', m):
                 self.assertEqual(['163582'],
                                  ts.get_suggestions('dummy/path',
                                                     ['163582', '890', '5']))
+
+    def test_get_suggestions_indexed(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 's.ptf')
+        p = synthetic.make_ptf(100, seed=4)
+        p[7]['Instrument Set'] = 'C'
+        # Suggestions are found by the start of the Comment, not by the
+        # Team Database ID, with or without the index.
+        p[3]['Comment'] = '5 is not this Team Database ID'
+        p[14]['Comment'] = 'Not a suggestion'
+        p.dump(path)
+        ids = [r['Team Database ID'] for r in p[::7]] + ['5']
+        expected = ts.get_suggestions(path, ids)
+        self.assertEqual(14, len(expected))
+        self.assertEqual('5', expected[1])
+        self.assertNotIn(p[14]['Team Database ID'], expected)
+        for _ in range(2):
+            self.assertEqual(expected, ts.get_suggestions(path, ids, True))
+        self.assertTrue(os.path.exists(path + '.idx'))
+
+    def test_success_rate(self):
+        w = {'1234': '1234, This, has, commas',
+             '567': '567,',
+             '890': '890'}
+        self.assertEqual('a.ptf: found 1 of 3 (33.3%)',
+                         ts.success_rate('a.ptf', {'567'}, w))
+        self.assertEqual('none: found 0 of 0 (0.0%)',
+                         ts.success_rate('none', set(), {}))
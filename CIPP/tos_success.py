@@ -23,10 +23,15 @@ it compares the IDs with the records in the input IOF PTF."""
 # HiKERs or whatever, and copy them into a text file.
 
 import argparse
+import collections.abc
+import contextlib
 import csv
+import io
+import itertools
 import os
 import sys
 
+import profiling
 import ptf
 
 
@@ -43,41 +48,73 @@ The PTF can be a HiRISE PTF, IPTF, or CSV file.''')
                         help="Only print limited information.")
     parser.add_argument("-s", "--sorted", action="store_true",
                         help="Output sorted by suggestion number.")
+    parser.add_argument("--index", action="store_true",
+                        help="Rather than reading all of each PTF, look "
+                             "the suggestions up (by the start of the "
+                             "Comment, as always) in an index of it, which "
+                             "is kept in a file next to it, with .idx added "
+                             "to its name, so that the next look up is "
+                             "quick.")
     parser.add_argument('-w', '--wth', required=True,
                         help='File with text copied from WTH list.')
-    parser.add_argument('ptf',
-                        help='A CSV, IPTF, or PTF file with PTF records in it.')
+    parser.add_argument('ptf', nargs='+',
+                        help='A CSV, IPTF, or PTF file with PTF records in it. '
+                             'If more than one is given, the success rate '
+                             'for each and for all of them together is also '
+                             'reported.')
+    profiling.add_arguments(parser)
 
     args = parser.parse_args()
+    profiling.start(args)
 
     wth = get_wths(args.wth, args.limited)
 
-    found_suggs = get_suggestions(args.ptf, wth.keys())
+    found_by_file = list()
+    for path in args.ptf:
+        found_by_file.append((path, get_suggestions(path, wth, args.index)))
+
+    if len(found_by_file) == 1:
+        found_suggs = found_by_file[0][1]
+    else:
+        # The suggestions found in any of the PTFs, in order of discovery.
+        found_suggs = list(dict.fromkeys(
+            s for (_, found) in found_by_file for s in found
+        ))
 
     if args.sorted:
         found_suggs.sort()
 
     if args.inverse:
-        not_found = 0
+        not_found = wth.keys() - set(found_suggs)
         for w in wth.keys():
-            if w not in found_suggs:
+            if w in not_found:
                 print('Did not find {}'.format(wth[w]))
-                not_found += 1
 
-        if not_found == 0:
+        if len(not_found) == 0:
             print('All of the suggestions were found in the PTF.')
         else:
-            print(f'Did not find {not_found} of {len(wth)}')
+            print(f'Did not find {len(not_found)} of {len(wth)}')
     else:
         for w in found_suggs:
             print(wth[w])
         print(f'Found: {len(found_suggs)} of {len(wth)}')
 
+    if len(found_by_file) > 1:
+        for path, found in found_by_file:
+            print(success_rate(path, set(found), wth))
+        print(success_rate(f'All {len(found_by_file)} PTFs',
+                           set(found_suggs), wth))
+
+
+def success_rate(label: str, found: set, wth: dict) -> str:
+    rate = 100 * len(found) / len(wth) if wth else 0
+    return f'{label}: found {len(found)} of {len(wth)} ({rate:.1f}%)'
+
 
+@profiling.timed('read WTH')
 def get_wths(path: os.PathLike, limited=False) -> dict:
     d = {}
-    with open(path, newline='',
-              encoding=ptf.guess_encoding(path)) as f:
+    with io.StringIO(ptf.read_text(path), newline='') as f:
         reader = csv.reader(f)
         for row in reader:
             if row:
@@ -95,36 +132,72 @@ def get_wths(path: os.PathLike, limited=False) -> dict:
     return d
 
 
-def get_suggestions(ptfpath: os.PathLike, wth_suggs: list) -> list:
+@profiling.timed('suggestions')
+def get_suggestions(ptfpath: os.PathLike, wth_suggs, indexed=False) -> list:
+    """Returns a list of the suggestions from *wth_suggs* (any collection
+    of suggestion IDs) which are found in the PTF at *ptfpath*.
+
+    If *indexed* is true, only the records whose Comment begins with one
+    of the suggestions are read, by way of an index of the PTF (see
+    ptf.open_indexed()), which is kept in a sidecar file.  Either way,
+    the suggestions are matched by find_suggestion().
+    """
+    if not isinstance(wth_suggs, (collections.abc.Set, collections.abc.Mapping)):
+        wth_suggs = set(wth_suggs)
+
     found = list()
     try:
-        p = ptf.load(ptfpath)
-        for record in p:
-            s = find_suggestion(wth_suggs, record['Comment'],
-                                record['Instrument Set'])
-            if s is not None:
-                found.append(s)
-
+        if indexed:
+            reader = _indexed_records(ptfpath, wth_suggs)
+        else:
+            reader = ptf.iterload(ptfpath)
     except ValueError:
         # Wasn't a *real* PTF, probably missing a header,
         # so let's just try and parse it:
-        with open(ptfpath, newline='',
-                  encoding=ptf.guess_encoding(ptfpath)) as ptfile:
-            ptfreader = csv.reader(ptfile)
+        encoding = ptf.guess_encoding(ptfpath)
+        with open(ptfpath, 'rb') as ptfile:
+            ptfreader = csv.reader(ptf.decode_lines(ptfile, encoding))
             for row in ptfreader:
                 if len(row) > 19:
                     s = find_suggestion(wth_suggs, row[19], row[0])
                     if s is not None:
                         found.append(s)
+    else:
+        with reader as records:
+            for record in records:
+                s = find_suggestion(wth_suggs, record['Comment'],
+                                    record['Instrument Set'])
+                if s is not None:
+                    found.append(s)
     return found
 
 
-def find_suggestion(wths: list, ptf_comment: str, inst_set: str):
+def _indexed_records(ptfpath: os.PathLike, ids):
+    # Returns a context manager which gives a list of the records of the
+    # PTF at *ptfpath* whose Comment begins with one of the *ids*, in
+    # order, to be used in place of a PTFReader.  Those are the only
+    # records that find_suggestion() could find one of the *ids* in.
+    def suggested(comment):
+        tokens = comment.split() if comment else None
+        return bool(tokens) and tokens[0] in ids
+
+    with ptf.open_indexed(ptfpath, fields=ptf.index_fields + ("Comment",),
+                          sidecar=True) as p:
+        rows = sorted(itertools.chain.from_iterable(
+            p.rows("Comment", c) for c in p.values("Comment") if suggested(c)
+        ))
+        return contextlib.nullcontext([p[i] for i in rows])
+
+
+def find_suggestion(wths, ptf_comment: str, inst_set: str):
+    """Returns the suggestion ID that the *ptf_comment* begins with, if it
+    is in *wths* (a set or dict of suggestion IDs), and *inst_set* is a
+    HiRISE observation.  Otherwise None.
+    """
     if('H' in inst_set):
         comment_tokens = ptf_comment.split()
-        for suggestion in wths:
-            if suggestion == comment_tokens[0]:
-                return suggestion
+        if comment_tokens and comment_tokens[0] in wths:
+            return comment_tokens[0]
     return None
 
 